@@ -0,0 +1,372 @@
+"""Пакетная обработка выгрузок чатов без бота.
+
+Разбирает JSON-выгрузки из каталогов, отдельных файлов или масок
+в пуле процессов и пишет участников каждого файла в отдельную
+таблицу либо (--merge) одну общую таблицу по всем файлам:
+
+    uv run -m entrypoints.cli exports/ --output out/
+    uv run -m entrypoints.cli 'exports/**/result.json' --merge -o all.xlsx
+"""
+
+import argparse
+from collections import deque
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import glob
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import time
+
+from models.participants import Participant, ParticipantList
+from services.export import export_participants_csv, participant_rows
+from services.merge import ParticipantsMerger
+from services.parser import (
+    is_deleted_account,
+    JsonTelegramParser,
+    ParticipantsExporter,
+)
+from services.shards import ExportFormat, write_export
+
+# Обычный CSV вдобавок к форматам выгрузки бота
+CSV_FORMAT = 'csv'
+OUTPUT_FORMATS = (
+    ExportFormat.XLSX.value,
+    CSV_FORMAT,
+    ExportFormat.CSV_GZ.value,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class FileStats:
+    path: Path
+    size: int
+    messages: int
+    participants: int
+    elapsed: float
+    error: str | None = None
+
+
+@dataclass(slots=True)
+class BatchStats:
+    files: int = 0
+    failed: int = 0
+    size: int = 0
+    messages: int = 0
+    participants: int = 0
+    # Уникальных участников после слияния, только для --merge
+    merged: int | None = None
+    elapsed: float = 0.0
+
+    def add(self, stats: FileStats) -> None:
+        self.files += 1
+        if stats.error is not None:
+            self.failed += 1
+            return
+        self.size += stats.size
+        self.messages += stats.messages
+        self.participants += stats.participants
+
+    def rate(self, value: float) -> float:
+        return value / self.elapsed if self.elapsed else 0.0
+
+
+def find_exports(inputs: Iterable[str]) -> list[Path]:
+    paths: dict[Path, None] = {}
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            found = sorted(path.rglob('*.json'))
+        elif path.is_file():
+            found = [path]
+        else:
+            found = sorted(Path(p) for p in glob.glob(item, recursive=True))
+        # Пересекающиеся маски не дают повторной обработки файла
+        paths.update(dict.fromkeys(p.resolve() for p in found if p.is_file()))
+    return list(paths)
+
+
+# Telegram называет любую выгрузку result.json, поэтому имя таблицы
+# строится из пути относительно общего каталога входных файлов
+def output_name(path: Path, root: Path, output_format: str) -> str:
+    parts = path.relative_to(root).with_suffix('').parts
+    return f'{"_".join(parts)}.{output_format}'
+
+
+def write_table(
+    participants: Iterable[Participant],
+    path: Path,
+    *,
+    output_format: str,
+    exported_at: datetime,
+) -> None:
+    if output_format == CSV_FORMAT:
+        export_participants_csv(participants, path, exported_at=exported_at)
+        return
+    write_export(
+        participant_rows(participants),
+        path,
+        export_format=ExportFormat(output_format),
+        exported_at=exported_at,
+    )
+
+
+def _process_file(
+    path: Path,
+    output_path: Path | None,
+    output_format: str,
+    exported_at: datetime,
+) -> tuple[FileStats, ParticipantList]:
+    started_at = time.perf_counter()
+    try:
+        messages = JsonTelegramParser().parse_path(path)
+        report = ParticipantsExporter().export(messages)
+        participants = [
+            p
+            for p in report.participants
+            if not is_deleted_account(p.full_name)
+        ]
+        if output_path is not None:
+            write_table(
+                participants,
+                output_path,
+                output_format=output_format,
+                exported_at=exported_at,
+            )
+    except Exception as e:
+        return (
+            FileStats(
+                path=path,
+                size=0,
+                messages=0,
+                participants=0,
+                elapsed=time.perf_counter() - started_at,
+                error=f'{type(e).__name__}: {e}',
+            ),
+            [],
+        )
+
+    stats = FileStats(
+        path=path,
+        size=path.stat().st_size,
+        messages=len(messages),
+        participants=len(participants),
+        elapsed=time.perf_counter() - started_at,
+    )
+    # Для раздельной выгрузки участники уже записаны, гонять их между
+    # процессами незачем
+    return stats, participants if output_path is None else []
+
+
+def _iter_results(  # noqa: PLR0913
+    pool: ProcessPoolExecutor,
+    paths: Sequence[Path],
+    *,
+    output_dir: Path | None,
+    output_format: str,
+    exported_at: datetime,
+    window: int,
+) -> Iterator[tuple[FileStats, ParticipantList]]:
+    root = Path(os.path.commonpath([p.parent for p in paths]))
+    pending: deque[Future[tuple[FileStats, ParticipantList]]] = deque()
+    # Результаты идут в порядке файлов, и впереди разбирается не больше
+    # window файлов: порядок слияния не зависит от скорости процессов,
+    # готовые участники не копятся в памяти
+    for path in paths:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(
+            pool.submit(
+                _process_file,
+                path,
+                (
+                    output_dir / output_name(path, root, output_format)
+                    if output_dir is not None
+                    else None
+                ),
+                output_format,
+                exported_at,
+            )
+        )
+    while pending:
+        yield pending.popleft().result()
+
+
+def run_batch(  # noqa: PLR0913
+    paths: Sequence[Path],
+    *,
+    output: Path,
+    merge: bool,
+    output_format: str,
+    workers: int,
+    memory_budget: int | None = None,
+) -> BatchStats:
+    exported_at = datetime.now(timezone.utc)
+    batch = BatchStats()
+    (output.parent if merge else output).mkdir(parents=True, exist_ok=True)
+
+    started_at = time.perf_counter()
+    with (
+        ParticipantsMerger(memory_budget=memory_budget) as merger,
+        ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('forkserver'),
+        ) as pool,
+    ):
+        for stats, participants in _iter_results(
+            pool,
+            paths,
+            output_dir=None if merge else output,
+            output_format=output_format,
+            exported_at=exported_at,
+            window=2 * workers,
+        ):
+            batch.add(stats)
+            _write_line(_format_file_stats(stats))
+            if merge and stats.error is None:
+                # Отчета по пересечениям в CLI нет: все файлы - один
+                # источник, и маска источников не растет от числа файлов
+                merger.add(
+                    participants,
+                    source=0 if merger.sources else None,
+                )
+
+        if merge:
+            batch.merged = 0
+
+            def count_merged() -> Iterator[Participant]:
+                for participant in merger:
+                    batch.merged = (batch.merged or 0) + 1
+                    yield participant
+
+            write_table(
+                count_merged(),
+                output,
+                output_format=output_format,
+                exported_at=exported_at,
+            )
+    batch.elapsed = time.perf_counter() - started_at
+    return batch
+
+
+def _write_line(line: str) -> None:
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+
+def _format_file_stats(stats: FileStats) -> str:
+    if stats.error is not None:
+        return f'FAILED {stats.path}: {stats.error}'
+    return (
+        f'{stats.path}: {stats.messages} messages, '
+        f'{stats.participants} participants, '
+        f'{stats.size / 1024 / 1024:.1f} MB in {stats.elapsed:.2f} s'
+    )
+
+
+def format_batch_stats(batch: BatchStats) -> str:
+    size_mb = batch.size / 1024 / 1024
+    return (
+        f'files: {batch.files} ({batch.failed} failed) '
+        f'in {batch.elapsed:.2f} s, '
+        f'{batch.rate(batch.files):.2f} files/s, '
+        f'{batch.rate(size_mb):.1f} MB/s, '
+        f'{batch.rate(batch.messages):.0f} messages/s, '
+        f'participants: {batch.participants}'
+        + (f', merged: {batch.merged}' if batch.merged is not None else '')
+    )
+
+
+def _format_from_suffix(path: Path | None) -> str | None:
+    if path is None:
+        return None
+    # csv.gz раньше csv: проверяется окончание имени
+    for output_format in sorted(OUTPUT_FORMATS, key=len, reverse=True):
+        if path.name.endswith(f'.{output_format}'):
+            return output_format
+    return None
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='+',
+        help='каталоги, файлы или маски выгрузок (маски - в кавычках)',
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        type=Path,
+        help=(
+            'каталог для таблиц по файлам или файл для --merge '
+            '(по умолчанию текущий каталог / participants_<дата>)'
+        ),
+    )
+    parser.add_argument(
+        '--merge',
+        action='store_true',
+        help='одна таблица по всем файлам',
+    )
+    parser.add_argument(
+        '--format',
+        choices=OUTPUT_FORMATS,
+        help='по умолчанию - по расширению файла --output или xlsx',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.process_cpu_count() or 1,
+    )
+    parser.add_argument(
+        '--memory-budget-mb',
+        type=int,
+        help='бюджет памяти слияния для --merge, сверх него - на диск',
+    )
+    args = parser.parse_args(argv)
+
+    paths = find_exports(args.inputs)
+    if not paths:
+        sys.stderr.write('No exports found\n')
+        return 1
+
+    output_format = (
+        args.format
+        or (_format_from_suffix(args.output) if args.merge else None)
+        or ExportFormat.XLSX.value
+    )
+    output = args.output
+    if output is None:
+        output = (
+            Path(
+                f'participants_{datetime.now(timezone.utc).date()}'
+                f'.{output_format}'
+            )
+            if args.merge
+            else Path()
+        )
+
+    batch = run_batch(
+        paths,
+        output=output,
+        merge=args.merge,
+        output_format=output_format,
+        workers=max(1, args.workers),
+        memory_budget=(
+            args.memory_budget_mb * 1024 * 1024
+            if args.memory_budget_mb is not None
+            else None
+        ),
+    )
+    _write_line(format_batch_stats(batch))
+    return 1 if batch.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
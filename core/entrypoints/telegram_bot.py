@@ -1,5 +1,68 @@
-from infra.settings import provide_settings
-from telegram_bot.bot import provide_bot, run_polling
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from infra.fsm_storage import SqliteStorage
+from infra.settings import BotMode, provide_settings, Settings
+from services.participant_index import ParticipantIndex
+from services.snapshots import SnapshotStore
+from telegram_bot.bot import (
+    PARTICIPANTS_BROWSER_CACHE_MAX_PARTICIPANTS,
+    PARTICIPANTS_BROWSER_CACHE_SIZE,
+    PARTICIPANTS_PAGE_LAYOUT,
+    provide_bot,
+    provide_dispatcher,
+    run_polling,
+)
+from telegram_bot.participants_browser import (
+    ParticipantsBrowserStore,
+    SqliteParticipantsBrowserStore,
+)
+from telegram_bot.sender import DEFAULT_GLOBAL_RATE, OutboundSender
+from telegram_bot.webhook import run_webhook
+
+
+def provide_storage(settings: Settings) -> BaseStorage:
+    if settings.FSM_STORAGE_PATH is not None:
+        return SqliteStorage(settings.FSM_STORAGE_PATH)
+    return MemoryStorage()
+
+
+def provide_participant_index(settings: Settings) -> ParticipantIndex | None:
+    if settings.PARTICIPANT_INDEX_PATH is None:
+        return None
+    return ParticipantIndex(settings.PARTICIPANT_INDEX_PATH)
+
+
+def provide_snapshot_store(settings: Settings) -> SnapshotStore | None:
+    if settings.SNAPSHOT_STORE_PATH is None:
+        return None
+    return SnapshotStore(
+        settings.SNAPSHOT_STORE_PATH,
+        keep=settings.SNAPSHOT_KEEP,
+    )
+
+
+# Результаты для листания лежат в базе FSM: при нескольких
+# воркерах кнопка может прийти в другой процесс
+def provide_participants_browsers(
+    settings: Settings,
+) -> ParticipantsBrowserStore | None:
+    if settings.FSM_STORAGE_PATH is None:
+        return None
+    return SqliteParticipantsBrowserStore(
+        settings.FSM_STORAGE_PATH,
+        layout=PARTICIPANTS_PAGE_LAYOUT,
+        max_size=PARTICIPANTS_BROWSER_CACHE_SIZE,
+        max_participants=PARTICIPANTS_BROWSER_CACHE_MAX_PARTICIPANTS,
+    )
+
+
+# Лимит Telegram общий на бота: воркеры вебхука делят этот лимит поровну
+def provide_sender(settings: Settings) -> OutboundSender:
+    workers = (
+        settings.WEBHOOK_WORKERS if settings.BOT_MODE is BotMode.WEBHOOK else 1
+    )
+    return OutboundSender(global_rate=DEFAULT_GLOBAL_RATE / workers)
 
 
 def main() -> None:
@@ -7,9 +70,33 @@ def main() -> None:
 
     bot = provide_bot(
         token=settings.TELEGRAM_BOT_TOKEN.get_secret_value(),
+        api_url=settings.TELEGRAM_API_URL,
+        is_local=settings.TELEGRAM_API_LOCAL,
     )
+    dispatcher = provide_dispatcher(
+        storage=provide_storage(settings),
+        participant_index=provide_participant_index(settings),
+        merge_memory_budget=settings.merge_memory_budget,
+        snapshot_store=provide_snapshot_store(settings),
+        sender=provide_sender(settings),
+        participants_browsers=provide_participants_browsers(settings),
+        admin_user_ids=settings.ADMIN_USER_IDS,
+    )
+
+    if settings.BOT_MODE is BotMode.WEBHOOK:
+        run_webhook(
+            bot,
+            dispatcher,
+            url=settings.webhook_url,
+            path=settings.WEBHOOK_PATH,
+            host=settings.WEBHOOK_HOST,
+            port=settings.WEBHOOK_PORT,
+            secret_token=settings.webhook_secret,
+            workers=settings.WEBHOOK_WORKERS,
+        )
+        return
 
-    run_polling(bot)
+    run_polling(bot, dispatcher)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,167 @@
+import asyncio
+from collections.abc import Callable, Mapping
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Any
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+type DataUpdate = Callable[[dict[str, Any]], dict[str, Any]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}'
+) WITHOUT ROWID
+"""
+
+
+# Хранилище FSM, общее для нескольких процессов на одном хосте.
+# Соединение открывается лениво в каждом процессе, поэтому объект
+# можно создать до fork воркеров. Запросы идут в потоках, чтобы
+# ожидание блокировки базы не останавливало цикл событий
+class SqliteStorage(BaseStorage):
+    def __init__(self, path: str | Path) -> None:
+        self._path = Path(path)
+        self._key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._connection_pid: int | None = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _connect(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if self._connection is not None and self._connection_pid == pid:
+            return self._connection
+
+        connection = sqlite3.connect(
+            self._path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(_SCHEMA)
+
+        self._connection = connection
+        self._connection_pid = pid
+        return connection
+
+    def _execute(self, sql: str, params: tuple[Any, ...]) -> Any:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchone()
+
+    async def set_state(
+        self, key: StorageKey, state: StateType = None
+    ) -> None:
+        value = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(
+            self._execute,
+            'INSERT INTO fsm (key, state) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET state = excluded.state',
+            (self._key_builder.build(key), value),
+        )
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = await asyncio.to_thread(
+            self._execute,
+            'SELECT state FROM fsm WHERE key = ?',
+            (self._key_builder.build(key),),
+        )
+        return None if row is None else row[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            'INSERT INTO fsm (key, data) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET data = excluded.data',
+            (self._key_builder.build(key), json.dumps(dict(data))),
+        )
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        row = await asyncio.to_thread(
+            self._execute,
+            'SELECT data FROM fsm WHERE key = ?',
+            (self._key_builder.build(key),),
+        )
+        if row is None:
+            return {}
+        data: dict[str, Any] = json.loads(row[0])
+        return data
+
+    async def update_data(
+        self,
+        key: StorageKey,
+        data: Mapping[str, Any],
+    ) -> dict[str, Any]:
+        return await self.modify_data(key, lambda current: {**current, **data})
+
+    # Чтение и запись в одной транзакции BEGIN IMMEDIATE: параллельные
+    # изменения из других процессов не теряются
+    async def modify_data(
+        self,
+        key: StorageKey,
+        update: DataUpdate,
+    ) -> dict[str, Any]:
+        return await asyncio.to_thread(
+            self._modify_data,
+            self._key_builder.build(key),
+            update,
+        )
+
+    def _modify_data(self, key: str, update: DataUpdate) -> dict[str, Any]:
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute(
+                    'SELECT data FROM fsm WHERE key = ?',
+                    (key,),
+                ).fetchone()
+                data = update(json.loads(row[0]) if row is not None else {})
+                connection.execute(
+                    'INSERT INTO fsm (key, data) VALUES (?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET data = excluded.data',
+                    (key, json.dumps(data)),
+                )
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            return data
+
+    async def close(self) -> None:
+        with self._lock:
+            if (
+                self._connection is not None
+                and self._connection_pid == os.getpid()
+            ):
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
+
+
+# Атомарное изменение данных FSM. Память одного процесса меняется без
+# переключений между чтением и записью, SqliteStorage делает это в
+# транзакции
+async def modify_data(state: FSMContext, update: DataUpdate) -> dict[str, Any]:
+    if isinstance(state.storage, SqliteStorage):
+        return await state.storage.modify_data(state.key, update)
+    data = update(await state.get_data())
+    await state.set_data(data)
+    return data
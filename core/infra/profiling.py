@@ -0,0 +1,154 @@
+import asyncio
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import cProfile
+from dataclasses import dataclass
+import functools
+import marshal
+import os
+import sys
+import threading
+from types import FrameType
+from typing import Protocol
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class JobProfile:
+    # Содержимое файла для pstats.Stats / snakeviz
+    pstats: bytes
+    # Стеки в формате "f1;f2;f3 count" для flamegraph.pl / speedscope
+    collapsed: bytes
+    samples: int
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f'{code.co_qualname} ({filename}:{code.co_firstlineno})'
+
+
+# Выполняет синхронную часть обработки: разбор выгрузок и запись
+# файлов. По умолчанию это asyncio.to_thread
+class JobRunner(Protocol):
+    async def __call__[**P, T](
+        self,
+        func: Callable[P, T],
+        /,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T: ...
+
+
+# Профилировщик одной обработки. Разбор и запись файлов обработки идут
+# через run в отдельном потоке. Отдельный поток раз в sample_interval
+# снимает стек только этого потока для flamegraph: чужие обработки в
+# цикле событий туда не попадают. cProfile включен лишь на время
+# вызовов run, но в Python 3.12+ он видит все потоки, поэтому в pstats
+# могут попасть и вызовы, шедшие в других потоках параллельно. Точные
+# счетчики вызовов остаются, для выделения обработки - flamegraph.
+# Одновременно в процессе работает только один профилировщик: cProfile
+# не допускает двух активных профилей
+class JobProfiler:
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        *,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ) -> None:
+        self._sample_interval = sample_interval
+        self._profile = cProfile.Profile()
+        self._stacks: Counter[str] = Counter()
+        self._samples = 0
+        self._stopped = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        # Поток обработки, пока он выполняет вызов из run
+        self._job_thread_id: int | None = None
+
+    def start(self) -> None:
+        if not JobProfiler._lock.acquire(blocking=False):
+            raise ProfilerBusyError('Another job is being profiled')
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='profiled-job',
+        )
+        self._sampler = threading.Thread(
+            target=self._sample,
+            name='job-profiler',
+            daemon=True,
+        )
+        self._sampler.start()
+
+    async def run[**P, T](
+        self,
+        func: Callable[P, T],
+        /,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T:
+        if self._executor is None:
+            raise RuntimeError('Profiler is not started')
+        context = contextvars.copy_context()
+        call = functools.partial(self._call, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            context.run,
+            call,
+        )
+
+    def _call[**P, T](
+        self,
+        func: Callable[P, T],
+        /,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T:
+        self._job_thread_id = threading.get_ident()
+        self._profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._profile.disable()
+            self._job_thread_id = None
+
+    def stop(self) -> JobProfile:
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        JobProfiler._lock.release()
+
+        self._profile.create_stats()
+        collapsed = ''.join(
+            f'{stack} {count}\n' for stack, count in self._stacks.items()
+        )
+        return JobProfile(
+            pstats=marshal.dumps(self._profile.stats),
+            collapsed=collapsed.encode(),
+            samples=self._samples,
+        )
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self._sample_interval):
+            thread_id = self._job_thread_id
+            if thread_id is None:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            stack: list[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if not stack:
+                continue
+            self._stacks[';'.join(reversed(stack))] += 1
+            self._samples += 1
@@ -1,17 +1,115 @@
-from pydantic import SecretStr, ValidationError
+import enum
+from pathlib import Path
+import re
+from typing import Self
+
+from pydantic import Field, model_validator, SecretStr, ValidationError
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Telegram принимает секрет из 1-256 символов A-Z, a-z, 0-9, _ и -
+_WEBHOOK_SECRET_RE = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
+
+class BotMode(enum.StrEnum):
+    POLLING = 'polling'
+    WEBHOOK = 'webhook'
+
 
 class Settings(BaseSettings):
     DEBUG: bool = False
     TELEGRAM_BOT_TOKEN: SecretStr
 
+    BOT_MODE: BotMode = BotMode.POLLING
+
+    # Свой сервер telegram-bot-api, например http://localhost:8081.
+    # TELEGRAM_API_LOCAL=true - сервер запущен в режиме --local на этой
+    # же машине: лимит файлов 2000 МБ, файлы читаются прямо из папки сервера
+    TELEGRAM_API_URL: str | None = None
+    TELEGRAM_API_LOCAL: bool = False
+
+    # Публичный адрес, по которому Telegram будет слать обновления,
+    # например https://bot.example.com
+    WEBHOOK_BASE_URL: str | None = None
+    WEBHOOK_PATH: str = '/webhook'
+    # Обязателен в режиме webhook: без него любой, кто знает адрес,
+    # может слать боту поддельные обновления
+    WEBHOOK_SECRET: SecretStr | None = None
+    WEBHOOK_HOST: str = '0.0.0.0'
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_WORKERS: int = Field(default=1, ge=1)
+
+    # Без пути состояние FSM хранится в памяти процесса
+    FSM_STORAGE_PATH: Path | None = None
+
+    # SQLite-индекс участников по всем обработанным чатам для /find.
+    # Без пути индекс не ведется
+    PARTICIPANT_INDEX_PATH: Path | None = None
+
+    # Каталог снимков участников для /diff и число снимков, которые
+    # хранятся по каждому чату. Без пути снимки не сохраняются
+    SNAPSHOT_STORE_PATH: Path | None = None
+    SNAPSHOT_KEEP: int = Field(default=10, ge=2)
+
+    # Бюджет памяти на слияние участников одной обработки. При
+    # превышении слияние продолжается через временные файлы на диске.
+    # Без значения слияние идет целиком в памяти
+    MERGE_MEMORY_BUDGET_MB: int | None = Field(default=None, ge=1)
+
+    # Telegram id пользователей, которым доступны команды /profile и /find,
+    # в формате JSON: [123, 456]
+    ADMIN_USER_IDS: frozenset[int] = frozenset()
+
     model_config = SettingsConfigDict(
         env_file='.env',
         env_file_encoding='utf-8',
         extra='ignore',
     )
 
+    @model_validator(mode='after')
+    def _check_local_api(self) -> Self:
+        if self.TELEGRAM_API_LOCAL and not self.TELEGRAM_API_URL:
+            raise ValueError('TELEGRAM_API_URL is required in local mode')
+        return self
+
+    @model_validator(mode='after')
+    def _check_webhook(self) -> Self:
+        if self.BOT_MODE is not BotMode.WEBHOOK:
+            return self
+        if not self.WEBHOOK_BASE_URL:
+            raise ValueError('WEBHOOK_BASE_URL is required in webhook mode')
+        if not self.WEBHOOK_PATH.startswith('/'):
+            raise ValueError('WEBHOOK_PATH must start with "/"')
+        if self.WEBHOOK_SECRET is None:
+            raise ValueError('WEBHOOK_SECRET is required in webhook mode')
+        if not _WEBHOOK_SECRET_RE.fullmatch(
+            self.WEBHOOK_SECRET.get_secret_value(),
+        ):
+            raise ValueError(
+                'WEBHOOK_SECRET must be 1-256 characters: A-Z, a-z, 0-9, _, -'
+            )
+        if self.WEBHOOK_WORKERS > 1 and self.FSM_STORAGE_PATH is None:
+            raise ValueError(
+                'FSM_STORAGE_PATH is required when WEBHOOK_WORKERS > 1'
+            )
+        return self
+
+    @property
+    def merge_memory_budget(self) -> int | None:
+        if self.MERGE_MEMORY_BUDGET_MB is None:
+            return None
+        return self.MERGE_MEMORY_BUDGET_MB * 1024 * 1024
+
+    @property
+    def webhook_url(self) -> str:
+        base_url = (self.WEBHOOK_BASE_URL or '').rstrip('/')
+        return f'{base_url}{self.WEBHOOK_PATH}'
+
+    @property
+    def webhook_secret(self) -> str:
+        if self.WEBHOOK_SECRET is None:
+            return ''
+        return self.WEBHOOK_SECRET.get_secret_value()
+
 
 class SettingsParseError(ValueError):
     pass
@@ -1,4 +1,5 @@
-from datetime import datetime
+from collections.abc import Iterable
+from datetime import date, datetime
 import enum
 
 from pydantic import BaseModel, Field
@@ -14,6 +15,24 @@ class ParticipantType(enum.StrEnum):
     CHANNEL = 'channel'
 
 
+# Порядок бит фиксирован порядком объявления ParticipantType: новые
+# значения добавляем только в конец, иначе сохраненные маски поедут
+SEEN_AS_BITS: dict[ParticipantType, int] = {
+    p_type: 1 << i for i, p_type in enumerate(ParticipantType)
+}
+
+
+def seen_as_to_mask(seen_as: Iterable[ParticipantType]) -> int:
+    mask = 0
+    for p_type in seen_as:
+        mask |= SEEN_AS_BITS[p_type]
+    return mask
+
+
+def seen_as_from_mask(mask: int) -> set[ParticipantType]:
+    return {p_type for p_type, bit in SEEN_AS_BITS.items() if mask & bit}
+
+
 class Participant(BaseModel):
     user_id: str | None = None
     username: str | None = None
@@ -23,6 +42,9 @@ class Participant(BaseModel):
     registered_at: datetime | None = None
 
     seen_as: set[ParticipantType] = Field(default_factory=set)
+    # Маска исходных файлов при слиянии: бит i означает, что участник
+    # есть в i-м файле
+    sources: int = 0
 
     def __hash__(self) -> int:
         return hash((self.user_id))
@@ -36,6 +58,27 @@ class Participant(BaseModel):
 type ParticipantList = list[Participant]
 
 
+# Что попадает в обработку: окно дат сообщений (включительно), роли
+# участников и типы сообщений (message, service). None - без ограничения
+class ParticipantsFilter(BaseModel):
+    since: date | None = None
+    until: date | None = None
+    roles: frozenset[ParticipantType] | None = None
+    message_types: frozenset[str] | None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return (
+            self.since is None
+            and self.until is None
+            and self.roles is None
+            and self.message_types is None
+        )
+
+    def wants(self, role: ParticipantType) -> bool:
+        return self.roles is None or role in self.roles
+
+
 class ParticipantsReport(BaseModel):
     exported_at: datetime
     participants: ParticipantList
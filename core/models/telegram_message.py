@@ -1,7 +1,16 @@
-from pydantic import BaseModel, Field
+from typing import Any
+
+from pydantic import BaseModel, Field, field_validator, ValidationInfo
 
 type TelegramText = str | list[TelegramComplexText | str]
 
+# Типы сущностей текста, из которых извлекаются упоминания
+MENTION_ENTITY_TYPES = frozenset({'mention', 'mention_name'})
+
+# Ключ контекста валидации: упоминания не нужны, куски текста
+# не разбираются
+SKIP_MENTIONS = 'skip_mentions'
+
 
 class TelegramRecentReaction(BaseModel):
     actor: str | None = Field(default=None, alias='from')
@@ -13,11 +22,13 @@ class TelegramReaction(BaseModel):
 
 
 class TelegramComplexText(BaseModel):
-    type: str  # нас интересует mention
-    text: str  # если type == mention, то здесь @username
+    type: str  # нас интересуют mention и mention_name
+    text: str  # для mention здесь @username, для mention_name - имя
+    user_id: int | None = None  # заполнен только для mention_name
 
 
 class TelegramMessage(BaseModel):
+    id: int | None = None
     type: str
 
     from_: str | None = Field(default=None, alias='from')
@@ -30,7 +41,24 @@ class TelegramMessage(BaseModel):
     forwarded_from_id: str | None = None
 
     text: TelegramText
+    text_entities: list[TelegramComplexText] | None = None
     reactions: list[TelegramReaction] | None = None
 
+    # Из текста нужны только упоминания, поэтому прочие куски
+    # отбрасываются до валидации и не превращаются в модели
+    @field_validator('text', 'text_entities', mode='before')
+    @classmethod
+    def _keep_mentions(cls, value: Any, info: ValidationInfo) -> Any:
+        if not isinstance(value, list):
+            return value
+        if isinstance(info.context, dict) and info.context.get(SKIP_MENTIONS):
+            return []
+        return [
+            part
+            for part in value
+            if isinstance(part, dict)
+            and part.get('type') in MENTION_ENTITY_TYPES
+        ]
+
 
 type TelegramMessages = list[TelegramMessage]
@@ -0,0 +1,83 @@
+"""Замер холодного старта точки входа бота: время импорта и RSS.
+
+Каждый замер выполняется в отдельном процессе интерпретатора, в отчет
+попадает медиана. Если заданы бюджеты и они превышены, код возврата 1:
+
+    uv run -m scripts.benchmark_startup --max-import-ms 800 --max-rss-mb 90
+"""
+
+import argparse
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MODULE = 'entrypoints.telegram_bot'
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl')
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+import_ms = (time.perf_counter() - start) * 1000
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{'import_ms': import_ms, 'rss_kb': rss_kb, 'heavy': heavy}}))
+"""
+
+_CORE_DIR = Path(__file__).resolve().parent.parent
+
+
+def _measure_once(module: str) -> dict[str, object]:
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            _PROBE.format(module=module, heavy=HEAVY_MODULES),
+        ],
+        cwd=_CORE_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    measurement: dict[str, object] = json.loads(result.stdout)
+    return measurement
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--module', default=DEFAULT_MODULE)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    parser.add_argument('--max-rss-mb', type=float, default=None)
+    args = parser.parse_args()
+
+    measurements = [_measure_once(args.module) for _ in range(args.runs)]
+    import_ms = statistics.median(
+        float(str(m['import_ms'])) for m in measurements
+    )
+    rss_mb = statistics.median(
+        int(str(m['rss_kb'])) / 1024 for m in measurements
+    )
+    heavy = measurements[0]['heavy']
+
+    sys.stdout.write(
+        f'{args.module}: import {import_ms:.0f} ms, '
+        f'RSS {rss_mb:.1f} MB (median of {args.runs})\n'
+        f'heavy modules loaded at startup: {heavy or "none"}\n'
+    )
+
+    failures: list[str] = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f'import time over budget ({args.max_import_ms} ms)')
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f'RSS over budget ({args.max_rss_mb} MB)')
+
+    for failure in failures:
+        sys.stderr.write(f'{failure}\n')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,491 @@
+import asyncio
+from collections import defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable
+import contextlib
+from dataclasses import dataclass
+import itertools
+import json
+from pathlib import Path
+import random
+import time
+from typing import Any, Self
+
+from aiogram.types import TelegramObject
+from aiohttp import web
+from aiohttp.web_request import FileField
+
+from telegram_bot.bot import provide_bot, provide_dispatcher
+from telegram_bot.sender import OutboundSender
+
+FAKE_BOT_ID = 42
+FAKE_BOT_TOKEN = f'{FAKE_BOT_ID}:FAKE'
+
+
+@dataclass(slots=True)
+class SentRequest:
+    method: str
+    chat_id: int | None
+    params: dict[str, str]
+    file_size: int | None
+    sent_at: float
+    message_id: int | None = None
+
+
+# Заглушка Bot API для тестов и нагрузочного стенда: long polling,
+# скачивание файлов и отправка сообщений. Запросы бота на отправку
+# складываются в sent
+class FakeBotApi:
+    # local_dir включает режим локального сервера: файлы лежат на диске,
+    # и getFile возвращает абсолютный путь к ним
+    def __init__(self, *, local_dir: Path | None = None) -> None:
+        self.local_dir = local_dir
+        self.files: dict[str, bytes] = {}
+        self.sent: list[SentRequest] = []
+        self._sent_by_chat: defaultdict[int | None, list[SentRequest]] = (
+            defaultdict(list)
+        )
+        self.downloads = 0
+        self.pushed_updates = 0
+        self.flood_errors = 0
+        self.base_url = ''
+        # Сколько раз подряд ответить 429 на метод
+        self._flood: dict[str, tuple[int, int]] = {}
+
+        self._updates: list[dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        # Текст отправленных сообщений по (чат, id сообщения)
+        self._texts: dict[tuple[int, int], str] = {}
+        self._updates_changed = asyncio.Condition()
+        self._sent_changed = asyncio.Condition()
+        self._runner: web.AppRunner | None = None
+
+    async def __aenter__(self) -> Self:
+        app = web.Application(client_max_size=1024**3)
+        app.router.add_post('/bot{token}/{method}', self._handle_method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self._handle_file)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f'http://{host}:{port}'
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def add_file(self, file_id: str, content: bytes) -> None:
+        self.files[file_id] = content
+        if self.local_dir is not None:
+            (self.local_dir / file_id).write_bytes(content)
+
+    def inject_retry_after(
+        self,
+        method: str,
+        *,
+        times: int,
+        retry_after: int = 1,
+    ) -> None:
+        self._flood[method] = (times, retry_after)
+
+    async def push_update(self, payload: dict[str, Any]) -> float:
+        update = {'update_id': next(self._update_ids), **payload}
+        async with self._updates_changed:
+            self._updates.append(update)
+            self.pushed_updates += 1
+            self._updates_changed.notify_all()
+        return time.perf_counter()
+
+    async def push_text(self, chat_id: int, text: str) -> float:
+        return await self.push_update(
+            {'message': self._message(chat_id, text=text)}
+        )
+
+    async def push_document(
+        self,
+        chat_id: int,
+        *,
+        file_id: str,
+        file_name: str,
+        file_size: int | None = None,
+    ) -> float:
+        document = {
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_name': file_name,
+            'file_size': (
+                file_size
+                if file_size is not None
+                else len(self.files.get(file_id, b''))
+            ),
+        }
+        return await self.push_update(
+            {'message': self._message(chat_id, document=document)}
+        )
+
+    # Нажатие inline-кнопки под сообщением бота
+    async def push_callback(
+        self,
+        chat_id: int,
+        *,
+        message: SentRequest,
+        data: str,
+    ) -> float:
+        return await self.push_update(
+            {
+                'callback_query': {
+                    'id': str(next(self._callback_ids)),
+                    'from': {
+                        'id': chat_id,
+                        'is_bot': False,
+                        'first_name': 'User',
+                    },
+                    'chat_instance': str(chat_id),
+                    'data': data,
+                    'message': {
+                        'message_id': message.message_id,
+                        'date': int(time.time()),
+                        'chat': {'id': chat_id, 'type': 'private'},
+                        'text': message.params.get('text', ''),
+                    },
+                }
+            }
+        )
+
+    async def wait_sent(
+        self,
+        chat_id: int,
+        *,
+        after: float,
+        methods: frozenset[str] = frozenset({'sendMessage', 'sendDocument'}),
+    ) -> SentRequest:
+        def find() -> SentRequest | None:
+            for request in self._sent_by_chat[chat_id]:
+                if request.method in methods and request.sent_at >= after:
+                    return request
+            return None
+
+        async with self._sent_changed:
+            await self._sent_changed.wait_for(lambda: find() is not None)
+        found = find()
+        assert found is not None
+        return found
+
+    def sent_to(
+        self,
+        chat_id: int,
+        *,
+        after: float = 0.0,
+    ) -> list[SentRequest]:
+        return [r for r in self._sent_by_chat[chat_id] if r.sent_at >= after]
+
+    def _message(self, chat_id: int, **content: Any) -> dict[str, Any]:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'},
+            **content,
+        }
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        form = await request.post()
+
+        params: dict[str, str] = {}
+        file_names: dict[str, str] = {}
+        file_size: int | None = None
+        for key, value in form.items():
+            if isinstance(value, FileField):
+                file_names[key] = value.filename
+                file_size = len(value.file.read())
+            else:
+                params[key] = str(value)
+        # Ссылка attach://<поле> заменяется именем загруженного файла
+        for key, value in params.items():
+            if value.startswith('attach://'):
+                params[key] = file_names.get(value[len('attach://') :], value)
+
+        times, retry_after = self._flood.get(method, (0, 0))
+        if times:
+            self._flood[method] = (times - 1, retry_after)
+            self.flood_errors += 1
+            return web.json_response(
+                {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': (
+                        f'Too Many Requests: retry after {retry_after}'
+                    ),
+                    'parameters': {'retry_after': retry_after},
+                },
+                status=429,
+            )
+
+        handler = getattr(self, f'_method_{method}', None)
+        if handler is None:
+            return self._ok(True)
+        result = await handler(params, file_size)
+        if isinstance(result, web.Response):
+            return result
+        return self._ok(result)
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        content = self.files.get(request.match_info['path'])
+        if content is None:
+            raise web.HTTPNotFound
+        self.downloads += 1
+        return web.Response(body=content)
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _record(
+        self,
+        method: str,
+        params: dict[str, str],
+        file_size: int | None,
+        *,
+        message_id: int | None = None,
+    ) -> int | None:
+        chat_id = int(params['chat_id']) if 'chat_id' in params else None
+        sent = SentRequest(
+            method=method,
+            chat_id=chat_id,
+            params=params,
+            file_size=file_size,
+            sent_at=time.perf_counter(),
+            message_id=message_id,
+        )
+        async with self._sent_changed:
+            self.sent.append(sent)
+            self._sent_by_chat[chat_id].append(sent)
+            self._sent_changed.notify_all()
+        return chat_id
+
+    async def _method_getMe(self, *_: object) -> dict[str, Any]:  # noqa: N802
+        return {
+            'id': FAKE_BOT_ID,
+            'is_bot': True,
+            'first_name': 'Fake',
+            'username': 'fake_bot',
+        }
+
+    async def _method_getUpdates(  # noqa: N802
+        self,
+        params: dict[str, str],
+        _: int | None,
+    ) -> list[dict[str, Any]]:
+        offset = int(params.get('offset', 0))
+        timeout = float(params.get('timeout', 0))
+
+        def pending() -> list[dict[str, Any]]:
+            return [u for u in self._updates if u['update_id'] >= offset]
+
+        async with self._updates_changed:
+            self._updates = pending()
+            if not self._updates and timeout:
+                try:
+                    async with asyncio.timeout(timeout):
+                        await self._updates_changed.wait_for(
+                            lambda: bool(pending())
+                        )
+                except TimeoutError:
+                    return []
+            return pending()
+
+    async def _method_getFile(  # noqa: N802
+        self,
+        params: dict[str, str],
+        _: int | None,
+    ) -> dict[str, Any]:
+        file_id = params['file_id']
+        return {
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_size': len(self.files.get(file_id, b'')),
+            'file_path': (
+                str(self.local_dir / file_id)
+                if self.local_dir is not None
+                else file_id
+            ),
+        }
+
+    async def _method_sendMessage(  # noqa: N802
+        self,
+        params: dict[str, str],
+        file_size: int | None,
+    ) -> dict[str, Any]:
+        message_id = next(self._message_ids)
+        chat_id = await self._record(
+            'sendMessage',
+            params,
+            file_size,
+            message_id=message_id,
+        )
+        text = params.get('text', '')
+        self._texts[chat_id or 0, message_id] = text
+        return {
+            **self._message(chat_id or 0, text=text),
+            'message_id': message_id,
+        }
+
+    async def _method_editMessageText(  # noqa: N802
+        self,
+        params: dict[str, str],
+        file_size: int | None,
+    ) -> dict[str, Any] | web.Response:
+        chat_id = int(params['chat_id'])
+        message_id = int(params['message_id'])
+        text = params.get('text', '')
+        # Как и Telegram, правка без изменений - ошибка
+        if self._texts.get((chat_id, message_id)) == text:
+            return web.json_response(
+                {
+                    'ok': False,
+                    'error_code': 400,
+                    'description': (
+                        'Bad Request: message is not modified: specified '
+                        'new message content and reply markup are exactly '
+                        'the same as a current content and reply markup of '
+                        'the message'
+                    ),
+                },
+                status=400,
+            )
+        await self._record(
+            'editMessageText',
+            params,
+            file_size,
+            message_id=message_id,
+        )
+        self._texts[chat_id, message_id] = text
+        return {
+            **self._message(chat_id, text=text),
+            'message_id': message_id,
+        }
+
+    async def _method_answerCallbackQuery(  # noqa: N802
+        self,
+        params: dict[str, str],
+        file_size: int | None,
+    ) -> bool:
+        await self._record('answerCallbackQuery', params, file_size)
+        return True
+
+    async def _method_sendDocument(  # noqa: N802
+        self,
+        params: dict[str, str],
+        file_size: int | None,
+    ) -> dict[str, Any]:
+        chat_id = await self._record('sendDocument', params, file_size)
+        document_id = f'sent-{next(self._message_ids)}'
+        return self._message(
+            chat_id or 0,
+            document={'file_id': document_id, 'file_unique_id': document_id},
+        )
+
+
+# Бот поверх заглушки. Обновления считаются во внешнем middleware,
+# поэтому wait_idle дожидается конца обработки всех отправленных
+# обновлений, и фиксированные паузы в тестах не нужны
+class RunningBot:
+    def __init__(self, api: FakeBotApi) -> None:
+        self.api = api
+        self._handled = 0
+        self._in_flight = 0
+        self._changed = asyncio.Condition()
+
+    async def track(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with self._changed:
+            self._in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            async with self._changed:
+                self._in_flight -= 1
+                self._handled += 1
+                self._changed.notify_all()
+
+    async def wait_idle(self) -> None:
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: (
+                    not self._in_flight
+                    and self._handled >= self.api.pushed_updates
+                )
+            )
+
+
+@contextlib.asynccontextmanager
+async def running_bot(
+    api: FakeBotApi,
+    *,
+    is_local: bool = False,
+    **dispatcher_kwargs: Any,
+) -> AsyncIterator[RunningBot]:
+    bot = provide_bot(FAKE_BOT_TOKEN, api_url=api.base_url, is_local=is_local)
+    dispatcher_kwargs.setdefault('sender', OutboundSender(chat_interval=0))
+    dispatcher = provide_dispatcher(**dispatcher_kwargs)
+    running = RunningBot(api)
+    dispatcher.update.outer_middleware(running.track)
+
+    polling = asyncio.create_task(
+        dispatcher.start_polling(bot, handle_signals=False, polling_timeout=1)
+    )
+    try:
+        yield running
+    finally:
+        try:
+            await dispatcher.stop_polling()
+        except RuntimeError:
+            # Polling еще не успел запуститься
+            polling.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await polling
+
+
+# Синтетическая выгрузка чата: случайные авторы, упоминания и реакции
+def build_export(
+    *,
+    participants: int,
+    messages: int,
+    rng: random.Random,
+    chat_id: int = 1,
+) -> bytes:
+    def user(i: int) -> tuple[str, str]:
+        return f'user{i}', f'User {i}'
+
+    rows = []
+    for message_id in range(1, messages + 1):
+        author_id, author = user(rng.randrange(participants))
+        reactor_id, reactor = user(rng.randrange(participants))
+        mention = rng.randrange(participants)
+        rows.append(
+            {
+                'id': message_id,
+                'type': 'message',
+                'from': author,
+                'from_id': author_id,
+                'text': [
+                    {'type': 'plain', 'text': 'hi '},
+                    {'type': 'mention', 'text': f'@user_{mention}'},
+                ],
+                'reactions': [
+                    {'recent': [{'from': reactor, 'from_id': reactor_id}]}
+                ],
+            }
+        )
+    return json.dumps(
+        {'id': chat_id, 'name': f'Load {chat_id}', 'messages': rows}
+    ).encode()
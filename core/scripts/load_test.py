@@ -0,0 +1,183 @@
+"""Нагрузочный стенд бота на локальной заглушке Bot API.
+
+Каждый виртуальный чат проходит сценарий /start, N загрузок файлов и
+/done. Стенд меряет задержку ответа бота на каждый шаг, число готовых
+выгрузок в секунду и пиковый RSS процесса (бот и заглушка работают в
+одном процессе):
+
+    uv run -m scripts.load_test --chats 100 --files-per-chat 3
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+import random
+import resource
+import statistics
+import sys
+import time
+
+from scripts.fake_bot_api import build_export, FakeBotApi, running_bot
+from telegram_bot.bot import INLINE_USERNAMES_MAX_PARTICIPANTS
+from telegram_bot.sender import OutboundSender
+
+STEPS = ('start', 'document', 'done')
+
+
+@dataclass(frozen=True, slots=True)
+class LoadTestConfig:
+    chats: int = 50
+    files_per_chat: int = 3
+    participants_per_file: int = 500
+    messages_per_file: int = 2000
+    seed: int = 0
+
+
+@dataclass(slots=True)
+class LoadTestReport:
+    elapsed: float
+    jobs: int
+    peak_rss_mb: float
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+
+    @property
+    def jobs_per_second(self) -> float:
+        return self.jobs / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, step: str, q: int) -> float:
+        values = self.latencies.get(step) or [0.0]
+        if len(values) == 1:
+            return values[0]
+        return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+async def _run_session(
+    api: FakeBotApi,
+    *,
+    chat_id: int,
+    file_ids: list[str],
+    expect_document: bool,
+    latencies: dict[str, list[float]],
+) -> None:
+    pushed_at = await api.push_text(chat_id, '/start')
+    reply = await api.wait_sent(chat_id, after=pushed_at)
+    latencies['start'].append(reply.sent_at - pushed_at)
+
+    for file_id in file_ids:
+        pushed_at = await api.push_document(
+            chat_id,
+            file_id=file_id,
+            file_name=f'{file_id}.json',
+        )
+        reply = await api.wait_sent(chat_id, after=pushed_at)
+        latencies['document'].append(reply.sent_at - pushed_at)
+
+    pushed_at = await api.push_text(chat_id, '/done')
+    reply = await api.wait_sent(
+        chat_id,
+        after=pushed_at,
+        methods=frozenset(
+            {'sendDocument'} if expect_document else {'sendMessage'}
+        ),
+    )
+    latencies['done'].append(reply.sent_at - pushed_at)
+
+
+async def run_load_test(config: LoadTestConfig) -> LoadTestReport:
+    rng = random.Random(config.seed)
+    # Каждый файл - отдельный чат, иначе бот отбросит сообщения
+    # как повторы
+    exports = [
+        build_export(
+            participants=config.participants_per_file,
+            messages=config.messages_per_file,
+            rng=rng,
+            chat_id=i + 1,
+        )
+        for i in range(config.files_per_chat)
+    ]
+    latencies: dict[str, list[float]] = defaultdict(list)
+
+    async with FakeBotApi() as api:
+        chat_files: dict[int, list[str]] = {}
+        for chat_id in range(1, config.chats + 1):
+            chat_files[chat_id] = []
+            for i, content in enumerate(exports):
+                file_id = f'chat{chat_id}-file{i}'
+                api.add_file(file_id, content)
+                chat_files[chat_id].append(file_id)
+
+        # Стенд меряет бота при настоящих лимитах отправки
+        async with running_bot(api, sender=OutboundSender()):
+            started_at = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    _run_session(
+                        api,
+                        chat_id=chat_id,
+                        file_ids=file_ids,
+                        # Для нескольких файлов бот всегда шлет XLSX, где
+                        # есть отчет по пересечениям
+                        expect_document=(
+                            config.participants_per_file
+                            > INLINE_USERNAMES_MAX_PARTICIPANTS
+                            or config.files_per_chat > 1
+                        ),
+                        latencies=latencies,
+                    )
+                    for chat_id, file_ids in chat_files.items()
+                )
+            )
+            elapsed = time.perf_counter() - started_at
+
+    return LoadTestReport(
+        elapsed=elapsed,
+        jobs=len(latencies['done']),
+        # ru_maxrss в Linux - в килобайтах
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        latencies=dict(latencies),
+    )
+
+
+def format_report(report: LoadTestReport) -> str:
+    lines = [f'{"step":<10}{"count":>8}{"p50, ms":>12}{"p99, ms":>12}']
+    for step in STEPS:
+        lines.append(
+            f'{step:<10}{len(report.latencies.get(step, [])):>8}'
+            f'{report.percentile(step, 50) * 1000:>12.1f}'
+            f'{report.percentile(step, 99) * 1000:>12.1f}'
+        )
+    lines.append(
+        f'jobs: {report.jobs} in {report.elapsed:.2f} s '
+        f'({report.jobs_per_second:.2f} jobs/s), '
+        f'peak RSS {report.peak_rss_mb:.1f} MB'
+    )
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--files-per-chat', type=int, default=3)
+    parser.add_argument('--participants-per-file', type=int, default=500)
+    parser.add_argument('--messages-per-file', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run_load_test(
+            LoadTestConfig(
+                chats=args.chats,
+                files_per_chat=args.files_per_chat,
+                participants_per_file=args.participants_per_file,
+                messages_per_file=args.messages_per_file,
+                seed=args.seed,
+            )
+        )
+    )
+    sys.stdout.write(format_report(report) + '\n')
+
+
+if __name__ == '__main__':
+    main()
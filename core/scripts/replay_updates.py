@@ -0,0 +1,62 @@
+"""Отправляет записанные обновления Telegram на локальный webhook.
+
+Файл может содержать JSON-массив обновлений или по одному обновлению
+на строку:
+
+    uv run -m scripts.replay_updates updates.json \\
+        --url http://127.0.0.1:8080/webhook --secret my-secret
+"""
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+import sys
+from typing import Any
+
+from aiohttp import ClientSession
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def _load_updates(path: Path) -> list[dict[str, Any]]:
+    content = path.read_text(encoding='utf-8').strip()
+    if content.startswith('['):
+        updates: list[dict[str, Any]] = json.loads(content)
+        return updates
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+async def _replay(
+    updates: list[dict[str, Any]],
+    *,
+    url: str,
+    secret: str | None,
+) -> int:
+    headers = {SECRET_HEADER: secret} if secret else {}
+    failed = 0
+    async with ClientSession() as session:
+        for update in updates:
+            async with session.post(url, json=update, headers=headers) as r:
+                sys.stdout.write(f'update {update.get("update_id")}: ')
+                sys.stdout.write(f'{r.status}\n')
+                if r.status != 200:  # noqa: PLR2004
+                    failed += 1
+    return failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', default=None)
+    args = parser.parse_args()
+
+    failed = asyncio.run(
+        _replay(_load_updates(args.path), url=args.url, secret=args.secret)
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+from typing import Any
+
+# Наибольший размах id в битовой карте одного чата (16 МБ). id вне
+# этих пределов хранятся в обычном множестве
+MAX_BITMAP_SPAN = 1 << 27
+
+
+# Отбрасывает повторы сообщений из пересекающихся выгрузок одного чата.
+# id сообщений внутри чата идут подряд, поэтому для каждого чата
+# хранится битовая карта: бит на id, без ложных срабатываний
+# фильтра Блума. Карта начинается около наименьшего встреченного id:
+# размер зависит от размаха id, не от их величины
+class MessageDeduplicator:
+    def __init__(self) -> None:
+        self._bitmaps: dict[int, bytearray] = {}
+        # Номер первого байта карты чата
+        self._offsets: dict[int, int] = {}
+        self._sparse: dict[int, set[int]] = {}
+        self.seen = 0
+        self.duplicates = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.duplicates / self.seen if self.seen else 0.0
+
+    # True, если сообщение встретилось впервые
+    def add(self, chat_id: int, message_id: int) -> bool:
+        self.seen += 1
+
+        index = message_id >> 3
+        bitmap = self._bitmaps.get(chat_id)
+        if bitmap is None:
+            bitmap = self._bitmaps[chat_id] = bytearray(1)
+            self._offsets[chat_id] = index
+        offset = self._offsets[chat_id]
+
+        if index < offset:
+            headroom = MAX_BITMAP_SPAN // 8 - len(bitmap)
+            if offset - index > headroom:
+                return self._add_sparse(chat_id, message_id)
+            # Вставка в начало копирует всю карту, поэтому вниз карта
+            # растет хотя бы вдвое, в пределах MAX_BITMAP_SPAN
+            grow = min(max(offset - index, len(bitmap)), headroom)
+            bitmap[:0] = bytes(grow)
+            offset = self._offsets[chat_id] = offset - grow
+        elif index >= offset + len(bitmap):
+            if (index + 1 - offset) * 8 > MAX_BITMAP_SPAN:
+                return self._add_sparse(chat_id, message_id)
+            bitmap.extend(bytes(index + 1 - offset - len(bitmap)))
+
+        mask = 1 << (message_id & 7)
+        if bitmap[index - offset] & mask:
+            self.duplicates += 1
+            return False
+        bitmap[index - offset] |= mask
+        return True
+
+    # Карта никогда не сужается, поэтому id, однажды попавший сюда,
+    # никогда не окажется внутри карты
+    def _add_sparse(self, chat_id: int, message_id: int) -> bool:
+        sparse = self._sparse.setdefault(chat_id, set())
+        if message_id in sparse:
+            self.duplicates += 1
+            return False
+        sparse.add(message_id)
+        return True
+
+    def filter(
+        self,
+        chat_id: Any,
+        messages: list[Any],
+    ) -> list[Any]:
+        # Без id чата или сообщения повтор не определить, такие
+        # сообщения остаются
+        if not isinstance(chat_id, int):
+            return messages
+        return [
+            msg
+            for msg in messages
+            if not isinstance(msg, dict)
+            or not isinstance(msg.get('id'), int)
+            or self.add(chat_id, msg['id'])
+        ]
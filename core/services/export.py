@@ -1,6 +1,23 @@
-import pandas as pd
+# ruff: noqa: RUF001
 
-from models.participants import ParticipantsReport
+from collections.abc import Iterable, Iterator, Sequence
+import csv
+from datetime import datetime
+import gzip
+import io
+from pathlib import Path
+from typing import Any, BinaryIO, TextIO
+
+from models.participants import Participant, ParticipantsReport
+from services.merge import normalize_username
+from services.overlap import OverlapCounter
+
+# Путь к файлу или открытый бинарный поток (BytesIO, временный файл)
+type ExportTarget = str | Path | BinaryIO
+
+type ExportRow = list[str | None]
+# Строка выгрузки и битовая маска файлов, где встретился участник
+type SourcedRow = tuple[ExportRow, int]
 
 EXPORT_COLUMNS = [
     'Username',
@@ -11,73 +28,251 @@ EXPORT_COLUMNS = [
 ]
 
 
-def _normalize_username(username: str | None) -> str | None:
-    if not username:
-        return None
-    return username if username.startswith('@') else f'@{username}'
+def _export_date(exported_at: datetime | None) -> str:
+    return exported_at.date().isoformat() if exported_at else ''
 
 
-def _build_participants_dataframe(
-    participants_report: ParticipantsReport,
-) -> pd.DataFrame:
-    rows: list[dict[str, object]] = []
-    for participant in participants_report.participants:
-        is_channel = (participant.user_id or '').startswith('channel') or any(
-            pt.value == 'channel' for pt in participant.seen_as
-        )
+def _participant_row(participant: Participant) -> ExportRow:
+    is_channel = (participant.user_id or '').startswith('channel') or any(
+        pt.value == 'channel' for pt in participant.seen_as
+    )
+
+    return [
+        (
+            normalize_username(participant.username)
+            if participant.username
+            else None
+        ),
+        participant.full_name,
+        participant.about,
+        (
+            participant.registered_at.date().isoformat()
+            if participant.registered_at is not None
+            else None
+        ),
+        'Да' if is_channel else 'Нет',
+    ]
+
+
+def _build_participant_rows(
+    participants: Iterable[Participant],
+) -> Iterator[ExportRow]:
+    for participant in participants:
+        yield _participant_row(participant)
+
+
+def participant_rows(
+    participants: Iterable[Participant],
+) -> Iterator[SourcedRow]:
+    for participant in participants:
+        yield _participant_row(participant), participant.sources
+
+
+def _bold_row(worksheet: Any, values: Iterable[str]) -> list[Any]:
+    from openpyxl.cell import WriteOnlyCell  # noqa: PLC0415
+    from openpyxl.styles import Font  # noqa: PLC0415
+
+    row = []
+    for value in values:
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.font = Font(bold=True)
+        row.append(cell)
+    return row
+
+
+def export_participants_excel(
+    participants: Iterable[Participant],
+    file_path: ExportTarget,
+    *,
+    exported_at: datetime | None,
+    source_names: Sequence[str] = (),
+) -> None:
+    write_rows_excel(
+        participant_rows(participants),
+        file_path,
+        exported_at=exported_at,
+        source_names=source_names,
+    )
+
+
+def write_rows_excel(
+    rows: Iterable[SourcedRow],
+    file_path: ExportTarget,
+    *,
+    exported_at: datetime | None,
+    source_names: Sequence[str] = (),
+    overlap_sheet: bool = True,
+) -> None:
+    # openpyxl импортируется лениво: он нужен только при выгрузке
+    from openpyxl import Workbook  # noqa: PLC0415
+
+    # Режим write_only не держит строки в памяти, поэтому участников
+    # можно отдавать потоком. Листы пишутся параллельно за один проход
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Sheet1')
+    worksheet.append(['Дата экспорта', _export_date(exported_at)])
+    worksheet.append(_bold_row(worksheet, EXPORT_COLUMNS))
+
+    # Отчет по пересечениям нужен, только если файлов несколько
+    if len(source_names) < 2:  # noqa: PLR2004
+        for row, _ in rows:
+            worksheet.append(row)
+        workbook.save(file_path)
+        return
+
+    overlap = OverlapCounter(len(source_names))
+    in_all_sheet = workbook.create_sheet('Во всех чатах')
+    in_all_sheet.append(_bold_row(in_all_sheet, EXPORT_COLUMNS))
+    only_one_sheet = workbook.create_sheet('Только в одном чате')
+    only_one_sheet.append(_bold_row(only_one_sheet, ['Чат', *EXPORT_COLUMNS]))
+
+    for row, sources in rows:
+        worksheet.append(row)
+
+        overlap.add(sources)
+        if overlap.in_all(sources):
+            in_all_sheet.append(row)
+        source = overlap.only_source(sources)
+        if source is not None:
+            only_one_sheet.append([source_names[source], *row])
 
-        rows.append(
-            {
-                'Username': _normalize_username(participant.username),
-                'Имя и фамилия': participant.full_name,
-                'Описание': participant.about,
-                'Дата регистрации': (
-                    participant.registered_at.date().isoformat()
-                    if participant.registered_at is not None
-                    else None
-                ),
-                'Наличие канала в профиле': 'Да' if is_channel else 'Нет',
-            }
+    # Части большой выгрузки видят только свои строки, сводку по всем
+    # участникам пишет write_overlap_excel
+    if overlap_sheet:
+        _write_overlap_sheet(
+            workbook.create_sheet('Пересечения'),
+            overlap,
+            source_names=source_names,
         )
+    workbook.save(file_path)
 
-    return pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+
+def write_overlap_excel(
+    overlap: OverlapCounter,
+    file_path: ExportTarget,
+    *,
+    source_names: Sequence[str],
+) -> None:
+    from openpyxl import Workbook  # noqa: PLC0415
+
+    workbook = Workbook(write_only=True)
+    _write_overlap_sheet(
+        workbook.create_sheet('Пересечения'),
+        overlap,
+        source_names=source_names,
+    )
+    workbook.save(file_path)
+
+
+def _write_overlap_sheet(
+    worksheet: Any,
+    overlap: OverlapCounter,
+    *,
+    source_names: Sequence[str],
+) -> None:
+    worksheet.append(['Во всех чатах', overlap.in_all_count])
+    worksheet.append([])
+
+    worksheet.append(_bold_row(worksheet, ['Чат', 'Только в этом чате']))
+    for name, count in zip(source_names, overlap.only_counts(), strict=True):
+        worksheet.append([name, count])
+    worksheet.append([])
+
+    # Попарные пересечения, на диагонали - всего участников в чате
+    worksheet.append(_bold_row(worksheet, ['Пересечения', *source_names]))
+    for name, row in zip(source_names, overlap.matrix(), strict=True):
+        worksheet.append([name, *row])
 
 
 def export_excel(
     participants_report: ParticipantsReport,
-    file_path: str,
+    file_path: ExportTarget,
 ) -> None:
-    export_date = (
-        participants_report.exported_at.date().isoformat()
-        if participants_report.exported_at
-        else ''
+    export_participants_excel(
+        participants_report.participants,
+        file_path,
+        exported_at=participants_report.exported_at,
     )
 
-    df = _build_participants_dataframe(participants_report)
 
-    with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, startrow=1)
+def _write_csv(
+    rows: Iterable[ExportRow],
+    f: TextIO,
+    *,
+    exported_at: datetime | None,
+    sep: str,
+) -> None:
+    f.write(f'Дата экспорта{sep}{_export_date(exported_at)}\n')
+    writer = csv.writer(f, delimiter=sep, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(rows)
+
+
+def export_participants_csv(
+    participants: Iterable[Participant],
+    file_path: ExportTarget,
+    *,
+    exported_at: datetime | None,
+    encoding: str = 'utf-8',
+    sep: str = ',',
+) -> None:
+    if isinstance(file_path, str | Path):
+        with open(file_path, 'w', encoding=encoding, newline='') as f:
+            _write_csv(
+                _build_participant_rows(participants),
+                f,
+                exported_at=exported_at,
+                sep=sep,
+            )
+        return
+
+    text_stream = io.TextIOWrapper(file_path, encoding=encoding, newline='')
+    try:
+        _write_csv(
+            _build_participant_rows(participants),
+            text_stream,
+            exported_at=exported_at,
+            sep=sep,
+        )
+        text_stream.flush()
+    finally:
+        # Поток закрывает вызывающий код
+        text_stream.detach()
+
 
-        worksheet = next(iter(writer.sheets.values()))
-        worksheet.cell(row=1, column=1).value = 'Дата экспорта'
-        worksheet.cell(row=1, column=2).value = export_date
+def write_rows_csv_gz(
+    rows: Iterable[SourcedRow],
+    file_path: ExportTarget,
+    *,
+    exported_at: datetime | None,
+) -> None:
+    # mtime=0: одинаковые строки дают побайтно одинаковый архив
+    gz = (
+        gzip.GzipFile(file_path, 'wb', mtime=0)
+        if isinstance(file_path, str | Path)
+        else gzip.GzipFile(fileobj=file_path, mode='wb', mtime=0)
+    )
+    # Закрытие обертки закрывает gzip, но не переданный поток
+    with io.TextIOWrapper(gz, encoding='utf-8', newline='') as f:
+        _write_csv(
+            (row for row, _ in rows),
+            f,
+            exported_at=exported_at,
+            sep=',',
+        )
 
 
 def export_csv(
     participants_report: ParticipantsReport,
-    file_path: str,
+    file_path: ExportTarget,
     *,
     encoding: str = 'utf-8',
     sep: str = ',',
 ) -> None:
-    export_date = (
-        participants_report.exported_at.date().isoformat()
-        if participants_report.exported_at
-        else ''
+    export_participants_csv(
+        participants_report.participants,
+        file_path,
+        exported_at=participants_report.exported_at,
+        encoding=encoding,
+        sep=sep,
     )
-
-    df = _build_participants_dataframe(participants_report)
-
-    with open(file_path, 'w', encoding=encoding, newline='') as f:
-        f.write(f'Дата экспорта{sep}{export_date}\n')
-        df.to_csv(f, index=False, sep=sep)
@@ -0,0 +1,300 @@
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+import heapq
+import json
+from pathlib import Path
+import tempfile
+from types import TracebackType
+from typing import IO, Self
+import zlib
+
+from models.participants import (
+    Participant,
+    seen_as_from_mask,
+    seen_as_to_mask,
+)
+
+DEFAULT_SPILL_PARTITIONS = 64
+
+# Грубая оценка памяти на одну запись в словаре слияния без учета
+# длины строк: ключ, список полей, слоты словаря
+_ENTRY_OVERHEAD_BYTES = 320
+
+
+@dataclass(slots=True)
+class _MergeEntry:
+    # порядковый номер первого появления ключа
+    ordinal: int
+    user_id: str | None
+    username: str | None
+    full_name: str | None
+    seen_as_mask: int
+    sources: int
+
+    def dump(self, key: str) -> str:
+        return json.dumps(
+            [
+                key,
+                self.ordinal,
+                self.user_id,
+                self.username,
+                self.full_name,
+                self.seen_as_mask,
+                self.sources,
+            ],
+            ensure_ascii=False,
+        )
+
+    @classmethod
+    def load(cls, line: str) -> tuple[str, Self]:
+        key, ordinal, user_id, username, full_name, mask, sources = json.loads(
+            line
+        )
+        return key, cls(ordinal, user_id, username, full_name, mask, sources)
+
+    def to_participant(self) -> Participant:
+        return Participant(
+            user_id=self.user_id,
+            username=self.username,
+            full_name=self.full_name,
+            seen_as=seen_as_from_mask(self.seen_as_mask),
+            sources=self.sources,
+        )
+
+
+def normalize_username(username: str) -> str:
+    username = username.strip()
+    return username if username.startswith('@') else f'@{username}'
+
+
+def participant_merge_key(participant: Participant) -> str | None:
+    if participant.user_id:
+        return f'id:{participant.user_id}'
+    if participant.username:
+        return f'un:{normalize_username(participant.username).casefold()}'
+    if participant.full_name:
+        return f'nm:{participant.full_name.strip().casefold()}'
+    return None
+
+
+def _entry_size(key: str, participant: Participant) -> int:
+    return (
+        _ENTRY_OVERHEAD_BYTES
+        + len(key)
+        + len(participant.user_id or '')
+        + len(participant.username or '')
+        + len(participant.full_name or '')
+    )
+
+
+def _merge_entry(
+    merged: dict[str, _MergeEntry],
+    key: str,
+    entry: _MergeEntry,
+) -> None:
+    current = merged.get(key)
+    if current is None:
+        merged[key] = entry
+        return
+    # Поля берутся из самого раннего появления, роли и файлы объединяются
+    if entry.ordinal < current.ordinal:
+        entry.seen_as_mask |= current.seen_as_mask
+        entry.sources |= current.sources
+        merged[key] = entry
+    else:
+        current.seen_as_mask |= entry.seen_as_mask
+        current.sources |= entry.sources
+
+
+def _item_ordinal(item: tuple[str, _MergeEntry]) -> int:
+    return item[1].ordinal
+
+
+def _read_merged(path: Path) -> Iterator[Participant]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield _MergeEntry.load(line)[1].to_participant()
+
+
+# Пока записи помещаются в memory_budget, слияние идет в словаре, как
+# в merge_participants. При превышении бюджета записи раскладываются по
+# хешу ключа в файлы-партиции на диске, и в конце каждая партиция
+# сливается отдельно. Результат идентичен merge_participants,
+# включая порядок: участники идут в порядке первого появления
+class ParticipantsMerger:
+    def __init__(
+        self,
+        *,
+        memory_budget: int | None = None,
+        partitions: int = DEFAULT_SPILL_PARTITIONS,
+        spill_dir: str | Path | None = None,
+    ) -> None:
+        self._memory_budget = memory_budget
+        self._partitions = partitions
+        self._spill_dir = spill_dir
+
+        self._entries: dict[str, _MergeEntry] = {}
+        self._memory_used = 0
+        self._next_ordinal = 0
+        self._sources = 0
+
+        self._tmpdir: tempfile.TemporaryDirectory[str] | None = None
+        self._partition_files: list[IO[str]] = []
+
+    @property
+    def spilled(self) -> bool:
+        return self._tmpdir is not None
+
+    @property
+    def sources(self) -> int:
+        return self._sources
+
+    # Каждый вызов add - отдельный исходный файл, как отдельный список
+    # в merge_participants. source - номер уже добавленного источника,
+    # если файл дополняет этот источник, например еще одна выгрузка чата
+    def add(
+        self,
+        participants: Iterable[Participant],
+        *,
+        source: int | None = None,
+    ) -> None:
+        if source is None:
+            source = self._sources
+            self._sources += 1
+        elif not 0 <= source < self._sources:
+            raise ValueError(f'Unknown source: {source}')
+        source_bit = 1 << source
+
+        for participant in participants:
+            key = participant_merge_key(participant)
+            if key is None:
+                continue
+
+            mask = seen_as_to_mask(participant.seen_as)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.seen_as_mask |= mask
+                entry.sources |= source_bit
+                continue
+
+            self._entries[key] = _MergeEntry(
+                ordinal=self._next_ordinal,
+                user_id=participant.user_id,
+                username=participant.username,
+                full_name=participant.full_name,
+                seen_as_mask=mask,
+                sources=source_bit,
+            )
+            self._next_ordinal += 1
+            self._memory_used += _entry_size(key, participant)
+
+            if (
+                self._memory_budget is not None
+                and self._memory_used > self._memory_budget
+            ):
+                self._spill()
+
+    def __iter__(self) -> Iterator[Participant]:
+        if not self.spilled:
+            for entry in self._entries.values():
+                yield entry.to_participant()
+            return
+
+        merged_path = self._partition_dir() / 'merged.jsonl'
+        if merged_path.exists():
+            yield from _read_merged(merged_path)
+            return
+
+        # Первый полный проход сливает партиции и попутно пишет
+        # результат в один файл: следующие проходы читают этот файл
+        self._spill()
+        tmp_path = merged_path.with_suffix('.tmp')
+        runs = [self._merge_partition(i) for i in range(self._partitions)]
+        with open(tmp_path, 'w', encoding='utf-8') as merged:
+            for key, entry in heapq.merge(*runs, key=_item_ordinal):
+                merged.write(entry.dump(key) + '\n')
+                yield entry.to_participant()
+        tmp_path.replace(merged_path)
+        for i in range(self._partitions):
+            (merged_path.parent / f'partition-{i}.jsonl').unlink()
+            (merged_path.parent / f'run-{i}.jsonl').unlink()
+
+    def _partition_dir(self) -> Path:
+        if self._tmpdir is None:
+            self._tmpdir = tempfile.TemporaryDirectory(
+                prefix='participants-merge-',
+                dir=self._spill_dir,
+            )
+        return Path(self._tmpdir.name)
+
+    def _spill(self) -> None:
+        spill_dir = self._partition_dir()
+        if not self._partition_files:
+            self._partition_files = [
+                open(  # noqa: SIM115
+                    spill_dir / f'partition-{i}.jsonl',
+                    'w',
+                    encoding='utf-8',
+                )
+                for i in range(self._partitions)
+            ]
+
+        for key, entry in self._entries.items():
+            partition = zlib.crc32(key.encode()) % self._partitions
+            self._partition_files[partition].write(entry.dump(key) + '\n')
+
+        self._entries = {}
+        self._memory_used = 0
+
+    def _merge_partition(
+        self,
+        partition: int,
+    ) -> Iterator[tuple[str, _MergeEntry]]:
+        spill_dir = self._partition_dir()
+        self._partition_files[partition].close()
+
+        merged: dict[str, _MergeEntry] = {}
+        with open(
+            spill_dir / f'partition-{partition}.jsonl',
+            encoding='utf-8',
+        ) as f:
+            for line in f:
+                _merge_entry(merged, *_MergeEntry.load(line))
+
+        # Слитая партиция сортируется по порядку первого появления и
+        # пишется обратно, чтобы в памяти была только одна партиция
+        run_path = spill_dir / f'run-{partition}.jsonl'
+        with open(run_path, 'w', encoding='utf-8') as f:
+            for key, entry in sorted(
+                merged.items(),
+                key=lambda item: item[1].ordinal,
+            ):
+                f.write(entry.dump(key) + '\n')
+        del merged
+
+        def read_run() -> Iterator[tuple[str, _MergeEntry]]:
+            with open(run_path, encoding='utf-8') as f:
+                for line in f:
+                    yield _MergeEntry.load(line)
+
+        return read_run()
+
+    def close(self) -> None:
+        for f in self._partition_files:
+            f.close()
+        self._partition_files = []
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+        self._entries = {}
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -0,0 +1,55 @@
+from collections import Counter
+
+
+def source_indexes(sources: int) -> list[int]:
+    indexes = []
+    index = 0
+    while sources:
+        if sources & 1:
+            indexes.append(index)
+        sources >>= 1
+        index += 1
+    return indexes
+
+
+# Пересечения участников между исходными файлами. Вместо попарного
+# сравнения списков считаются маски файлов: участники, имеющие одну
+# маску, схлопываются в Counter, и матрица строится по различным
+# маскам, которых не больше числа участников
+class OverlapCounter:
+    def __init__(self, source_count: int) -> None:
+        self.source_count = source_count
+        self._all_sources = (1 << source_count) - 1
+        self._masks: Counter[int] = Counter()
+
+    def add(self, sources: int) -> None:
+        self._masks[sources] += 1
+
+    def in_all(self, sources: int) -> bool:
+        return sources == self._all_sources
+
+    @staticmethod
+    def only_source(sources: int) -> int | None:
+        # Ровно один установленный бит - участник только в одном файле
+        if sources and not sources & (sources - 1):
+            return sources.bit_length() - 1
+        return None
+
+    @property
+    def in_all_count(self) -> int:
+        return self._masks[self._all_sources]
+
+    def only_counts(self) -> list[int]:
+        return [self._masks[1 << i] for i in range(self.source_count)]
+
+    # matrix[i][j] - число участников, которые есть и в i-м, и в j-м
+    # файле. Диагональ - число участников файла
+    def matrix(self) -> list[list[int]]:
+        matrix = [[0] * self.source_count for _ in range(self.source_count)]
+        for sources, count in self._masks.items():
+            indexes = source_indexes(sources)
+            for i in indexes:
+                row = matrix[i]
+                for j in indexes:
+                    row[j] += count
+        return matrix
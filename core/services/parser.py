@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
 from datetime import datetime, timezone
 import json
 from pathlib import Path
@@ -7,14 +8,18 @@ from typing import Any, Protocol
 from models.participants import (
     Participant,
     ParticipantList,
+    ParticipantsFilter,
     ParticipantsReport,
     ParticipantType,
 )
 from models.telegram_message import (
+    SKIP_MENTIONS,
     TelegramComplexText,
     TelegramMessage,
     TelegramMessages,
 )
+from services.dedup import MessageDeduplicator
+from services.merge import participant_merge_key
 
 
 def is_deleted_account(full_name: str | None) -> bool:
@@ -27,24 +32,12 @@ def is_deleted_account(full_name: str | None) -> bool:
     }
 
 
-def _normalize_username(username: str) -> str:
-    username = username.strip()
-    return username if username.startswith('@') else f'@{username}'
-
-
 def merge_participants(participants: list[ParticipantList]) -> ParticipantList:
     merged_dict: dict[str, Participant] = {}
 
-    for part_list in participants:
+    for source, part_list in enumerate(participants):
         for participant in part_list:
-            key: str | None = None
-            if participant.user_id:
-                key = f'id:{participant.user_id}'
-            elif participant.username:
-                key = f'un:{_normalize_username(participant.username).casefold()}'  # noqa: E501
-            elif participant.full_name:
-                key = f'nm:{participant.full_name.strip().casefold()}'
-
+            key = participant_merge_key(participant)
             if not key:
                 continue
 
@@ -56,12 +49,21 @@ def merge_participants(participants: list[ParticipantList]) -> ParticipantList:
                     seen_as=set(),
                 )
             merged_dict[key].seen_as.update(participant.seen_as)
+            merged_dict[key].sources |= 1 << source
 
     return list(merged_dict.values())
 
 
-def parse_messages(export_json: dict[str, Any]) -> TelegramMessages:
-    return JsonTelegramParser().parse_obj(export_json)
+def parse_messages(
+    export_json: dict[str, Any],
+    *,
+    dedup: MessageDeduplicator | None = None,
+    participants_filter: ParticipantsFilter | None = None,
+) -> TelegramMessages:
+    return JsonTelegramParser(
+        dedup=dedup,
+        participants_filter=participants_filter,
+    ).parse_obj(export_json)
 
 
 def parse_participants_export(
@@ -71,8 +73,14 @@ def parse_participants_export(
     return ParticipantsExporter().export(messages)
 
 
-def export_participants(messages: TelegramMessages) -> ParticipantsReport:
-    return ParticipantsExporter().export(messages)
+def export_participants(
+    messages: TelegramMessages,
+    *,
+    participants_filter: ParticipantsFilter | None = None,
+) -> ParticipantsReport:
+    return ParticipantsExporter(
+        participants_filter=participants_filter,
+    ).export(messages)
 
 
 class TelegramParser(Protocol):
@@ -105,10 +113,75 @@ class BaseTelegramParser(ABC):
         return self.parse_bytes(data, encoding=encoding)
 
 
+def _message_predicate(
+    participants_filter: ParticipantsFilter,
+) -> Callable[[Any], bool]:
+    message_types = participants_filter.message_types
+    # Дата в выгрузке - строка ISO 8601, поэтому день сравнивается
+    # как строка, без разбора datetime
+    since, until = (
+        day.isoformat() if day is not None else None
+        for day in (participants_filter.since, participants_filter.until)
+    )
+
+    def accepts(msg: Any) -> bool:
+        if not isinstance(msg, dict):
+            return True
+        if message_types is not None and msg.get('type') not in message_types:
+            return False
+        sent_at = msg.get('date')
+        # Сообщения без даты окном не отсекаются
+        if not isinstance(sent_at, str):
+            return True
+        day = sent_at[:10]
+        return (since is None or day >= since) and (
+            until is None or day <= until
+        )
+
+    return accepts
+
+
 class JsonTelegramParser(BaseTelegramParser):
+    # dedup общий на все файлы одной обработки: повторы сообщений
+    # отбрасываются до построения моделей. Фильтр тоже работает
+    # по сырым словарям, ненужные роли не разбираются вовсе
+    def __init__(
+        self,
+        *,
+        dedup: MessageDeduplicator | None = None,
+        participants_filter: ParticipantsFilter | None = None,
+    ) -> None:
+        self._dedup = dedup
+        self._filter = participants_filter
+
     def parse_obj(self, export_json: dict[str, Any]) -> TelegramMessages:
         messages_data = export_json.get('messages', [])
-        return [TelegramMessage.model_validate(msg) for msg in messages_data]
+        context: dict[str, bool] | None = None
+        if self._filter is not None and not self._filter.is_empty:
+            messages_data = list(
+                filter(_message_predicate(self._filter), messages_data)
+            )
+            context = {
+                SKIP_MENTIONS: not self._filter.wants(ParticipantType.MENTION),
+            }
+            # Реакции - самая тяжелая часть сообщения, без роли они
+            # вырезаются из копии словаря до валидации
+            if not self._filter.wants(ParticipantType.REACTION):
+                messages_data = [
+                    {**msg, 'reactions': None}
+                    if isinstance(msg, dict) and msg.get('reactions')
+                    else msg
+                    for msg in messages_data
+                ]
+        if self._dedup is not None:
+            messages_data = self._dedup.filter(
+                export_json.get('id'),
+                messages_data,
+            )
+        return [
+            TelegramMessage.model_validate(msg, context=context)
+            for msg in messages_data
+        ]
 
     def parse_text(self, content: str) -> TelegramMessages:
         parsed: Any = json.loads(content)
@@ -119,7 +192,25 @@ class JsonTelegramParser(BaseTelegramParser):
         return self.parse_obj(parsed)
 
 
+def _mention_parts(msg: TelegramMessage) -> Iterator[TelegramComplexText]:
+    # Поле text_entities есть в новых выгрузках, text остается запасным
+    # вариантом для старых
+    if msg.text_entities is not None:
+        yield from msg.text_entities
+    elif isinstance(msg.text, list):
+        for part in msg.text:
+            if isinstance(part, TelegramComplexText):
+                yield part
+
+
 class ParticipantsExporter:
+    def __init__(
+        self,
+        *,
+        participants_filter: ParticipantsFilter | None = None,
+    ) -> None:
+        self._filter = participants_filter or ParticipantsFilter()
+
     @staticmethod
     def _is_channel(actor_id: str | None) -> bool:
         if not actor_id:
@@ -151,77 +242,109 @@ class ParticipantsExporter:
         else:
             participants_dict[key].seen_as.add(p_type)
 
+    @staticmethod
+    def _add_mentions(
+        participants_dict: dict[str, Participant],
+        msg: TelegramMessage,
+    ) -> None:
+        for part in _mention_parts(msg):
+            if part.type == 'mention_name':
+                ParticipantsExporter._add_participant(
+                    participants_dict,
+                    user_id=(
+                        f'user{part.user_id}'
+                        if part.user_id is not None
+                        else None
+                    ),
+                    username=None,
+                    full_name=part.text,
+                    p_type=ParticipantType.MENTION,
+                )
+            elif part.type == 'mention':
+                ParticipantsExporter._add_participant(
+                    participants_dict,
+                    user_id=None,
+                    username=part.text,
+                    full_name=None,
+                    p_type=ParticipantType.MENTION,
+                )
+
+    @staticmethod
+    def _add_reactions(
+        participants_dict: dict[str, Participant],
+        msg: TelegramMessage,
+    ) -> None:
+        if not msg.reactions:
+            return
+        for reaction in msg.reactions:
+            if not reaction.recent:
+                continue
+            for recent in reaction.recent:
+                ParticipantsExporter._add_participant(
+                    participants_dict,
+                    user_id=recent.actor_id,
+                    username=None,
+                    full_name=recent.actor,
+                    p_type=ParticipantType.REACTION,
+                )
+
     def export(self, messages: TelegramMessages) -> ParticipantsReport:
         participants_dict: dict[str, Participant] = {}
+        wants = self._filter.wants
+        # Роли, которые не запрошены, даже не просматриваются
+        want_authors = wants(ParticipantType.AUTHOR)
+        want_actors = wants(ParticipantType.ACTOR)
+        want_forwarded = wants(ParticipantType.FORWARDED_FROM)
+        want_mentions = wants(ParticipantType.MENTION)
+        want_reactions = wants(ParticipantType.REACTION)
 
         def handle_message(msg: TelegramMessage) -> None:
-            from_id_type = (
-                {ParticipantType.CHANNEL, ParticipantType.AUTHOR}
-                if ParticipantsExporter._is_channel(msg.from_id)
-                else ParticipantType.AUTHOR
-            )
-
-            self._add_participant(
-                participants_dict,
-                user_id=msg.from_id,
-                username=None,
-                full_name=msg.from_,
-                p_type=from_id_type,
-            )
+            if want_authors:
+                from_id_type = (
+                    {ParticipantType.CHANNEL, ParticipantType.AUTHOR}
+                    if ParticipantsExporter._is_channel(msg.from_id)
+                    else ParticipantType.AUTHOR
+                )
+                self._add_participant(
+                    participants_dict,
+                    user_id=msg.from_id,
+                    username=None,
+                    full_name=msg.from_,
+                    p_type=from_id_type,
+                )
 
-            actor_id_type = (
-                {ParticipantType.CHANNEL, ParticipantType.ACTOR}
-                if ParticipantsExporter._is_channel(msg.actor_id)
-                else ParticipantType.ACTOR
-            )
-            self._add_participant(
-                participants_dict,
-                user_id=msg.actor_id,
-                username=None,
-                full_name=msg.actor,
-                p_type=actor_id_type,
-            )
+            if want_actors:
+                actor_id_type = (
+                    {ParticipantType.CHANNEL, ParticipantType.ACTOR}
+                    if ParticipantsExporter._is_channel(msg.actor_id)
+                    else ParticipantType.ACTOR
+                )
+                self._add_participant(
+                    participants_dict,
+                    user_id=msg.actor_id,
+                    username=None,
+                    full_name=msg.actor,
+                    p_type=actor_id_type,
+                )
 
-            forwarded_id_type = (
-                {ParticipantType.CHANNEL, ParticipantType.FORWARDED_FROM}
-                if ParticipantsExporter._is_channel(msg.forwarded_from_id)
-                else ParticipantType.FORWARDED_FROM
-            )
-            self._add_participant(
-                participants_dict,
-                user_id=msg.forwarded_from_id,
-                username=None,
-                full_name=msg.forwarded_from,
-                p_type=forwarded_id_type,
-            )
+            if want_forwarded:
+                forwarded_id_type = (
+                    {ParticipantType.CHANNEL, ParticipantType.FORWARDED_FROM}
+                    if ParticipantsExporter._is_channel(msg.forwarded_from_id)
+                    else ParticipantType.FORWARDED_FROM
+                )
+                self._add_participant(
+                    participants_dict,
+                    user_id=msg.forwarded_from_id,
+                    username=None,
+                    full_name=msg.forwarded_from,
+                    p_type=forwarded_id_type,
+                )
 
-            if isinstance(msg.text, list):
-                for part in msg.text:
-                    if (
-                        isinstance(part, TelegramComplexText)
-                        and part.type == 'mention'
-                    ):
-                        ParticipantsExporter._add_participant(
-                            participants_dict,
-                            user_id=None,
-                            username=part.text,
-                            full_name=None,
-                            p_type=ParticipantType.MENTION,
-                        )
-
-            if not msg.reactions:
-                return
-            for reaction in msg.reactions:
-                if not reaction.recent:
-                    continue
-                for recent in reaction.recent:
-                    ParticipantsExporter._add_participant(
-                        participants_dict,
-                        user_id=recent.actor_id,
-                        username=None,
-                        full_name=recent.actor,
-                        p_type=ParticipantType.REACTION,
-                    )
+            if want_mentions:
+                self._add_mentions(participants_dict, msg)
+            if want_reactions:
+                self._add_reactions(participants_dict, msg)
 
         for msg in messages:
             handle_message(msg)
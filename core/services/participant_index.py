@@ -0,0 +1,170 @@
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+import itertools
+import os
+from pathlib import Path
+import re
+import sqlite3
+import threading
+
+from models.participants import (
+    Participant,
+    ParticipantType,
+    seen_as_from_mask,
+    seen_as_to_mask,
+)
+
+INGEST_BATCH_SIZE = 10_000
+
+_USER_ID_RE = re.compile(r'^(user|channel)\d+$')
+
+# Постинги кластеризованы по (participant_key, chat_id), поэтому поиск
+# по ключу - это один спуск по B-дереву и чтение соседних строк
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS postings (
+    participant_key TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    seen_as INTEGER NOT NULL,
+    PRIMARY KEY (participant_key, chat_id)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class ParticipantPosting:
+    chat_id: int
+    chat_title: str | None
+    seen_as: set[ParticipantType]
+
+
+def _user_id_key(user_id: str) -> str:
+    return f'id:{user_id.strip()}'
+
+
+def _username_key(username: str) -> str:
+    username = username.strip().removeprefix('@')
+    return f'un:@{username.casefold()}'
+
+
+def _participant_keys(participant: Participant) -> Iterator[str]:
+    if participant.user_id:
+        yield _user_id_key(participant.user_id)
+    if participant.username:
+        yield _username_key(participant.username)
+
+
+def participant_index_key(query: str) -> str | None:
+    query = query.strip()
+    if not query:
+        return None
+    if query.isdigit():
+        return _user_id_key(f'user{query}')
+    if _USER_ID_RE.match(query):
+        return _user_id_key(query)
+    return _username_key(query)
+
+
+class ParticipantIndex:
+    def __init__(self, path: str | Path) -> None:
+        self._path = Path(path)
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._connection_pid: int | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Индекс может быть создан до fork воркеров webhook-сервера,
+        # поэтому соединение открывается отдельно в каждом процессе
+        pid = os.getpid()
+        if self._connection is not None and self._connection_pid == pid:
+            return self._connection
+
+        connection = sqlite3.connect(
+            self._path,
+            timeout=30,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(_SCHEMA)
+
+        self._connection = connection
+        self._connection_pid = pid
+        return connection
+
+    def ingest(
+        self,
+        chat_id: int,
+        chat_title: str | None,
+        participants: Iterable[Participant],
+    ) -> int:
+        postings = (
+            (key, chat_id, seen_as_to_mask(participant.seen_as))
+            for participant in participants
+            for key in _participant_keys(participant)
+        )
+
+        count = 0
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    'INSERT INTO chats (chat_id, title) VALUES (?, ?) '
+                    'ON CONFLICT(chat_id) DO UPDATE SET '
+                    'title = coalesce(excluded.title, title)',
+                    (chat_id, chat_title),
+                )
+                for batch in itertools.batched(
+                    postings, INGEST_BATCH_SIZE, strict=False
+                ):
+                    connection.executemany(
+                        'INSERT INTO postings '
+                        '(participant_key, chat_id, seen_as) '
+                        'VALUES (?, ?, ?) '
+                        'ON CONFLICT(participant_key, chat_id) DO UPDATE '
+                        'SET seen_as = seen_as | excluded.seen_as',
+                        batch,
+                    )
+                    count += len(batch)
+        return count
+
+    def find(self, query: str) -> list[ParticipantPosting]:
+        key = participant_index_key(query)
+        if key is None:
+            return []
+
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    'SELECT p.chat_id, c.title, p.seen_as '
+                    'FROM postings AS p '
+                    'LEFT JOIN chats AS c ON c.chat_id = p.chat_id '
+                    'WHERE p.participant_key = ? '
+                    'ORDER BY p.chat_id',
+                    (key,),
+                )
+                .fetchall()
+            )
+
+        return [
+            ParticipantPosting(
+                chat_id=chat_id,
+                chat_title=title,
+                seen_as=seen_as_from_mask(mask),
+            )
+            for chat_id, title, mask in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            if (
+                self._connection is not None
+                and self._connection_pid == os.getpid()
+            ):
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
@@ -0,0 +1,221 @@
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
+from datetime import datetime
+import enum
+import multiprocessing
+import os
+from pathlib import Path
+import threading
+import zipfile
+
+from models.participants import Participant
+from services.export import (
+    ExportTarget,
+    participant_rows,
+    SourcedRow,
+    write_overlap_excel,
+    write_rows_csv_gz,
+    write_rows_excel,
+)
+from services.overlap import OverlapCounter
+
+SHARD_POOL_WORKERS = os.process_cpu_count() or 1
+
+
+class ExportFormat(enum.StrEnum):
+    XLSX = 'xlsx'
+    CSV_GZ = 'csv.gz'
+
+
+def _estimated_row_size(row: SourcedRow) -> int:
+    cells, _ = row
+    # Разделители и разметка ячеек считаются одним байтом на ячейку
+    return sum(len(cell) for cell in cells if cell) + len(cells)
+
+
+# Режет поток участников на части не больше max_rows строк и примерно
+# max_bytes текста. Память занимает только текущая часть
+def iter_shards(
+    participants: Iterable[Participant],
+    *,
+    max_rows: int,
+    max_bytes: int,
+) -> Iterator[list[SourcedRow]]:
+    shard: list[SourcedRow] = []
+    shard_bytes = 0
+    for row in participant_rows(participants):
+        shard.append(row)
+        shard_bytes += _estimated_row_size(row)
+        if len(shard) >= max_rows or shard_bytes >= max_bytes:
+            yield shard
+            shard = []
+            shard_bytes = 0
+    if shard:
+        yield shard
+
+
+def write_export(  # noqa: PLR0913
+    rows: Iterable[SourcedRow],
+    file_path: ExportTarget,
+    *,
+    export_format: ExportFormat,
+    exported_at: datetime | None,
+    source_names: Sequence[str] = (),
+    overlap_sheet: bool = True,
+) -> None:
+    if export_format is ExportFormat.CSV_GZ:
+        # CSV - одна таблица, отчета по пересечениям там нет
+        write_rows_csv_gz(rows, file_path, exported_at=exported_at)
+        return
+    write_rows_excel(
+        rows,
+        file_path,
+        exported_at=exported_at,
+        source_names=source_names,
+        overlap_sheet=overlap_sheet,
+    )
+
+
+def _write_shard(
+    file_path: Path,
+    rows: list[SourcedRow],
+    export_format: ExportFormat,
+    exported_at: datetime | None,
+    source_names: Sequence[str],
+) -> Path:
+    write_export(
+        rows,
+        file_path,
+        export_format=export_format,
+        exported_at=exported_at,
+        source_names=source_names,
+        overlap_sheet=False,
+    )
+    return file_path
+
+
+# Один пул процессов на процесс бота: одновременные обработки делят
+# общие воркеры и не запускают каждая свой пул. Пул создается при
+# первой записи и заново после fork воркеров webhook-сервера или
+# падения процесса пула
+class _ShardPool:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._pid: int | None = None
+
+    def get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # forkserver: fork процесса, где работают потоки и цикл
+                # событий, небезопасен
+                self._pool = ProcessPoolExecutor(
+                    max_workers=SHARD_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def discard(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Задачи одной выгрузки. Пул переживает выгрузку, поэтому при
+    # ошибке незаписанные части отменяются, начатые дописываются до
+    # выхода, пока каталог еще существует
+    @contextlib.contextmanager
+    def tasks(
+        self,
+    ) -> Iterator[tuple[ProcessPoolExecutor, set[Future[Path]]]]:
+        pool = self.get()
+        pending: set[Future[Path]] = set()
+        try:
+            yield pool, pending
+        except BrokenProcessPool:
+            self.discard(pool)
+            raise
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            raise
+
+
+_shard_pool = _ShardPool()
+
+
+# Пишет части в отдельных процессах: openpyxl и gzip нагружают
+# процессор, потокам мешает GIL. Возвращает файлы в порядке частей,
+# для xlsx из нескольких чатов последним идет сводка по пересечениям
+def write_shards(  # noqa: PLR0913
+    shards: Iterable[list[SourcedRow]],
+    directory: Path,
+    *,
+    basename: str,
+    export_format: ExportFormat,
+    exported_at: datetime | None,
+    source_names: Sequence[str] = (),
+    max_workers: int | None = None,
+) -> list[Path]:
+    # Сколько частей этой выгрузки пишется одновременно, не больше
+    # процессов общего пула
+    max_workers = min(max_workers or SHARD_POOL_WORKERS, SHARD_POOL_WORKERS)
+    overlap = None
+    multiple_sources = len(source_names) >= 2  # noqa: PLR2004
+    if export_format is ExportFormat.XLSX and multiple_sources:
+        overlap = OverlapCounter(len(source_names))
+
+    paths: list[Path] = []
+    with _shard_pool.tasks() as (pool, pending):
+        for number, shard in enumerate(shards, start=1):
+            if overlap is not None:
+                for _, sources in shard:
+                    overlap.add(sources)
+
+            # Записи ждут максимум две части на процесс, следующие
+            # пока не прочитаны из слияния
+            if len(pending) >= 2 * max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(done)
+                for future in done:
+                    future.result()
+
+            path = directory / f'{basename}_part{number}.{export_format}'
+            pending.add(
+                pool.submit(
+                    _write_shard,
+                    path,
+                    shard,
+                    export_format,
+                    exported_at,
+                    source_names,
+                )
+            )
+            paths.append(path)
+
+        for future in pending:
+            future.result()
+
+    if overlap is not None:
+        overlap_path = directory / f'{basename}_overlap.xlsx'
+        write_overlap_excel(overlap, overlap_path, source_names=source_names)
+        paths.append(overlap_path)
+    return paths
+
+
+# xlsx и gzip уже сжаты, повторное сжатие в zip только тратит время.
+# Возвращает размер архива
+def pack_shards(paths: Sequence[Path], archive_path: Path) -> int:
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_STORED) as archive:
+        for path in paths:
+            archive.write(path, arcname=path.name)
+    return archive_path.stat().st_size
@@ -0,0 +1,391 @@
+from collections.abc import Iterable, Iterator, Sequence
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime
+import enum
+import gzip
+import heapq
+import io
+import itertools
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+from typing import BinaryIO, Self
+
+from models.participants import (
+    Participant,
+    seen_as_from_mask,
+    seen_as_to_mask,
+)
+from services.merge import participant_merge_key
+
+SNAPSHOT_SUFFIX = '.jsonl.gz'
+DEFAULT_KEEP_SNAPSHOTS = 10
+# Столько записей сортируется в памяти, более крупные наборы
+# сливаются из отсортированных временных файлов
+SNAPSHOT_SORT_RUN_SIZE = 200_000
+
+_SAFE_NAME_RE = re.compile(r'[^0-9A-Za-z_+-]')
+# Один кодировщик на все строки: json.dumps при заданных параметрах
+# создает новый кодировщик на каждый вызов
+_encode_json = json.JSONEncoder(
+    ensure_ascii=False,
+    separators=(',', ':'),
+).encode
+
+
+@dataclass(frozen=True, slots=True)
+class SnapshotEntry:
+    key: str
+    user_id: str | None
+    username: str | None
+    full_name: str | None
+    seen_as_mask: int
+
+    def dump(self) -> str:
+        return _encode_json(
+            [
+                self.key,
+                self.user_id,
+                self.username,
+                self.full_name,
+                self.seen_as_mask,
+            ],
+        )
+
+    @classmethod
+    def load(cls, line: str) -> Self:
+        return cls(*json.loads(line))
+
+    def to_participant(self) -> Participant:
+        return Participant(
+            user_id=self.user_id,
+            username=self.username,
+            full_name=self.full_name,
+            seen_as=seen_as_from_mask(self.seen_as_mask),
+        )
+
+
+def _entry_key(entry: SnapshotEntry) -> str:
+    return entry.key
+
+
+def _snapshot_entries(
+    participants: Iterable[Participant],
+) -> Iterator[SnapshotEntry]:
+    for participant in participants:
+        key = participant_merge_key(participant)
+        if key is None:
+            continue
+        yield SnapshotEntry(
+            key=key,
+            user_id=participant.user_id,
+            username=participant.username,
+            full_name=participant.full_name,
+            seen_as_mask=seen_as_to_mask(participant.seen_as),
+        )
+
+
+def _unique_keys(entries: Iterable[SnapshotEntry]) -> Iterator[SnapshotEntry]:
+    # Одинаковые ключи после сортировки стоят рядом, их роли
+    # объединяются, поля берутся из первой записи
+    for key, group in itertools.groupby(entries, key=_entry_key):
+        first, *rest = group
+        mask = first.seen_as_mask
+        for entry in rest:
+            mask |= entry.seen_as_mask
+        yield SnapshotEntry(
+            key=key,
+            user_id=first.user_id,
+            username=first.username,
+            full_name=first.full_name,
+            seen_as_mask=mask,
+        )
+
+
+def _read_lines(path: Path) -> Iterator[SnapshotEntry]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield SnapshotEntry.load(line)
+
+
+def read_snapshot(path: Path) -> Iterator[SnapshotEntry]:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield SnapshotEntry.load(line)
+
+
+# Снимок - gzip-файл, строки JSON в нем отсортированы по ключу участника.
+# Большие наборы сортируются внешней сортировкой: куски по run_size
+# записей сортируются в памяти, пишутся во временные файлы и сливаются
+# через heapq.merge. Возвращает число записей
+def write_snapshot(
+    participants: Iterable[Participant],
+    path: Path,
+    *,
+    run_size: int = SNAPSHOT_SORT_RUN_SIZE,
+) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+
+    with tempfile.TemporaryDirectory(
+        prefix='snapshot-sort-',
+        dir=path.parent,
+    ) as sort_dir:
+        batches = itertools.batched(
+            _snapshot_entries(participants),
+            run_size,
+            strict=False,
+        )
+        first = sorted(next(batches, ()), key=_entry_key)
+        runs: list[Iterable[SnapshotEntry]] = [first]
+
+        for number, batch in enumerate(batches):
+            if number == 0:
+                runs = [_write_run(first, Path(sort_dir) / 'run-0.jsonl')]
+            runs.append(
+                _write_run(
+                    sorted(batch, key=_entry_key),
+                    Path(sort_dir) / f'run-{number + 1}.jsonl',
+                )
+            )
+
+        count = 0
+        # mtime=0: содержимое файла не зависит от времени записи
+        with (
+            gzip.GzipFile(tmp_path, 'wb', mtime=0) as gz,
+            io.TextIOWrapper(gz, encoding='utf-8') as f,
+        ):
+            for entry in _unique_keys(heapq.merge(*runs, key=_entry_key)):
+                f.write(entry.dump() + '\n')
+                count += 1
+
+    # Читатель видит либо старый, либо полностью записанный снимок
+    os.replace(tmp_path, path)
+    return count
+
+
+def _write_run(
+    entries: Iterable[SnapshotEntry],
+    path: Path,
+) -> Iterator[SnapshotEntry]:
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(entry.dump() + '\n')
+    return _read_lines(path)
+
+
+class ChangeKind(enum.StrEnum):
+    ADDED = 'added'
+    REMOVED = 'removed'
+    CHANGED = 'changed'
+
+
+@dataclass(frozen=True, slots=True)
+class SnapshotChange:
+    kind: ChangeKind
+    old: SnapshotEntry | None
+    new: SnapshotEntry | None
+
+
+# Сравнение двух снимков слиянием: файлы читаются потоком за один
+# проход, время линейное, память не зависит от размера снимков.
+# Одинаковые строки - неизменный участник, их разбор не нужен
+def diff_snapshots(old_path: Path, new_path: Path) -> Iterator[SnapshotChange]:
+    with (
+        gzip.open(old_path, 'rt', encoding='utf-8') as old_f,
+        gzip.open(new_path, 'rt', encoding='utf-8') as new_f,
+    ):
+        old_line, new_line = old_f.readline(), new_f.readline()
+        old_entry: SnapshotEntry | None = None
+        new_entry: SnapshotEntry | None = None
+
+        while old_line and new_line:
+            if old_line == new_line:
+                old_line, new_line = old_f.readline(), new_f.readline()
+                old_entry = new_entry = None
+                continue
+
+            old_entry = old_entry or SnapshotEntry.load(old_line)
+            new_entry = new_entry or SnapshotEntry.load(new_line)
+            if old_entry.key < new_entry.key:
+                yield SnapshotChange(ChangeKind.REMOVED, old_entry, None)
+                old_line, old_entry = old_f.readline(), None
+            elif old_entry.key > new_entry.key:
+                yield SnapshotChange(ChangeKind.ADDED, None, new_entry)
+                new_line, new_entry = new_f.readline(), None
+            else:
+                if old_entry != new_entry:
+                    yield SnapshotChange(
+                        ChangeKind.CHANGED,
+                        old_entry,
+                        new_entry,
+                    )
+                old_line, new_line = old_f.readline(), new_f.readline()
+                old_entry = new_entry = None
+
+        while old_line:
+            yield SnapshotChange(
+                ChangeKind.REMOVED,
+                SnapshotEntry.load(old_line),
+                None,
+            )
+            old_line = old_f.readline()
+        while new_line:
+            yield SnapshotChange(
+                ChangeKind.ADDED,
+                None,
+                SnapshotEntry.load(new_line),
+            )
+            new_line = new_f.readline()
+
+
+@dataclass(slots=True)
+class DiffSummary:
+    added: int = 0
+    removed: int = 0
+    changed: int = 0
+    # Первые изменения для показа в чате
+    sample: list[SnapshotChange] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.added + self.removed + self.changed
+
+
+DIFF_COLUMNS = [
+    'Изменение',
+    'Username',
+    'Имя и фамилия',
+    'ID',
+    'Роли до',
+    'Роли после',
+]
+
+
+def _roles(entry: SnapshotEntry | None) -> str:
+    if entry is None:
+        return ''
+    return ', '.join(sorted(seen_as_from_mask(entry.seen_as_mask)))
+
+
+# Пишет все изменения в CSV и возвращает их сводку
+def write_diff_csv(
+    changes: Iterable[SnapshotChange],
+    file: BinaryIO,
+    *,
+    sample_size: int,
+) -> DiffSummary:
+    summary = DiffSummary()
+    text_stream = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    try:
+        writer = csv.writer(text_stream, lineterminator='\n')
+        writer.writerow(DIFF_COLUMNS)
+        for change in changes:
+            if change.kind is ChangeKind.ADDED:
+                summary.added += 1
+            elif change.kind is ChangeKind.REMOVED:
+                summary.removed += 1
+            else:
+                summary.changed += 1
+            if len(summary.sample) < sample_size:
+                summary.sample.append(change)
+
+            current = change.new or change.old
+            assert current is not None
+            writer.writerow(
+                [
+                    change.kind.value,
+                    current.username,
+                    current.full_name,
+                    current.user_id,
+                    _roles(change.old),
+                    _roles(change.new),
+                ]
+            )
+        text_stream.flush()
+    finally:
+        # Поток закрывает вызывающий код
+        text_stream.detach()
+    return summary
+
+
+def _safe_name(value: str) -> str:
+    return _SAFE_NAME_RE.sub('_', value)
+
+
+# Снимки участников по чатам: <root>/<владелец>/<чат>/<время>.jsonl.gz.
+# Владелец - чат пользователя и бота, чтобы пользователь сравнивал только свои
+# выгрузки. Хранятся последние keep снимков каждого чата
+class SnapshotStore:
+    def __init__(
+        self,
+        root: str | Path,
+        *,
+        keep: int = DEFAULT_KEEP_SNAPSHOTS,
+    ) -> None:
+        self._root = Path(root)
+        self._keep = max(2, keep)
+
+    def _chat_dir(self, owner: int, chat_key: str) -> Path:
+        return self._root / str(owner) / _safe_name(chat_key)
+
+    def save(
+        self,
+        owner: int,
+        chat_key: str,
+        participants: Iterable[Participant],
+        *,
+        taken_at: datetime,
+    ) -> Path:
+        chat_dir = self._chat_dir(owner, chat_key)
+        path = chat_dir / (
+            f'{taken_at.strftime("%Y%m%dT%H%M%S%f")}{SNAPSHOT_SUFFIX}'
+        )
+        write_snapshot(participants, path)
+
+        for stale in self.snapshots(owner, chat_key)[: -self._keep]:
+            stale.unlink(missing_ok=True)
+        return path
+
+    # Снимки чата от старых к новым: имя файла - время снимка
+    def snapshots(self, owner: int, chat_key: str) -> list[Path]:
+        chat_dir = self._chat_dir(owner, chat_key)
+        if not chat_dir.is_dir():
+            return []
+        return sorted(chat_dir.glob(f'*{SNAPSHOT_SUFFIX}'))
+
+    # Чат, снимок которого сохранен последним
+    def latest_chat_key(self, owner: int) -> str | None:
+        owner_dir = self._root / str(owner)
+        if not owner_dir.is_dir():
+            return None
+        latest: tuple[str, str] | None = None
+        for chat_dir in owner_dir.iterdir():
+            names = [p.name for p in chat_dir.glob(f'*{SNAPSHOT_SUFFIX}')]
+            if names and (latest is None or max(names) > latest[0]):
+                latest = (max(names), chat_dir.name)
+        return latest[1] if latest is not None else None
+
+    def latest_pair(
+        self,
+        owner: int,
+        chat_key: str,
+    ) -> tuple[Path, Path] | None:
+        snapshots = self.snapshots(owner, chat_key)
+        if len(snapshots) < 2:  # noqa: PLR2004
+            return None
+        return snapshots[-2], snapshots[-1]
+
+
+def snapshot_taken_at(path: Path) -> datetime:
+    return datetime.strptime(
+        path.name.removesuffix(SNAPSHOT_SUFFIX),
+        '%Y%m%dT%H%M%S%f',
+    )
+
+
+def snapshot_chat_key(chat_ids: Sequence[int]) -> str:
+    return '+'.join(str(chat_id) for chat_id in sorted(set(chat_ids)))
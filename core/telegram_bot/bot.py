@@ -2,70 +2,181 @@
 
 from __future__ import annotations
 
+import asyncio
+from collections.abc import AsyncGenerator, Callable, Iterable
+import contextlib
 from datetime import datetime, timezone
+import functools
+import itertools
 import json
+import logging
 from pathlib import Path
 import tempfile
-from typing import Any
+from typing import Any, BinaryIO, cast, IO
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.filters import Command, CommandStart
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import FSInputFile, Message
-
+from aiogram.types import (
+    BufferedInputFile,
+    CallbackQuery,
+    FSInputFile,
+    InlineKeyboardMarkup,
+    InputFile,
+    Message,
+)
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from infra.fsm_storage import modify_data
+from infra.profiling import (
+    JobProfile,
+    JobProfiler,
+    JobRunner,
+    ProfilerBusyError,
+)
 from models.participants import (
     Participant,
+    ParticipantsFilter,
     ParticipantsReport,
     ParticipantType,
 )
-from services.export import export_excel
+from services.dedup import MessageDeduplicator
+from services.merge import normalize_username, ParticipantsMerger
 from services.parser import (
     export_participants,
     is_deleted_account,
-    merge_participants,
     parse_messages,
 )
+from services.participant_index import ParticipantIndex, ParticipantPosting
+from services.shards import (
+    ExportFormat,
+    iter_shards,
+    pack_shards,
+    write_export,
+    write_shards,
+)
+from services.snapshots import (
+    ChangeKind,
+    diff_snapshots,
+    DiffSummary,
+    snapshot_chat_key,
+    snapshot_taken_at,
+    SnapshotChange,
+    SnapshotStore,
+    write_diff_csv,
+)
+from telegram_bot.filters import (
+    describe_filter,
+    FILTER_USAGE,
+    parse_filter_args,
+)
+from telegram_bot.participants_browser import (
+    PageLayout,
+    ParticipantsBrowser,
+    ParticipantsBrowserCache,
+    ParticipantsBrowserStore,
+    ParticipantsPage,
+)
+from telegram_bot.sender import OutboundSender, SendPriority
 
 MAX_FILES_PER_BATCH = 10
 INLINE_USERNAMES_MAX_PARTICIPANTS = 50
 INLINE_PARTICIPANTS_MESSAGE_MAX_LENGTH = 3800
+PARTICIPANTS_BROWSER_CACHE_SIZE = 100
+# Сколько участников всего держат результаты в кэше просмотра.
+# Результат больше PARTICIPANTS_BROWSER_MAX_PARTICIPANTS не листается
+# в чате, бот сразу присылает файл
+PARTICIPANTS_BROWSER_CACHE_MAX_PARTICIPANTS = 200_000
+PARTICIPANTS_BROWSER_MAX_PARTICIPANTS = 20_000
+EXPORT_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+# Публичный Bot API отдает боту файлы до 20 МБ, локальный сервер
+# telegram-bot-api (--local) - до 2000 МБ
+PUBLIC_API_MAX_FILE_SIZE = 20 * 1024 * 1024
+LOCAL_API_MAX_FILE_SIZE = 2000 * 1024 * 1024
+# Отправить бот может до 50 МБ, через локальный сервер - до 2000 МБ
+PUBLIC_API_MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+LOCAL_API_MAX_UPLOAD_SIZE = 2000 * 1024 * 1024
+# Большая выгрузка делится на части, которые пишутся параллельно.
+# Оценка в байтах считается по тексту ячеек, сжатый файл в разы меньше
+EXPORT_SHARD_MAX_ROWS = 100_000
+EXPORT_SHARD_MAX_BYTES = 64 * 1024 * 1024
+# Сколько изменений /diff показывает в чате, полный список - в CSV
+DIFF_INLINE_MAX_CHANGES = 30
+
+_EXPORT_FORMATS = {
+    'xlsx': ExportFormat.XLSX,
+    'csv': ExportFormat.CSV_GZ,
+    'csv.gz': ExportFormat.CSV_GZ,
+}
+
+_MARKDOWN_V2_ESCAPE_TABLE = str.maketrans(
+    {ch: f'\\{ch}' for ch in '_*[]()~`>#+-=|{}.!'},
+)
+
+_PARTICIPANT_TYPE_RU: dict[ParticipantType, str] = {
+    ParticipantType.AUTHOR: 'Автор',
+    ParticipantType.MENTION: 'Упоминание',
+    ParticipantType.REACTION: 'Реакция',
+    ParticipantType.FORWARDED_FROM: 'Переслано от',
+    ParticipantType.ACTOR: 'Действующее лицо',
+    ParticipantType.SERVICE: 'Сервис',
+    ParticipantType.CHANNEL: 'Канал',
+}
+
+
+logger = logging.getLogger(__name__)
 
 
 class UploadState(StatesGroup):
     collecting = State()
 
 
-dp = Dispatcher(storage=MemoryStorage())
+class ParticipantsPageCallback(CallbackData, prefix='participants'):
+    result_id: int
+    page: int
+
+
+# Флаг в данных FSM: следующая обработка /done идет под профилировщиком
+_PROFILE_NEXT_KEY = 'profile_next'
+# Фильтр /filter в данных FSM, действует до конца обработки
+_FILTER_KEY = 'filter'
+
+_TOO_MANY_TO_BROWSE = (
+    'Участников слишком много для просмотра в чате, отправляю файл'
+)
+
+
+class FileObjectInputFile(InputFile):
+    def __init__(
+        self,
+        file: IO[bytes],
+        filename: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+        self.start = file.tell()
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        # После 429 отправитель повторяет тот же запрос: файл
+        # перечитывается от исходной позиции
+        self.file.seek(self.start)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
 
 
 def _escape_markdown_v2(text: str) -> str:
-    escaped = text
-    for ch in [
-        '_',
-        '*',
-        '[',
-        ']',
-        '(',
-        ')',
-        '~',
-        '`',
-        '>',
-        '#',
-        '+',
-        '-',
-        '=',
-        '|',
-        '{',
-        '}',
-        '.',
-        '!',
-    ]:
-        escaped = escaped.replace(ch, f'\\{ch}')
-    return escaped
+    return text.translate(_MARKDOWN_V2_ESCAPE_TABLE)
 
 
 def _read_downloaded_bytes(downloaded: object) -> bytes:
@@ -93,9 +204,10 @@ def _read_downloaded_bytes(downloaded: object) -> bytes:
     raise TypeError('Unsupported download content type')
 
 
-def _normalize_username(username: str) -> str:
-    username = username.strip()
-    return username if username.startswith('@') else f'@{username}'
+def _format_seen_as(seen_as: set[ParticipantType]) -> str:
+    return ', '.join(
+        sorted(_PARTICIPANT_TYPE_RU.get(x, str(x)) for x in seen_as)
+    )
 
 
 def _format_participant_details(participant: Participant) -> str:
@@ -104,16 +216,6 @@ def _format_participant_details(participant: Participant) -> str:
     def kv(label: str, value: str) -> str:
         return f'*{label}:* {value}'
 
-    participant_type_ru: dict[ParticipantType, str] = {
-        ParticipantType.AUTHOR: 'Автор',
-        ParticipantType.MENTION: 'Упоминание',
-        ParticipantType.REACTION: 'Реакция',
-        ParticipantType.FORWARDED_FROM: 'Переслано от',
-        ParticipantType.ACTOR: 'Действующее лицо',
-        ParticipantType.SERVICE: 'Сервис',
-        ParticipantType.CHANNEL: 'Канал',
-    }
-
     if participant.user_id:
         lines.append(
             kv(
@@ -123,7 +225,7 @@ def _format_participant_details(participant: Participant) -> str:
         )
 
     if participant.username:
-        normalized = _normalize_username(participant.username)
+        normalized = normalize_username(participant.username)
         lines.append(kv('Юзернейм', _escape_markdown_v2(normalized)))
 
     if participant.full_name:
@@ -145,10 +247,12 @@ def _format_participant_details(participant: Participant) -> str:
         )
 
     if participant.seen_as:
-        seen_ru = sorted(
-            (participant_type_ru.get(x, str(x)) for x in participant.seen_as)
+        lines.append(
+            kv(
+                'Виден как',
+                _escape_markdown_v2(_format_seen_as(participant.seen_as)),
+            )
         )
-        lines.append(kv('Виден как', _escape_markdown_v2(', '.join(seen_ru))))
 
     if not lines:
         return _escape_markdown_v2('Неизвестный участник')
@@ -156,28 +260,138 @@ def _format_participant_details(participant: Participant) -> str:
     return '\n'.join(lines)
 
 
+PARTICIPANTS_PAGE_LAYOUT = PageLayout(
+    render=_format_participant_details,
+    page_size=INLINE_USERNAMES_MAX_PARTICIPANTS,
+    max_length=INLINE_PARTICIPANTS_MESSAGE_MAX_LENGTH,
+)
+
+
+def _max_file_size(bot: Bot | None) -> int:
+    if bot is not None and bot.session.api.is_local:
+        return LOCAL_API_MAX_FILE_SIZE
+    return PUBLIC_API_MAX_FILE_SIZE
+
+
+def _max_upload_size(bot: Bot | None) -> int:
+    if bot is not None and bot.session.api.is_local:
+        return LOCAL_API_MAX_UPLOAD_SIZE
+    return PUBLIC_API_MAX_UPLOAD_SIZE
+
+
+def _local_file_path(bot: Bot, file_path: str) -> Path | None:
+    # Локальный сервер возвращает абсолютный путь к уже скачанному
+    # файлу на своем диске
+    if not bot.session.api.is_local:
+        return None
+    local_path = Path(bot.session.api.wrap_local_file.to_local(file_path))
+    if local_path.is_absolute() and local_path.is_file():
+        return local_path
+    return None
+
+
+# Экономия локального режима - пропущенная загрузка по HTTP: файл
+# читается прямо из папки сервера Bot API
+def _load_local_export_json(path: Path) -> Any:
+    return _decode_export_json(path.read_bytes())
+
+
+def _decode_export_json(downloaded: object) -> Any:
+    content_bytes = _read_downloaded_bytes(downloaded)
+    return json.loads(content_bytes.decode('utf-8', errors='replace'))
+
+
 async def _download_export_json(
     bot: Bot,
     *,
     file_id: str,
+    run_job: JobRunner,
 ) -> dict[str, Any]:
     tg_file = await bot.get_file(file_id)
     if not tg_file.file_path:
         raise ValueError('Missing Telegram file_path')
-    downloaded = await bot.download_file(tg_file.file_path)
-    content_bytes = _read_downloaded_bytes(downloaded)
-    parsed = json.loads(content_bytes.decode('utf-8', errors='replace'))
+
+    local_path = _local_file_path(bot, tg_file.file_path)
+    if local_path is not None:
+        parsed = await run_job(_load_local_export_json, local_path)
+    else:
+        downloaded = await bot.download_file(tg_file.file_path)
+        parsed = await run_job(_decode_export_json, downloaded)
     if not isinstance(parsed, dict):
         raise ValueError('Expected JSON object')
     return parsed
 
 
-async def _collect_participant_lists_from_files(
+async def _index_participants(
+    participant_index: ParticipantIndex,
+    *,
+    export_json: dict[str, Any],
+    participants: list[Participant],
+) -> None:
+    chat_id = export_json.get('id')
+    if not isinstance(chat_id, int):
+        return
+    chat_title = export_json.get('name')
+
+    try:
+        await asyncio.to_thread(
+            participant_index.ingest,
+            chat_id,
+            chat_title if isinstance(chat_title, str) else None,
+            [p for p in participants if not is_deleted_account(p.full_name)],
+        )
+    except Exception:
+        # Индекс вспомогательный, из-за него обработка падать не должна
+        logger.exception('Failed to index participants of chat %s', chat_id)
+
+
+def _collect_file_participants(
+    export_json: dict[str, Any],
+    *,
+    merger: ParticipantsMerger,
+    dedup: MessageDeduplicator,
+    participants_filter: ParticipantsFilter | None,
+    source: int | None,
+) -> ParticipantsReport:
+    messages = parse_messages(
+        export_json,
+        dedup=dedup,
+        participants_filter=participants_filter,
+    )
+    report = export_participants(
+        messages,
+        participants_filter=participants_filter,
+    )
+    merger.add(
+        (
+            p
+            for p in report.participants
+            if not is_deleted_account(p.full_name)
+        ),
+        source=source,
+    )
+    return report
+
+
+async def _collect_participants_from_files(  # noqa: PLR0913
     bot: Bot,
     *,
     files: list[dict[str, Any]],
-) -> tuple[list[list[Participant]], str | None]:
-    participant_lists: list[list[Participant]] = []
+    merger: ParticipantsMerger,
+    dedup: MessageDeduplicator,
+    run_job: JobRunner,
+    participant_index: ParticipantIndex | None = None,
+    participants_filter: ParticipantsFilter | None = None,
+) -> tuple[list[str], list[int], str | None]:
+    # Имена источников в порядке добавления в merger: индекс имени равен
+    # номеру бита в Participant.sources
+    source_names: list[str] = []
+    # id чатов из выгрузок, по ним ищется прошлый снимок участников
+    chat_ids: list[int] = []
+    # Выгрузки одного чата - один источник: повторы сообщений между
+    # ними отброшены, участники повторов попали лишь в первый файл.
+    # Отчет по пересечениям сравнивает чаты, не такие файлы
+    chat_sources: dict[int, int] = {}
 
     for item in files:
         file_id = item.get('file_id')
@@ -186,71 +400,254 @@ async def _collect_participant_lists_from_files(
             continue
 
         try:
-            export_json = await _download_export_json(bot, file_id=file_id)
-            messages = parse_messages(export_json)
-            report = export_participants(messages)
-            participant_lists.append(report.participants)
+            export_json = await _download_export_json(
+                bot,
+                file_id=file_id,
+                run_job=run_job,
+            )
+            chat_id = export_json.get('id')
+            source = (
+                chat_sources.get(chat_id) if isinstance(chat_id, int) else None
+            )
+            report = await run_job(
+                _collect_file_participants,
+                export_json,
+                merger=merger,
+                dedup=dedup,
+                participants_filter=participants_filter,
+                source=source,
+            )
         except Exception:
-            return ([], str(file_name))
-
-    return (participant_lists, None)
-
+            return (source_names, chat_ids, str(file_name))
+        if source is not None:
+            source_names[source] += f', {file_name}'
+        else:
+            source_names.append(str(file_name))
+            if isinstance(chat_id, int):
+                chat_sources[chat_id] = len(source_names) - 1
+                chat_ids.append(chat_id)
+
+        if participant_index is not None:
+            await _index_participants(
+                participant_index,
+                export_json=export_json,
+                participants=report.participants,
+            )
 
-def _merge_filtered_participants(
-    participant_lists: list[list[Participant]],
-) -> list[Participant]:
-    filtered_lists = [
-        [p for p in part_list if not is_deleted_account(p.full_name)]
-        for part_list in participant_lists
-    ]
-    return merge_participants(filtered_lists)
+    return (source_names, chat_ids, None)
 
 
-def _save_participants_excel(
+# Пишет выгрузку целиком в export_file, если она укладывается в одну
+# часть, иначе пишет части в directory и возвращает их пути
+def _save_participants_export(  # noqa: PLR0913
     *,
-    participants: list[Participant],
-    export_path: Path,
+    participants: Iterable[Participant],
+    export_file: BinaryIO,
+    make_directory: Callable[[], Path],
+    basename: str,
+    export_format: ExportFormat,
     exported_at: datetime,
-) -> None:
-    export_excel(
-        ParticipantsReport(
+    source_names: list[str],
+) -> list[Path]:
+    shards = iter_shards(
+        participants,
+        max_rows=EXPORT_SHARD_MAX_ROWS,
+        max_bytes=EXPORT_SHARD_MAX_BYTES,
+    )
+    first = next(shards, [])
+    second = next(shards, None)
+    if second is None:
+        write_export(
+            first,
+            export_file,
+            export_format=export_format,
             exported_at=exported_at,
-            participants=participants,
-        ),
-        str(export_path),
+            source_names=source_names,
+        )
+        return []
+
+    return write_shards(
+        itertools.chain([first, second], shards),
+        make_directory(),
+        basename=basename,
+        export_format=export_format,
+        exported_at=exported_at,
+        source_names=source_names,
     )
 
 
-async def _try_send_inline_participants(
+def _participant_sort_key(p: Participant) -> tuple[int, str]:
+    if p.username:
+        return (0, normalize_username(p.username).casefold())
+    if p.full_name:
+        return (1, p.full_name.casefold())
+    return (2, (p.user_id or '').casefold())
+
+
+def _format_participants_page(page: ParticipantsPage) -> str:
+    header = _escape_markdown_v2(
+        f'Участники {page.start + 1}–{page.end} из {page.total}'
+    )
+    return f'*{header}*\n\n{page.text}'
+
+
+def _participants_page_keyboard(
+    result_id: int,
+    page: ParticipantsPage,
+) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    if page.has_prev:
+        builder.button(
+            text='← Назад',
+            callback_data=ParticipantsPageCallback(
+                result_id=result_id,
+                page=page.index - 1,
+            ),
+        )
+    if page.has_next:
+        builder.button(
+            text='Вперёд →',
+            callback_data=ParticipantsPageCallback(
+                result_id=result_id,
+                page=page.index + 1,
+            ),
+        )
+    return builder.as_markup()
+
+
+async def _send_participants_browser(
     message: Message,
     *,
+    sender: OutboundSender,
+    participants_browsers: ParticipantsBrowserStore,
     participants: list[Participant],
 ) -> bool:
-    if len(participants) > INLINE_USERNAMES_MAX_PARTICIPANTS:
+    if len(participants) > PARTICIPANTS_BROWSER_MAX_PARTICIPANTS:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(_TOO_MANY_TO_BROWSE),
+            priority=SendPriority.RESULT,
+        )
         return False
 
-    def _sort_key(p: Participant) -> tuple[int, str]:
-        if p.username:
-            return (0, _normalize_username(p.username).casefold())
-        if p.full_name:
-            return (1, p.full_name.casefold())
-        return (2, (p.user_id or '').casefold())
-
-    lines = [
-        _format_participant_details(p)
-        for p in sorted(participants, key=_sort_key)
-    ]
-    text = '\n\n'.join(lines)
+    browser = ParticipantsBrowser(
+        sorted(participants, key=_participant_sort_key),
+        layout=PARTICIPANTS_PAGE_LAYOUT,
+    )
+    first_page = browser.page(0)
 
-    if len(text) > INLINE_PARTICIPANTS_MESSAGE_MAX_LENGTH:
-        return False
+    if not first_page.has_next:
+        await sender.answer(
+            message,
+            first_page.text,
+            priority=SendPriority.RESULT,
+        )
+        return True
 
-    await message.answer(text)
+    result_id = await asyncio.to_thread(
+        participants_browsers.put,
+        message.chat.id,
+        browser,
+    )
+    await sender.answer(
+        message,
+        _format_participants_page(first_page),
+        priority=SendPriority.RESULT,
+        reply_markup=_participants_page_keyboard(result_id, first_page),
+    )
     return True
 
 
-@dp.message(CommandStart())
-async def command_start_handler(message: Message, state: FSMContext) -> None:
+async def _send_participants_export(  # noqa: PLR0913
+    message: Message,
+    *,
+    sender: OutboundSender,
+    participants: Iterable[Participant],
+    source_names: list[str],
+    export_format: ExportFormat,
+    run_job: JobRunner,
+) -> None:
+    exported_at = datetime.now(timezone.utc)
+    basename = f'participants_{exported_at.date().isoformat()}'
+    # Файл остается в памяти, пока не превысит порог, и только тогда
+    # уходит на диск. Каталог создается, только если выгрузка делится
+    # на части
+    with (
+        tempfile.SpooledTemporaryFile(
+            max_size=EXPORT_SPOOL_MAX_SIZE,
+        ) as export_file,
+        contextlib.ExitStack() as cleanup,
+    ):
+
+        def make_directory() -> Path:
+            return Path(cleanup.enter_context(tempfile.TemporaryDirectory()))
+
+        # Слияние, ушедшее на диск, читает партиции из файлов, поэтому
+        # выгрузка идет вне цикла событий
+        shard_paths = await run_job(
+            _save_participants_export,
+            participants=participants,
+            export_file=cast(BinaryIO, export_file),
+            make_directory=make_directory,
+            basename=basename,
+            export_format=export_format,
+            exported_at=exported_at,
+            source_names=source_names,
+        )
+        if not shard_paths:
+            export_file.seek(0)
+            await sender.answer_document(
+                message,
+                FileObjectInputFile(
+                    export_file,
+                    filename=f'{basename}.{export_format}',
+                ),
+            )
+            return
+
+        await _send_export_shards(
+            message,
+            sender=sender,
+            shard_paths=shard_paths,
+            archive_path=shard_paths[0].parent / f'{basename}.zip',
+            run_job=run_job,
+        )
+
+
+async def _send_export_shards(
+    message: Message,
+    *,
+    sender: OutboundSender,
+    shard_paths: list[Path],
+    archive_path: Path,
+    run_job: JobRunner,
+) -> None:
+    await sender.answer(
+        message,
+        _escape_markdown_v2(
+            f'Выгрузка большая, она разбита на {len(shard_paths)} файлов'
+        ),
+        priority=SendPriority.RESULT,
+    )
+    archive_size = await run_job(
+        pack_shards,
+        shard_paths,
+        archive_path,
+    )
+    if archive_size <= _max_upload_size(message.bot):
+        await sender.answer_document(message, FSInputFile(archive_path))
+        return
+
+    # Архив не пролезает в лимит отправки - части уходят по одной
+    for path in shard_paths:
+        await sender.answer_document(message, FSInputFile(path))
+
+
+async def command_start_handler(
+    message: Message,
+    state: FSMContext,
+    sender: OutboundSender,
+) -> None:
     await state.set_state(UploadState.collecting)
     await state.update_data(files=[])
 
@@ -262,89 +659,655 @@ async def command_start_handler(message: Message, state: FSMContext) -> None:
                 'файлов за одну обработку'
             ),
             'Когда закончите — отправьте /done',
+            'Ограничить период и роли участников можно командой /filter',
+            'Кто пришел и ушел с прошлой обработки чата — /diff',
         ]
     )
-    await message.answer(_escape_markdown_v2(text))
+    await sender.answer(message, _escape_markdown_v2(text))
 
 
-@dp.message(Command('done'))
-async def done_handler(message: Message, state: FSMContext) -> None:
+async def done_handler(  # noqa: PLR0913
+    message: Message,
+    state: FSMContext,
+    sender: OutboundSender,
+    *,
+    command: CommandObject | None = None,
+    participant_index: ParticipantIndex | None = None,
+    merge_memory_budget: int | None = None,
+    snapshot_store: SnapshotStore | None = None,
+    participants_browsers: ParticipantsBrowserStore,
+) -> None:
     if message.bot is None:
-        await message.answer(
+        await sender.answer(
+            message,
             _escape_markdown_v2(
                 'Не удалось получить доступ к боту. Повторите запрос позже.'
             ),
         )
         return
+
+    # /done csv или /done xlsx: формат файла и отправка файла даже
+    # для короткого списка
+    format_arg = ((command.args if command else None) or '').strip().lower()
+    export_format = _EXPORT_FORMATS.get(format_arg) if format_arg else None
+    if format_arg and export_format is None:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(
+                f'Неизвестный формат: {format_arg}. '
+                'Доступны: /done xlsx, /done csv'
+            ),
+        )
+        return
+
     data = await state.get_data()
     files: list[dict[str, Any]] = list(data.get('files') or [])
     if not files:
-        await message.answer(
+        await sender.answer(
+            message,
             _escape_markdown_v2(
                 'Файлы не получены. Пришлите .json и отправьте /done'
-            )
+            ),
         )
         return
 
-    (
-        participant_lists,
-        failed_file_name,
-    ) = await _collect_participant_lists_from_files(
-        message.bot,
+    # Разбор и запись файлов идут через run_job: под профилировщиком
+    # это поток профилировщика, иначе asyncio.to_thread
+    job = functools.partial(
+        _process_files,
+        message,
+        state,
+        sender=sender,
+        bot=message.bot,
         files=files,
+        participant_index=participant_index,
+        merge_memory_budget=merge_memory_budget,
+        snapshot_store=snapshot_store,
+        participants_browsers=participants_browsers,
+        export_format=export_format,
+        participants_filter=_stored_filter(data),
+    )
+    # Без флага профилировщик даже не создается
+    if not data.get(_PROFILE_NEXT_KEY):
+        await job(run_job=asyncio.to_thread)
+        return
+
+    profiler = JobProfiler()
+    try:
+        profiler.start()
+    except ProfilerBusyError:
+        # Профиль уже снимает другая обработка, эта идет без него
+        await job(run_job=asyncio.to_thread)
+        await sender.answer(
+            message,
+            _escape_markdown_v2(
+                'Профилировщик занят другой обработкой, профиль не снят'
+            ),
+        )
+        return
+
+    try:
+        await job(run_job=profiler.run)
+    finally:
+        profile = profiler.stop()
+    await _send_job_profile(message, sender=sender, profile=profile)
+
+
+async def _send_job_profile(
+    message: Message,
+    *,
+    sender: OutboundSender,
+    profile: JobProfile,
+) -> None:
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    await sender.answer_document(
+        message,
+        BufferedInputFile(profile.pstats, filename=f'profile_{stamp}.pstats'),
     )
-    if failed_file_name is not None:
+    # Пустой файл Telegram не примет
+    if not profile.collapsed:
+        return
+    await sender.answer_document(
+        message,
+        BufferedInputFile(
+            profile.collapsed,
+            filename=f'profile_{stamp}.collapsed.txt',
+        ),
+    )
+
+
+async def _report_job_stats(
+    message: Message,
+    *,
+    sender: OutboundSender,
+    source_names: list[str],
+    dedup: MessageDeduplicator,
+) -> None:
+    logger.info(
+        'Job stats: chat=%s files=%s messages=%s duplicates=%s (%.1f%%)',
+        message.chat.id,
+        len(source_names),
+        dedup.seen,
+        dedup.duplicates,
+        dedup.hit_rate * 100,
+    )
+    if not dedup.duplicates:
+        return
+    await sender.answer(
+        message,
+        _escape_markdown_v2(
+            f'Выгрузки пересекаются: пропущено {dedup.duplicates} '
+            f'повторов из {dedup.seen} сообщений '
+            f'({dedup.hit_rate:.0%})'
+        ),
+        priority=SendPriority.RESULT,
+    )
+
+
+async def _process_files(  # noqa: PLR0913
+    message: Message,
+    state: FSMContext,
+    *,
+    sender: OutboundSender,
+    bot: Bot,
+    files: list[dict[str, Any]],
+    participant_index: ParticipantIndex | None,
+    merge_memory_budget: int | None,
+    snapshot_store: SnapshotStore | None,
+    participants_browsers: ParticipantsBrowserStore,
+    export_format: ExportFormat | None,
+    participants_filter: ParticipantsFilter | None,
+    run_job: JobRunner,
+) -> None:
+    # Пересекающиеся выгрузки одного чата: повторы сообщений
+    # отбрасываются на всю обработку
+    dedup = MessageDeduplicator()
+    with ParticipantsMerger(memory_budget=merge_memory_budget) as merger:
+        (
+            source_names,
+            chat_ids,
+            failed_file_name,
+        ) = await _collect_participants_from_files(
+            bot,
+            files=files,
+            merger=merger,
+            dedup=dedup,
+            run_job=run_job,
+            participant_index=participant_index,
+            participants_filter=participants_filter,
+        )
         await state.clear()
-        await message.answer(
+        if failed_file_name is not None:
+            await sender.answer(
+                message,
+                _escape_markdown_v2(
+                    f'Не удалось обработать файл: {failed_file_name}'
+                ),
+                priority=SendPriority.RESULT,
+            )
+            return
+
+        await _report_job_stats(
+            message,
+            sender=sender,
+            source_names=source_names,
+            dedup=dedup,
+        )
+
+        # Отфильтрованный список неполон: снимок сохраняется только
+        # для обработки без фильтра
+        if snapshot_store is not None and (
+            participants_filter is None or participants_filter.is_empty
+        ):
+            await _save_participants_snapshot(
+                message,
+                sender=sender,
+                snapshot_store=snapshot_store,
+                chat_ids=chat_ids,
+                participants=merger,
+            )
+
+        if merger.spilled:
+            # Участники не поместились в бюджет памяти: список для
+            # просмотра в чате не строится, выгрузка идет потоком
+            await sender.answer(
+                message,
+                _escape_markdown_v2(_TOO_MANY_TO_BROWSE),
+                priority=SendPriority.RESULT,
+            )
+            await _send_participants_export(
+                message,
+                sender=sender,
+                participants=merger,
+                source_names=source_names,
+                export_format=export_format or ExportFormat.XLSX,
+                run_job=run_job,
+            )
+            return
+
+        participants = list(merger)
+
+    if not participants:
+        await sender.answer(
+            message,
+            _escape_markdown_v2('Участники не найдены'),
+            priority=SendPriority.RESULT,
+        )
+        return
+
+    # Если участники показаны в чате, файл нужен только ради отчета по
+    # пересечениям нескольких чатов или по явной просьбе
+    shown_in_chat = await _send_participants_browser(
+        message,
+        sender=sender,
+        participants_browsers=participants_browsers,
+        participants=participants,
+    )
+    if (
+        shown_in_chat
+        and len(source_names) < 2  # noqa: PLR2004
+        and export_format is None
+    ):
+        return
+
+    await _send_participants_export(
+        message,
+        sender=sender,
+        participants=participants,
+        source_names=source_names,
+        export_format=export_format or ExportFormat.XLSX,
+        run_job=run_job,
+    )
+
+
+async def _save_participants_snapshot(
+    message: Message,
+    *,
+    sender: OutboundSender,
+    snapshot_store: SnapshotStore,
+    chat_ids: list[int],
+    participants: Iterable[Participant],
+) -> None:
+    if not chat_ids:
+        return
+    chat_key = snapshot_chat_key(chat_ids)
+    owner = message.chat.id
+
+    try:
+        # Слияние, ушедшее на диск, читает партиции из файлов
+        await asyncio.to_thread(
+            snapshot_store.save,
+            owner,
+            chat_key,
+            participants,
+            taken_at=datetime.now(timezone.utc),
+        )
+        has_previous = (
+            await asyncio.to_thread(
+                snapshot_store.latest_pair, owner, chat_key
+            )
+            is not None
+        )
+    except Exception:
+        # Снимок нужен только для /diff, из-за него обработка
+        # падать не должна
+        logger.exception('Failed to save snapshot of chat %s', chat_key)
+        return
+
+    if has_previous:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(
+                'Изменения участников с прошлой обработки этого чата: /diff'
+            ),
+            priority=SendPriority.RESULT,
+        )
+
+
+def _format_snapshot_entry(change: SnapshotChange) -> str:
+    entry = change.new or change.old
+    if entry is None:
+        return ''
+    name = f'@{entry.username}' if entry.username else None
+    parts = [p for p in (name, entry.full_name) if p]
+    return ' '.join(parts) or entry.user_id or entry.key
+
+
+_DIFF_MARKS = {
+    ChangeKind.ADDED: '+',
+    ChangeKind.REMOVED: '−',
+    ChangeKind.CHANGED: '~',
+}
+
+
+def _format_diff_summary(
+    summary: DiffSummary,
+    *,
+    old_path: Path,
+    new_path: Path,
+) -> str:
+    old_at = snapshot_taken_at(old_path)
+    new_at = snapshot_taken_at(new_path)
+    lines = [
+        (
+            'Изменения участников между обработками '
+            f'{old_at:%Y-%m-%d %H:%M} и {new_at:%Y-%m-%d %H:%M} (UTC):'
+        ),
+        (
+            f'новые: {summary.added}, ушли: {summary.removed}, '
+            f'изменились: {summary.changed}'
+        ),
+    ]
+    if not summary.total:
+        lines.append('Состав участников не изменился')
+        return '\n'.join(lines)
+
+    lines.append('')
+    lines.extend(
+        f'{_DIFF_MARKS[change.kind]} {_format_snapshot_entry(change)}'
+        for change in summary.sample
+    )
+    if summary.total > len(summary.sample):
+        lines.append(f'… и еще {summary.total - len(summary.sample)}')
+    return '\n'.join(lines)
+
+
+def _write_snapshots_diff(
+    old_path: Path,
+    new_path: Path,
+    diff_file: BinaryIO,
+) -> DiffSummary:
+    return write_diff_csv(
+        diff_snapshots(old_path, new_path),
+        diff_file,
+        sample_size=DIFF_INLINE_MAX_CHANGES,
+    )
+
+
+async def diff_handler(
+    message: Message,
+    command: CommandObject,
+    sender: OutboundSender,
+    snapshot_store: SnapshotStore | None = None,
+) -> None:
+    if snapshot_store is None:
+        await sender.answer(
+            message,
+            _escape_markdown_v2('Сравнение обработок не настроено'),
+        )
+        return
+
+    # /diff <id чата из выгрузки> - для сравнения не последнего чата
+    owner = message.chat.id
+    chat_key: str | None = (command.args or '').strip()
+    if not chat_key:
+        chat_key = await asyncio.to_thread(
+            snapshot_store.latest_chat_key,
+            owner,
+        )
+    pair = (
+        await asyncio.to_thread(snapshot_store.latest_pair, owner, chat_key)
+        if chat_key
+        else None
+    )
+    if pair is None:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(
+                'Для сравнения нужны две обработки одного чата без '
+                '/filter. Пришлите свежую выгрузку и отправьте /done'
+            ),
+        )
+        return
+
+    old_path, new_path = pair
+    with tempfile.SpooledTemporaryFile(
+        max_size=EXPORT_SPOOL_MAX_SIZE,
+    ) as diff_file:
+        summary = await asyncio.to_thread(
+            _write_snapshots_diff,
+            old_path,
+            new_path,
+            cast(BinaryIO, diff_file),
+        )
+        await sender.answer(
+            message,
+            _escape_markdown_v2(
+                _format_diff_summary(
+                    summary,
+                    old_path=old_path,
+                    new_path=new_path,
+                )
+            ),
+            priority=SendPriority.RESULT,
+        )
+        if summary.total <= len(summary.sample):
+            return
+
+        diff_file.seek(0)
+        await sender.answer_document(
+            message,
+            FileObjectInputFile(
+                diff_file,
+                filename=f'diff_{chat_key}_{new_path.name[:8]}.csv',
+            ),
+        )
+
+
+def _stored_filter(data: dict[str, Any]) -> ParticipantsFilter | None:
+    stored = data.get(_FILTER_KEY)
+    return ParticipantsFilter.model_validate(stored) if stored else None
+
+
+async def filter_handler(
+    message: Message,
+    state: FSMContext,
+    command: CommandObject,
+    sender: OutboundSender,
+) -> None:
+    current = _stored_filter(await state.get_data()) or ParticipantsFilter()
+    args = (command.args or '').strip()
+    if not args:
+        await sender.answer(
+            message,
             _escape_markdown_v2(
-                f'Не удалось обработать файл: {failed_file_name}'
+                f'{describe_filter(current)}\n\n{FILTER_USAGE}'
+            ),
+        )
+        return
+
+    try:
+        updated = parse_filter_args(
+            args,
+            current,
+            today=datetime.now(timezone.utc).date(),
+        )
+    except ValueError as e:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(f'{e}\n\n{FILTER_USAGE}'),
+        )
+        return
+
+    # Хранится как JSON, чтобы подходило любое хранилище FSM
+    stored = None if updated.is_empty else updated.model_dump(mode='json')
+    await state.update_data({_FILTER_KEY: stored})
+    await sender.answer(message, _escape_markdown_v2(describe_filter(updated)))
+
+
+async def profile_handler(
+    message: Message,
+    state: FSMContext,
+    sender: OutboundSender,
+    admin_user_ids: frozenset[int] = frozenset(),
+) -> None:
+    if message.from_user is None or message.from_user.id not in admin_user_ids:
+        await sender.answer(
+            message,
+            _escape_markdown_v2('Команда доступна только администраторам'),
+        )
+        return
+
+    await state.update_data({_PROFILE_NEXT_KEY: True})
+    await sender.answer(
+        message,
+        _escape_markdown_v2(
+            'Следующая обработка /done будет запущена под профилировщиком'
+        ),
+    )
+
+
+def _format_participant_postings(
+    query: str,
+    postings: list[ParticipantPosting],
+) -> str:
+    lines = [_escape_markdown_v2(f'{query} встречается в чатах:')]
+    for posting in postings:
+        title = posting.chat_title or 'Без названия'
+        seen_ru = ', '.join(
+            sorted(
+                _PARTICIPANT_TYPE_RU.get(x, str(x)) for x in posting.seen_as
             )
         )
+        lines.append(
+            _escape_markdown_v2(f'• {title} (id {posting.chat_id}): {seen_ru}')
+        )
+    return '\n'.join(lines)
+
+
+async def find_handler(
+    message: Message,
+    command: CommandObject,
+    sender: OutboundSender,
+    participant_index: ParticipantIndex | None = None,
+    admin_user_ids: frozenset[int] = frozenset(),
+) -> None:
+    # Индекс общий для всех пользователей бота и раскрывает чужие чаты
+    if message.from_user is None or message.from_user.id not in admin_user_ids:
+        await sender.answer(
+            message,
+            _escape_markdown_v2('Команда доступна только администраторам'),
+        )
         return
 
-    participants = _merge_filtered_participants(participant_lists)
-    await state.clear()
+    if participant_index is None:
+        await sender.answer(
+            message,
+            _escape_markdown_v2('Поиск по чатам не настроен'),
+        )
+        return
 
-    if await _try_send_inline_participants(message, participants=participants):
+    query = (command.args or '').strip()
+    if not query:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(
+                'Укажите пользователя: /find @username или /find user123'
+            ),
+        )
         return
 
-    exported_at = datetime.now(timezone.utc)
-    export_filename = f'participants_{exported_at.date().isoformat()}.xlsx'
-    with tempfile.TemporaryDirectory() as tmpdir:
-        export_path = Path(tmpdir) / export_filename
-        _save_participants_excel(
-            participants=participants,
-            export_path=export_path,
-            exported_at=exported_at,
+    postings = await asyncio.to_thread(participant_index.find, query)
+    if not postings:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(f'{query} не найден ни в одном чате'),
         )
-        await message.answer_document(FSInputFile(str(export_path)))
+        return
+
+    await sender.answer(message, _format_participant_postings(query, postings))
+
+
+async def participants_page_handler(
+    callback: CallbackQuery,
+    callback_data: ParticipantsPageCallback,
+    sender: OutboundSender,
+    participants_browsers: ParticipantsBrowserStore,
+) -> None:
+    if not isinstance(callback.message, Message):
+        await callback.answer()
+        return
 
+    page = await asyncio.to_thread(
+        participants_browsers.page,
+        callback.message.chat.id,
+        callback_data.result_id,
+        callback_data.page,
+    )
+    if page is None:
+        await callback.answer(
+            'Результат устарел. Отправьте файлы заново',
+            show_alert=True,
+        )
+        return
 
-@dp.message(F.document)
-async def document_handler(message: Message, state: FSMContext) -> None:
+    try:
+        await sender.edit_text(
+            callback.message,
+            _format_participants_page(page),
+            reply_markup=_participants_page_keyboard(
+                callback_data.result_id,
+                page,
+            ),
+        )
+    except TelegramBadRequest as e:
+        # Двойное нажатие: страница уже показана
+        if 'message is not modified' not in e.message:
+            raise
+    finally:
+        await callback.answer()
+
+
+async def document_handler(
+    message: Message,
+    state: FSMContext,
+    sender: OutboundSender,
+) -> None:
     document = message.document
     if not document or not document.file_name:
         return
 
     file_name = document.file_name
     if not file_name.lower().endswith('.json'):
-        await message.answer(
+        await sender.answer(
+            message,
             _escape_markdown_v2(
                 'Сейчас поддерживаются только .json — файл пропущен'
-            )
+            ),
         )
         return
 
-    current_state = await state.get_state()
-    if current_state is None:
+    max_file_size = _max_file_size(message.bot)
+    if document.file_size is not None and document.file_size > max_file_size:
+        await sender.answer(
+            message,
+            _escape_markdown_v2(
+                f'Файл больше {max_file_size // (1024 * 1024)} МБ — пропущен'
+            ),
+        )
+        return
+
+    if await state.get_state() is None:
         await state.set_state(UploadState.collecting)
-        await state.update_data(files=[])
 
-    data = await state.get_data()
-    files: list[dict[str, Any]] = list(data.get('files') or [])
+    # Файлы, присланные пачкой, обрабатываются параллельно, при
+    # нескольких воркерах - в разных процессах. Список дополняется
+    # атомарно, иначе последняя запись затрет соседние файлы
+    file_entry = {'file_id': document.file_id, 'file_name': file_name}
+    accepted = False
+
+    def add_file(data: dict[str, Any]) -> dict[str, Any]:
+        nonlocal accepted
+        files = list(data.get('files') or [])
+        accepted = len(files) < MAX_FILES_PER_BATCH
+        if not accepted:
+            return data
+        return {**data, 'files': [*files, file_entry]}
 
-    if len(files) >= MAX_FILES_PER_BATCH:
-        await message.answer(
+    data = await modify_data(state, add_file)
+    if not accepted:
+        await sender.answer(
+            message,
             _escape_markdown_v2(
                 (
                     f'Лимит: не более {MAX_FILES_PER_BATCH} '
@@ -354,21 +1317,86 @@ async def document_handler(message: Message, state: FSMContext) -> None:
         )
         return
 
-    files.append({'file_id': document.file_id, 'file_name': file_name})
-    await state.update_data(files=files)
-    await message.answer(
+    files: list[dict[str, Any]] = data['files']
+    # Подтверждения за пачку файлов схлопываются: если предыдущее еще не
+    # ушло, уйдет только последнее, где счетчик актуален
+    await sender.answer(
+        message,
         _escape_markdown_v2(
             f'Файл принят ({len(files)}/{MAX_FILES_PER_BATCH}) /done'
-        )
+        ),
+        priority=SendPriority.ACK,
+        coalesce_key='file_accepted',
     )
 
 
-def provide_bot(token: str) -> Bot:
+def provide_bot(
+    token: str,
+    *,
+    api_url: str | None = None,
+    is_local: bool = False,
+) -> Bot:
+    if is_local and api_url is None:
+        raise ValueError('Local Bot API mode requires api_url')
+    session = (
+        AiohttpSession(
+            api=TelegramAPIServer.from_base(api_url, is_local=is_local),
+        )
+        if api_url is not None
+        else None
+    )
     return Bot(
         token=token,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN_V2),
     )
 
 
-def run_polling(bot: Bot) -> None:
-    dp.run_polling(bot)
+def provide_dispatcher(  # noqa: PLR0913
+    storage: BaseStorage | None = None,
+    *,
+    participant_index: ParticipantIndex | None = None,
+    merge_memory_budget: int | None = None,
+    snapshot_store: SnapshotStore | None = None,
+    sender: OutboundSender | None = None,
+    participants_browsers: ParticipantsBrowserStore | None = None,
+    admin_user_ids: frozenset[int] = frozenset(),
+) -> Dispatcher:
+    sender = sender or OutboundSender()
+    dispatcher = Dispatcher(
+        storage=storage or MemoryStorage(),
+        participant_index=participant_index,
+        merge_memory_budget=merge_memory_budget,
+        snapshot_store=snapshot_store,
+        sender=sender,
+        # Без общего хранилища результаты листаются только в том
+        # процессе, который их построил
+        participants_browsers=participants_browsers
+        or ParticipantsBrowserCache(
+            max_size=PARTICIPANTS_BROWSER_CACHE_SIZE,
+            max_participants=PARTICIPANTS_BROWSER_CACHE_MAX_PARTICIPANTS,
+        ),
+        admin_user_ids=admin_user_ids,
+    )
+    # Worker очереди запускается в цикле событий процесса, который
+    # обрабатывает обновления (в webhook-режиме - в каждом worker)
+    dispatcher.startup.register(sender.start)
+    dispatcher.shutdown.register(sender.stop)
+
+    dispatcher.message.register(command_start_handler, CommandStart())
+    dispatcher.message.register(done_handler, Command('done'))
+    dispatcher.message.register(find_handler, Command('find'))
+    dispatcher.message.register(profile_handler, Command('profile'))
+    dispatcher.message.register(filter_handler, Command('filter'))
+    dispatcher.message.register(diff_handler, Command('diff'))
+    dispatcher.message.register(document_handler, F.document)
+    dispatcher.callback_query.register(
+        participants_page_handler,
+        ParticipantsPageCallback.filter(),
+    )
+
+    return dispatcher
+
+
+def run_polling(bot: Bot, dispatcher: Dispatcher) -> None:
+    dispatcher.run_polling(bot)
@@ -0,0 +1,125 @@
+from datetime import date, timedelta
+import re
+
+from models.participants import ParticipantsFilter, ParticipantType
+
+FILTER_USAGE = '\n'.join(
+    [
+        'Фильтр для следующей обработки /done:',
+        '/filter 30d - сообщения за последние 30 дней, включая сегодня',
+        '/filter 2024-01-01..2024-03-31 - сообщения за период',
+        '/filter roles=author,mention - только эти роли',
+        '/filter types=message - только эти типы сообщений',
+        '/filter off - сбросить фильтр',
+    ]
+)
+
+# Роли, которые находит разбор выгрузки
+FILTER_ROLES: dict[str, ParticipantType] = {
+    p_type.value: p_type
+    for p_type in (
+        ParticipantType.AUTHOR,
+        ParticipantType.MENTION,
+        ParticipantType.REACTION,
+        ParticipantType.FORWARDED_FROM,
+        ParticipantType.ACTOR,
+    )
+}
+FILTER_MESSAGE_TYPES = frozenset({'message', 'service'})
+
+_LAST_DAYS_RE = re.compile(r'(\d+)d')
+
+
+def _parse_day(value: str) -> date | None:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Неверная дата: {value}') from None
+
+
+def _parse_values[T](
+    value: str,
+    allowed: dict[str, T],
+    *,
+    what: str,
+) -> frozenset[T]:
+    names = [
+        name for part in value.split(',') if (name := part.strip().lower())
+    ]
+    unknown = [name for name in names if name not in allowed]
+    if unknown or not names:
+        raise ValueError(
+            f'Неизвестные {what}: {", ".join(unknown) or value}. '
+            f'Доступны: {", ".join(allowed)}'
+        )
+    return frozenset(allowed[name] for name in names)
+
+
+# Аргументы /filter дополняют текущий фильтр: после /filter 30d
+# и /filter roles=author действуют два условия. Nd - N дней по today
+# включительно, бот передает today по UTC
+def parse_filter_args(
+    args: str,
+    current: ParticipantsFilter,
+    *,
+    today: date,
+) -> ParticipantsFilter:
+    changes: dict[str, object] = {}
+    for token in args.split():
+        key, sep, value = token.partition('=')
+        if token.lower() == 'off':
+            current = ParticipantsFilter()
+            changes.clear()
+        elif match := _LAST_DAYS_RE.fullmatch(token.lower()):
+            days = int(match[1])
+            if days < 1:
+                raise ValueError(f'Непонятный параметр: {token}')
+            changes['since'] = today - timedelta(days=days - 1)
+            changes['until'] = None
+        elif '..' in token:
+            since, _, until = token.partition('..')
+            changes['since'] = _parse_day(since)
+            changes['until'] = _parse_day(until)
+        elif sep and key.lower() == 'roles':
+            changes['roles'] = _parse_values(value, FILTER_ROLES, what='роли')
+        elif sep and key.lower() == 'types':
+            changes['message_types'] = _parse_values(
+                value,
+                {name: name for name in sorted(FILTER_MESSAGE_TYPES)},
+                what='типы',
+            )
+        else:
+            raise ValueError(f'Непонятный параметр: {token}')
+
+    updated = current.model_copy(update=changes)
+    if (
+        updated.since is not None
+        and updated.until is not None
+        and updated.since > updated.until
+    ):
+        raise ValueError('Начало периода позже конца')
+    return updated
+
+
+def describe_filter(participants_filter: ParticipantsFilter) -> str:
+    if participants_filter.is_empty:
+        return 'Фильтр не задан'
+
+    lines = ['Фильтр для следующей обработки /done:']
+    since, until = participants_filter.since, participants_filter.until
+    if since is not None or until is not None:
+        period = ' - '.join(
+            [
+                since.isoformat() if since else 'начало',
+                until.isoformat() if until else 'сегодня',
+            ]
+        )
+        lines.append(f'период: {period}')
+    if participants_filter.roles is not None:
+        lines.append(f'роли: {", ".join(sorted(participants_filter.roles))}')
+    if participants_filter.message_types is not None:
+        types = ', '.join(sorted(participants_filter.message_types))
+        lines.append(f'типы сообщений: {types}')
+    return '\n'.join(lines)
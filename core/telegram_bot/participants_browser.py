@@ -0,0 +1,379 @@
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass
+import itertools
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Protocol
+
+from models.participants import Participant
+
+type ParticipantRenderer = Callable[[Participant], str]
+
+PAGE_ENTRIES_SEPARATOR = '\n\n'
+
+# Хранятся отсортированные участники и границы уже показанных страниц.
+# Текст страницы рендерится при запросе, листать результат может любой
+# процесс, не только построивший результат
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS browser_results (
+    result_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL UNIQUE,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS browser_participants (
+    result_id INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    participant TEXT NOT NULL,
+    PRIMARY KEY (result_id, pos)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS browser_page_bounds (
+    result_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    page_start INTEGER NOT NULL,
+    page_end INTEGER NOT NULL,
+    PRIMARY KEY (result_id, idx)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class ParticipantsPage:
+    index: int
+    start: int
+    end: int
+    total: int
+    text: str
+
+    @property
+    def has_prev(self) -> bool:
+        return self.index > 0
+
+    @property
+    def has_next(self) -> bool:
+        return self.end < self.total
+
+
+# Как участники раскладываются по страницам: не больше page_size
+# записей и max_length символов, но хотя бы один участник на странице
+@dataclass(frozen=True, slots=True)
+class PageLayout:
+    render: ParticipantRenderer
+    page_size: int
+    max_length: int
+
+    # participants - участники от первого на странице и дальше
+    def render_page(
+        self,
+        participants: Iterable[Participant],
+        *,
+        index: int,
+        start: int,
+        total: int,
+    ) -> ParticipantsPage:
+        entries: list[str] = []
+        length = 0
+
+        for participant in itertools.islice(participants, self.page_size):
+            entry = self.render(participant)
+            added = len(entry) + (
+                len(PAGE_ENTRIES_SEPARATOR) if entries else 0
+            )
+            if entries and length + added > self.max_length:
+                break
+            entries.append(entry)
+            length += added
+
+        return ParticipantsPage(
+            index=index,
+            start=start,
+            end=start + len(entries),
+            total=total,
+            text=PAGE_ENTRIES_SEPARATOR.join(entries),
+        )
+
+
+# Страницы рендерятся лениво и запоминаются, участники должны прийти
+# уже отсортированными
+class ParticipantsBrowser:
+    def __init__(
+        self,
+        participants: Sequence[Participant],
+        *,
+        layout: PageLayout,
+    ) -> None:
+        self._participants = participants
+        self._layout = layout
+        self._pages: list[ParticipantsPage] = []
+
+    @property
+    def participants(self) -> Sequence[Participant]:
+        return self._participants
+
+    @property
+    def total(self) -> int:
+        return len(self._participants)
+
+    def page(self, index: int) -> ParticipantsPage:
+        index = max(index, 0)
+        while index >= len(self._pages) and (
+            not self._pages or self._pages[-1].has_next
+        ):
+            self._pages.append(self._render_page(len(self._pages)))
+        return self._pages[min(index, len(self._pages) - 1)]
+
+    def pages(self) -> Iterator[ParticipantsPage]:
+        for index in itertools.count():
+            page = self.page(index)
+            yield page
+            if not page.has_next:
+                return
+
+    def _render_page(self, index: int) -> ParticipantsPage:
+        start = self._pages[-1].end if self._pages else 0
+        return self._layout.render_page(
+            self._participants[start : start + self._layout.page_size],
+            index=index,
+            start=start,
+            total=self.total,
+        )
+
+
+# result_id нужен, чтобы кнопки под старыми сообщениями не листали
+# более новый результат того же чата. Вызовы идут из потоков
+class ParticipantsBrowserStore(Protocol):
+    def put(self, chat_id: int, browser: ParticipantsBrowser) -> int: ...
+
+    def page(
+        self,
+        chat_id: int,
+        result_id: int,
+        index: int,
+    ) -> ParticipantsPage | None: ...
+
+
+# Кэш в памяти процесса. Кроме числа результатов ограничен суммой
+# участников в них: каждый держит весь список
+class ParticipantsBrowserCache:
+    def __init__(self, max_size: int, *, max_participants: int) -> None:
+        self._max_size = max_size
+        self._max_participants = max_participants
+        self._participants = 0
+        self._browsers: OrderedDict[int, tuple[int, ParticipantsBrowser]] = (
+            OrderedDict()
+        )
+        self._result_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def put(self, chat_id: int, browser: ParticipantsBrowser) -> int:
+        with self._lock:
+            result_id = next(self._result_ids)
+            self._drop(chat_id)
+            self._browsers[chat_id] = (result_id, browser)
+            self._participants += browser.total
+            # Последний результат остается, даже если один превышает лимит
+            while len(self._browsers) > 1 and (
+                len(self._browsers) > self._max_size
+                or self._participants > self._max_participants
+            ):
+                self._drop(next(iter(self._browsers)))
+            return result_id
+
+    def page(
+        self,
+        chat_id: int,
+        result_id: int,
+        index: int,
+    ) -> ParticipantsPage | None:
+        with self._lock:
+            cached = self._browsers.get(chat_id)
+            if cached is None or cached[0] != result_id:
+                return None
+            self._browsers.move_to_end(chat_id)
+            return cached[1].page(index)
+
+    def _drop(self, chat_id: int) -> None:
+        cached = self._browsers.pop(chat_id, None)
+        if cached is not None:
+            self._participants -= cached[1].total
+
+
+# Результаты в SQLite, общие для воркеров webhook-сервера: кнопка
+# листания может прийти в любой процесс. Лимиты как в кэше в памяти,
+# вытесняются самые давние результаты. Страницы раскладываются по
+# layout хранилища, layout браузеров в put роли не играет
+class SqliteParticipantsBrowserStore:
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        layout: PageLayout,
+        max_size: int,
+        max_participants: int,
+    ) -> None:
+        self._path = Path(path)
+        self._layout = layout
+        self._max_size = max_size
+        self._max_participants = max_participants
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._connection_pid: int | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Хранилище создается до fork воркеров, соединение открывается
+        # отдельно в каждом процессе
+        pid = os.getpid()
+        if self._connection is not None and self._connection_pid == pid:
+            return self._connection
+
+        connection = sqlite3.connect(
+            self._path,
+            timeout=30,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(_SCHEMA)
+
+        self._connection = connection
+        self._connection_pid = pid
+        return connection
+
+    def put(self, chat_id: int, browser: ParticipantsBrowser) -> int:
+        rows = [
+            participant.model_dump_json(exclude_defaults=True)
+            for participant in browser.participants
+        ]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                self._delete(connection, 'chat_id = ?', (chat_id,))
+                cursor = connection.execute(
+                    'INSERT INTO browser_results (chat_id, total) '
+                    'VALUES (?, ?)',
+                    (chat_id, browser.total),
+                )
+                result_id = cursor.lastrowid
+                assert result_id is not None
+                connection.executemany(
+                    'INSERT INTO browser_participants '
+                    '(result_id, pos, participant) VALUES (?, ?, ?)',
+                    [(result_id, pos, row) for pos, row in enumerate(rows)],
+                )
+                self._evict(connection)
+        return result_id
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        count, participants = connection.execute(
+            'SELECT count(*), coalesce(sum(total), 0) FROM browser_results'
+        ).fetchone()
+        # Последний результат остается, даже если один превышает лимит
+        stale = connection.execute(
+            'SELECT result_id, total FROM browser_results '
+            'ORDER BY result_id LIMIT ?',
+            (count - 1,),
+        ).fetchall()
+        for result_id, total in stale:
+            if (
+                count <= self._max_size
+                and participants <= self._max_participants
+            ):
+                break
+            self._delete(connection, 'result_id = ?', (result_id,))
+            count -= 1
+            participants -= total
+
+    def _delete(
+        self,
+        connection: sqlite3.Connection,
+        where: str,
+        params: tuple[int],
+    ) -> None:
+        for (result_id,) in connection.execute(
+            f'DELETE FROM browser_results WHERE {where} RETURNING result_id',
+            params,
+        ).fetchall():
+            for table in ('browser_participants', 'browser_page_bounds'):
+                connection.execute(
+                    f'DELETE FROM {table} WHERE result_id = ?',
+                    (result_id,),
+                )
+
+    def page(
+        self,
+        chat_id: int,
+        result_id: int,
+        index: int,
+    ) -> ParticipantsPage | None:
+        index = max(index, 0)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                result = connection.execute(
+                    'SELECT total FROM browser_results '
+                    'WHERE result_id = ? AND chat_id = ?',
+                    (result_id, chat_id),
+                ).fetchone()
+                if result is None:
+                    return None
+                (total,) = result
+
+                # Ближайшая известная граница не дальше нужной страницы,
+                # от нее страницы раскладываются вперед до index
+                bound = connection.execute(
+                    'SELECT idx, page_start FROM browser_page_bounds '
+                    'WHERE result_id = ? AND idx <= ? '
+                    'ORDER BY idx DESC LIMIT 1',
+                    (result_id, index),
+                ).fetchone()
+                page_index, start = bound if bound is not None else (0, 0)
+                while True:
+                    page = self._render_page(
+                        connection,
+                        result_id,
+                        index=page_index,
+                        start=start,
+                        total=total,
+                    )
+                    connection.execute(
+                        'INSERT OR IGNORE INTO browser_page_bounds '
+                        '(result_id, idx, page_start, page_end) '
+                        'VALUES (?, ?, ?, ?)',
+                        (result_id, page.index, page.start, page.end),
+                    )
+                    if page.index >= index or not page.has_next:
+                        return page
+                    page_index, start = page.index + 1, page.end
+
+    def _render_page(
+        self,
+        connection: sqlite3.Connection,
+        result_id: int,
+        *,
+        index: int,
+        start: int,
+        total: int,
+    ) -> ParticipantsPage:
+        rows = connection.execute(
+            'SELECT participant FROM browser_participants '
+            'WHERE result_id = ? AND pos >= ? ORDER BY pos LIMIT ?',
+            (result_id, start, self._layout.page_size),
+        )
+        return self._layout.render_page(
+            (Participant.model_validate_json(row) for (row,) in rows),
+            index=index,
+            start=start,
+            total=total,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if (
+                self._connection is not None
+                and self._connection_pid == os.getpid()
+            ):
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
@@ -0,0 +1,289 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+import contextlib
+from dataclasses import dataclass, field
+import enum
+import heapq
+import itertools
+import logging
+import time
+from typing import Any
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, InputFile, Message
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и не чаще
+# одного сообщения в секунду в один чат
+DEFAULT_GLOBAL_RATE = 30.0
+DEFAULT_CHAT_INTERVAL = 1.0
+DEFAULT_MAX_RETRIES = 5
+
+
+class SendPriority(enum.IntEnum):
+    # Меньшее значение уходит раньше
+    RESULT = 0
+    REPLY = 1
+    ACK = 2
+
+
+# Ожидающий отправки код мог быть отменен, тогда результат не нужен
+def _resolve(future: asyncio.Future[Any], result: Any) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _fail(future: asyncio.Future[Any], error: BaseException) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+@dataclass(order=True, slots=True)
+class _Job:
+    priority: SendPriority
+    seq: int
+    call: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future[Any] = field(compare=False)
+    coalesce_key: str | None = field(default=None, compare=False)
+    retries: int = field(default=0, compare=False)
+
+
+@dataclass(slots=True)
+class _ChatQueue:
+    jobs: list[_Job] = field(default_factory=list)
+    # Еще не отправленные сообщения, которые можно заменить более новыми
+    coalescing: dict[str, _Job] = field(default_factory=dict)
+    ready_at: float = 0.0
+    busy: bool = False
+
+
+# Очередь исходящих сообщений бота. Один фоновый worker выбирает
+# самое приоритетное сообщение среди чатов, которым уже можно писать,
+# и держит общий темп global_rate сообщений в секунду. Чат получает
+# не больше одного сообщения за раз, следующее - не раньше чем через
+# chat_interval. Ответ 429 возвращает сообщение в очередь, и чат ждет
+# retry_after секунд
+class OutboundSender:
+    def __init__(
+        self,
+        *,
+        global_rate: float = DEFAULT_GLOBAL_RATE,
+        chat_interval: float = DEFAULT_CHAT_INTERVAL,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ) -> None:
+        self._global_interval = 1 / global_rate
+        self._chat_interval = chat_interval
+        self._max_retries = max_retries
+
+        self._chats: dict[int, _ChatQueue] = {}
+        self._seq = itertools.count()
+        self._next_send_at = 0.0
+
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task[None] | None = None
+        self._in_flight: set[asyncio.Task[None]] = set()
+
+    async def start(self) -> None:
+        if self._worker is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._worker
+        self._worker = None
+
+        for task in self._in_flight:
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+        for chat in self._chats.values():
+            for job in chat.jobs:
+                job.future.cancel()
+        self._chats.clear()
+
+    async def send[T](
+        self,
+        chat_id: int,
+        call: Callable[[], Awaitable[T]],
+        *,
+        priority: SendPriority = SendPriority.REPLY,
+        coalesce_key: str | None = None,
+    ) -> T | None:
+        # None возвращается, если до отправки сообщение заменено более
+        # новым, имеющим тот же coalesce_key
+        if self._worker is None or self._wakeup is None:
+            raise RuntimeError('OutboundSender is not started')
+
+        future: asyncio.Future[Any] = (
+            asyncio.get_running_loop().create_future()
+        )
+        chat = self._chats.setdefault(chat_id, _ChatQueue())
+
+        queued = (
+            chat.coalescing.get(coalesce_key)
+            if coalesce_key is not None
+            else None
+        )
+        if queued is not None:
+            # Сообщение занимает место в очереди заменяемого
+            queued.call = call
+            _resolve(queued.future, None)
+            queued.future = future
+        else:
+            job = _Job(
+                priority=priority,
+                seq=next(self._seq),
+                call=call,
+                future=future,
+                coalesce_key=coalesce_key,
+            )
+            heapq.heappush(chat.jobs, job)
+            if coalesce_key is not None:
+                chat.coalescing[coalesce_key] = job
+            self._wakeup.set()
+
+        result: T | None = await future
+        return result
+
+    async def answer(
+        self,
+        message: Message,
+        text: str,
+        *,
+        priority: SendPriority = SendPriority.REPLY,
+        coalesce_key: str | None = None,
+        reply_markup: InlineKeyboardMarkup | None = None,
+    ) -> Message | None:
+        return await self.send(
+            message.chat.id,
+            lambda: message.answer(text, reply_markup=reply_markup),
+            priority=priority,
+            coalesce_key=coalesce_key,
+        )
+
+    async def answer_document(
+        self,
+        message: Message,
+        document: InputFile,
+        *,
+        priority: SendPriority = SendPriority.RESULT,
+    ) -> Message | None:
+        return await self.send(
+            message.chat.id,
+            lambda: message.answer_document(document),
+            priority=priority,
+        )
+
+    async def edit_text(
+        self,
+        message: Message,
+        text: str,
+        *,
+        reply_markup: InlineKeyboardMarkup | None = None,
+    ) -> Message | bool | None:
+        return await self.send(
+            message.chat.id,
+            lambda: message.edit_text(text, reply_markup=reply_markup),
+        )
+
+    def _pick_chat(self, now: float) -> int | None:
+        picked: int | None = None
+        picked_job: _Job | None = None
+        idle: list[int] = []
+
+        for chat_id, chat in self._chats.items():
+            if not chat.jobs:
+                if not chat.busy and chat.ready_at <= now:
+                    idle.append(chat_id)
+                continue
+            if chat.busy or chat.ready_at > now:
+                continue
+            if picked_job is None or chat.jobs[0] < picked_job:
+                picked, picked_job = chat_id, chat.jobs[0]
+
+        for chat_id in idle:
+            del self._chats[chat_id]
+        return picked
+
+    def _next_ready_delay(self, now: float) -> float | None:
+        delays = [
+            chat.ready_at - now
+            for chat in self._chats.values()
+            if chat.jobs and not chat.busy
+        ]
+        return max(min(delays), 0.0) if delays else None
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            now = time.monotonic()
+            chat_id = self._pick_chat(now)
+            if chat_id is None:
+                self._wakeup.clear()
+                with contextlib.suppress(TimeoutError):
+                    async with asyncio.timeout(self._next_ready_delay(now)):
+                        await self._wakeup.wait()
+                continue
+
+            if self._next_send_at > now:
+                # Пока ждем общий лимит, мог прийти более важный ответ,
+                # поэтому после паузы чат выбирается заново
+                await asyncio.sleep(self._next_send_at - now)
+                continue
+            self._next_send_at = now + self._global_interval
+
+            chat = self._chats[chat_id]
+            job = heapq.heappop(chat.jobs)
+            if job.coalesce_key is not None:
+                chat.coalescing.pop(job.coalesce_key, None)
+            chat.busy = True
+
+            task = asyncio.create_task(self._deliver(chat, job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _deliver(self, chat: _ChatQueue, job: _Job) -> None:
+        cooldown = self._chat_interval
+        try:
+            result = await job.call()
+        except TelegramRetryAfter as e:
+            if job.retries >= self._max_retries:
+                _fail(job.future, e)
+            else:
+                job.retries += 1
+                cooldown = max(cooldown, e.retry_after)
+                logger.warning(
+                    'Flood control, retry in %s s (attempt %s)',
+                    e.retry_after,
+                    job.retries,
+                )
+                self._requeue(chat, job)
+        except asyncio.CancelledError:
+            # stop() отменил отправку, ожидающий send не должен зависнуть
+            job.future.cancel()
+            raise
+        except Exception as e:
+            _fail(job.future, e)
+        else:
+            _resolve(job.future, result)
+        finally:
+            chat.ready_at = time.monotonic() + cooldown
+            chat.busy = False
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    @staticmethod
+    def _requeue(chat: _ChatQueue, job: _Job) -> None:
+        if job.coalesce_key is not None:
+            if job.coalesce_key in chat.coalescing:
+                # Пока ждали, в очередь встало более новое сообщение
+                _resolve(job.future, None)
+                return
+            chat.coalescing[job.coalesce_key] = job
+        heapq.heappush(chat.jobs, job)
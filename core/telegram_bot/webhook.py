@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing import connection as mp_connection
+import signal
+import socket
+from types import FrameType
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import (
+    setup_application,
+    SimpleRequestHandler,
+)
+from aiohttp import web
+
+HEALTH_PATH = '/healthz'
+
+logger = logging.getLogger(__name__)
+
+
+async def _health_handler(_: web.Request) -> web.Response:
+    return web.Response(text='ok')
+
+
+def build_webhook_app(
+    bot: Bot,
+    dispatcher: Dispatcher,
+    *,
+    path: str,
+    secret_token: str | None = None,
+) -> web.Application:
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=secret_token,
+    ).register(app, path=path)
+    app.router.add_get(HEALTH_PATH, _health_handler)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def _register_webhook(
+    bot: Bot,
+    dispatcher: Dispatcher,
+    *,
+    url: str,
+    secret_token: str,
+) -> None:
+    try:
+        await bot.set_webhook(
+            url,
+            secret_token=secret_token,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+    finally:
+        # Сессия не должна пережить fork воркеров
+        await bot.session.close()
+
+
+def _serve(
+    sock: socket.socket,
+    bot: Bot,
+    dispatcher: Dispatcher,
+    *,
+    path: str,
+    secret_token: str,
+) -> None:
+    app = build_webhook_app(
+        bot,
+        dispatcher,
+        path=path,
+        secret_token=secret_token,
+    )
+    web.run_app(app, sock=sock, print=None)
+
+
+def _run_workers(  # noqa: PLR0913
+    sock: socket.socket,
+    bot: Bot,
+    dispatcher: Dispatcher,
+    *,
+    path: str,
+    secret_token: str,
+    workers: int,
+) -> None:
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(
+            target=_serve,
+            args=(sock, bot, dispatcher),
+            kwargs={'path': path, 'secret_token': secret_token},
+            name=f'webhook-worker-{i}',
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(_signum: int, _frame: FrameType | None) -> None:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Если какой-то воркер упал, останавливаем остальные: перезапуском
+    # займется оркестратор
+    mp_connection.wait([process.sentinel for process in processes])
+    stop(signal.SIGTERM, None)
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            logger.warning(
+                'Worker %s exited with code %s',
+                process.name,
+                process.exitcode,
+            )
+
+
+def run_webhook(  # noqa: PLR0913
+    bot: Bot,
+    dispatcher: Dispatcher,
+    *,
+    url: str,
+    path: str,
+    host: str,
+    port: int,
+    secret_token: str,
+    workers: int = 1,
+) -> None:
+    asyncio.run(
+        _register_webhook(
+            bot,
+            dispatcher,
+            url=url,
+            secret_token=secret_token,
+        )
+    )
+
+    # Сокет общий для всех воркеров, входящие соединения между ними
+    # распределяет ядро
+    sock = socket.create_server((host, port), backlog=1024)
+    with sock:
+        if workers == 1:
+            _serve(
+                sock,
+                bot,
+                dispatcher,
+                path=path,
+                secret_token=secret_token,
+            )
+            return
+
+        _run_workers(
+            sock,
+            bot,
+            dispatcher,
+            path=path,
+            secret_token=secret_token,
+            workers=workers,
+        )
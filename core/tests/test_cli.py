@@ -0,0 +1,113 @@
+import csv
+from pathlib import Path
+import random
+
+from openpyxl import load_workbook
+import pytest
+
+from entrypoints.cli import find_exports, main
+from scripts.fake_bot_api import build_export
+from services.parser import (
+    is_deleted_account,
+    JsonTelegramParser,
+    merge_participants,
+    ParticipantsExporter,
+)
+
+
+def _write_exports(root: Path) -> list[Path]:
+    paths = []
+    for chat_id in (1, 2):
+        path = root / f'ChatExport_{chat_id}' / 'result.json'
+        path.parent.mkdir(parents=True)
+        path.write_bytes(
+            build_export(
+                participants=20,
+                messages=50,
+                rng=random.Random(chat_id),
+                chat_id=chat_id,
+            )
+        )
+        paths.append(path)
+    return paths
+
+
+def test_find_exports_accepts_dirs_files_and_globs(tmp_path: Path) -> None:
+    first, second = _write_exports(tmp_path)
+
+    found = find_exports(
+        [str(tmp_path), str(first), str(tmp_path / '**' / 'result.json')],
+    )
+
+    # Файлы из пересекающихся источников не повторяются
+    assert found == [first.resolve(), second.resolve()]
+
+
+def test_cli_writes_table_per_file(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    _write_exports(tmp_path / 'in')
+    out = tmp_path / 'out'
+
+    code = main(
+        [str(tmp_path / 'in'), '-o', str(out), '--format', 'csv.gz'],
+    )
+
+    assert code == 0
+    assert sorted(p.name for p in out.iterdir()) == [
+        'ChatExport_1_result.csv.gz',
+        'ChatExport_2_result.csv.gz',
+    ]
+    assert 'files: 2 (0 failed)' in capsys.readouterr().out
+
+
+def test_cli_merges_files_and_reports_failures(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    exports = _write_exports(tmp_path)
+    (tmp_path / 'broken.json').write_text('{')
+    merged = tmp_path / 'merged' / 'all.csv'
+
+    code = main(
+        [str(tmp_path), '--merge', '-o', str(merged), '--workers', '2'],
+    )
+
+    assert code == 1
+    output = capsys.readouterr().out
+    assert 'FAILED' in output
+    assert 'files: 3 (1 failed)' in output
+
+    with merged.open(encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    # Результат равен слиянию в памяти исправных файлов
+    expected = merge_participants(
+        [
+            [
+                p
+                for p in ParticipantsExporter()
+                .export(JsonTelegramParser().parse_path(path))
+                .participants
+                if not is_deleted_account(p.full_name)
+            ]
+            for path in exports
+        ]
+    )
+    assert [row[1] for row in rows[2:]] == [
+        p.full_name or '' for p in expected
+    ]
+    assert f'merged: {len(expected)}' in output
+
+
+def test_cli_merged_xlsx_by_default_name(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    _write_exports(tmp_path / 'in')
+    monkeypatch.chdir(tmp_path)
+
+    assert main(['in', '--merge']) == 0
+
+    (merged,) = tmp_path.glob('participants_*.xlsx')
+    assert load_workbook(merged).sheetnames == ['Sheet1']
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import random
+import tracemalloc
+from typing import Any
+
+from scripts.fake_bot_api import FAKE_BOT_TOKEN, FakeBotApi
+from services.dedup import MAX_BITMAP_SPAN, MessageDeduplicator
+from services.merge import ParticipantsMerger
+from services.parser import export_participants, parse_messages
+from telegram_bot.bot import _collect_participants_from_files, provide_bot
+
+
+def _export(chat_id: int | None, message_ids: range) -> dict[str, Any]:
+    return {
+        'id': chat_id,
+        'messages': [
+            {
+                'id': message_id,
+                'type': 'message',
+                'from': f'User {message_id}',
+                'from_id': f'user{message_id}',
+                'text': 'hi',
+            }
+            for message_id in message_ids
+        ],
+    }
+
+
+def test_add_detects_repeats_per_chat() -> None:
+    dedup = MessageDeduplicator()
+
+    assert dedup.add(1, 10)
+    assert dedup.add(2, 10)
+    assert not dedup.add(1, 10)
+    assert dedup.add(1, 9)
+    assert dedup.add(1, MAX_BITMAP_SPAN + 5)
+    assert not dedup.add(1, MAX_BITMAP_SPAN + 5)
+    assert dedup.add(1, -1)
+
+    assert (dedup.seen, dedup.duplicates) == (7, 2)
+
+
+def test_bitmap_is_sized_by_id_span() -> None:
+    dedup = MessageDeduplicator()
+
+    tracemalloc.start()
+    try:
+        assert dedup.add(1, MAX_BITMAP_SPAN - 1)
+        assert dedup.add(1, MAX_BITMAP_SPAN - 1000)
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Один большой id не выделяет карту от нуля (16 МБ)
+    assert allocated < 64 * 1024
+    assert not dedup.add(1, MAX_BITMAP_SPAN - 1000)
+
+
+def test_bitmap_grows_down_within_span() -> None:
+    dedup = MessageDeduplicator()
+    top = 10 * MAX_BITMAP_SPAN
+    for message_id in range(top, top - 80_000, -8):
+        assert dedup.add(1, message_id)
+
+    # Запас снизу не выводит карту за MAX_BITMAP_SPAN
+    lowest = top + 8 - MAX_BITMAP_SPAN
+    assert dedup.add(1, lowest)
+    assert dedup.add(1, lowest - 8)
+    assert len(dedup._bitmaps[1]) * 8 == MAX_BITMAP_SPAN
+    assert dedup._sparse[1] == {lowest - 8}
+    assert not dedup.add(1, lowest)
+    assert not dedup.add(1, top - 8)
+
+
+def test_add_matches_set_of_seen_ids() -> None:
+    rng = random.Random(0)
+    base = rng.randrange(1 << 40)
+    dedup = MessageDeduplicator()
+    seen: set[int] = set()
+
+    # Id вразброс вокруг первого, часть - далеко за пределами размаха
+    for _ in range(5000):
+        message_id = base + rng.choice(
+            [
+                rng.randrange(-3000, 3000),
+                rng.randrange(-2 * MAX_BITMAP_SPAN, 2 * MAX_BITMAP_SPAN),
+            ]
+        )
+        assert dedup.add(1, message_id) == (message_id not in seen)
+        seen.add(message_id)
+
+
+def test_overlapping_exports_are_parsed_once() -> None:
+    dedup = MessageDeduplicator()
+
+    first = parse_messages(_export(1, range(1, 101)), dedup=dedup)
+    second = parse_messages(_export(1, range(51, 151)), dedup=dedup)
+    other_chat = parse_messages(_export(2, range(1, 51)), dedup=dedup)
+
+    assert [m.id for m in first] == list(range(1, 101))
+    assert [m.id for m in second] == list(range(101, 151))
+    assert len(other_chat) == 50  # noqa: PLR2004
+    assert dedup.duplicates == 50  # noqa: PLR2004
+    assert dedup.hit_rate == 50 / 250
+    assert len(export_participants(second).participants) == 50  # noqa: PLR2004
+
+
+def test_messages_without_ids_are_kept() -> None:
+    dedup = MessageDeduplicator()
+
+    parse_messages(_export(None, range(1, 11)), dedup=dedup)
+    repeated = parse_messages(_export(None, range(1, 11)), dedup=dedup)
+
+    assert len(repeated) == 10  # noqa: PLR2004
+    assert dedup.seen == 0
+
+
+def test_exports_of_one_chat_share_source_bit() -> None:
+    async def run() -> tuple[list[str], list[int], list[int]]:
+        async with FakeBotApi() as api:
+            api.add_file('a1', json.dumps(_export(1, range(1, 11))).encode())
+            api.add_file('a2', json.dumps(_export(1, range(1, 11))).encode())
+            api.add_file('b', json.dumps(_export(2, range(5, 15))).encode())
+            bot = provide_bot(FAKE_BOT_TOKEN, api_url=api.base_url)
+            with ParticipantsMerger() as merger:
+                (
+                    source_names,
+                    chat_ids,
+                    failed,
+                ) = await _collect_participants_from_files(
+                    bot,
+                    files=[
+                        {'file_id': 'a1', 'file_name': 'a1.json'},
+                        {'file_id': 'a2', 'file_name': 'a2.json'},
+                        {'file_id': 'b', 'file_name': 'b.json'},
+                    ],
+                    merger=merger,
+                    dedup=MessageDeduplicator(),
+                    run_job=asyncio.to_thread,
+                )
+                sources = [p.sources for p in merger]
+            await bot.session.close()
+            assert failed is None
+            return source_names, chat_ids, sources
+
+    source_names, chat_ids, sources = asyncio.run(run())
+
+    # Повторная выгрузка чата 1 целиком отброшена дедупликацией, но
+    # участники чата 1 по-прежнему отмечены только битом чата 1
+    assert source_names == ['a1.json, a2.json', 'b.json']
+    assert chat_ids == [1, 2]
+    assert sources == [0b01] * 4 + [0b11] * 6 + [0b10] * 4
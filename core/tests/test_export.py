@@ -1,4 +1,5 @@
 from datetime import datetime
+import io
 from pathlib import Path
 
 from openpyxl import load_workbook
@@ -11,6 +12,8 @@ from models.participants import (
 from services.export import (
     export_csv,
     export_excel,
+    export_participants_csv,
+    export_participants_excel,
 )
 
 
@@ -71,3 +74,96 @@ def test_export_excel_with_export_date_header(tmp_path: Path) -> None:
 
     assert worksheet.cell(row=2, column=1).value == 'Username'
     assert worksheet.cell(row=2, column=5).value != 'Дата экспорта'
+
+
+def test_export_excel_to_binary_stream() -> None:
+    report = ParticipantsReport(
+        exported_at=datetime(2024, 1, 1, 12, 0, 0),
+        participants=[Participant(user_id='user1', username='alice')],
+    )
+
+    buffer = io.BytesIO()
+    export_excel(report, buffer)
+    buffer.seek(0)
+
+    worksheet = load_workbook(buffer).active
+
+    assert worksheet is not None
+    assert worksheet.cell(row=1, column=2).value == '2024-01-01'
+    assert worksheet.cell(row=3, column=1).value == '@alice'
+
+
+def test_export_csv_to_binary_stream_keeps_stream_open() -> None:
+    report = ParticipantsReport(
+        exported_at=datetime(2024, 1, 1, 12, 0, 0),
+        participants=[Participant(user_id='user1', username='alice')],
+    )
+
+    buffer = io.BytesIO()
+    export_csv(report, buffer, sep=';')
+
+    assert not buffer.closed
+    content = buffer.getvalue().decode('utf-8').splitlines()
+    assert content[0] == 'Дата экспорта;2024-01-01'
+    assert content[2].startswith('@alice;')
+
+
+def test_export_participants_csv_from_iterator() -> None:
+    participants = [
+        Participant(user_id='user1', username='alice'),
+        Participant(user_id='user2', full_name='Bob'),
+    ]
+    report = ParticipantsReport(
+        exported_at=datetime(2024, 1, 2),
+        participants=participants,
+    )
+    expected = io.BytesIO()
+    export_csv(report, expected)
+
+    streamed = io.BytesIO()
+    export_participants_csv(
+        iter(participants),
+        streamed,
+        exported_at=report.exported_at,
+    )
+
+    assert streamed.getvalue() == expected.getvalue()
+
+
+def test_export_excel_adds_overlap_sheets_for_several_sources() -> None:
+    participants = [
+        Participant(user_id='user1', username='alice', sources=0b11),
+        Participant(user_id='user2', username='bob', sources=0b01),
+        Participant(user_id='user3', username='carol', sources=0b10),
+    ]
+    export_file = io.BytesIO()
+
+    export_participants_excel(
+        participants,
+        export_file,
+        exported_at=datetime(2024, 1, 2),
+        source_names=['one.json', 'two.json'],
+    )
+    export_file.seek(0)
+    workbook = load_workbook(export_file)
+
+    def rows(title: str) -> list[list[object]]:
+        return [
+            [cell.value for cell in row] for row in workbook[title].iter_rows()
+        ]
+
+    assert workbook.sheetnames == [
+        'Sheet1',
+        'Во всех чатах',  # noqa: RUF001
+        'Только в одном чате',
+        'Пересечения',
+    ]
+    assert [r[0] for r in rows('Во всех чатах')[1:]] == ['@alice']  # noqa: RUF001
+    assert [r[:2] for r in rows('Только в одном чате')[1:]] == [
+        ['one.json', '@bob'],
+        ['two.json', '@carol'],
+    ]
+    assert rows('Пересечения')[-2:] == [
+        ['one.json', 2, 1],
+        ['two.json', 1, 2],
+    ]
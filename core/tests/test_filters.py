@@ -0,0 +1,102 @@
+import asyncio
+from datetime import date
+import json
+
+import pytest
+
+from models.participants import ParticipantsFilter, ParticipantType
+from scripts.fake_bot_api import FakeBotApi, running_bot
+from telegram_bot.filters import parse_filter_args
+
+TODAY = date(2024, 3, 31)
+
+
+def test_filter_args_are_added_to_current_filter() -> None:
+    last_month = parse_filter_args('30d', ParticipantsFilter(), today=TODAY)
+    # 30 дней, включая сегодняшний
+    assert last_month == ParticipantsFilter(since=date(2024, 3, 2))
+
+    authors = parse_filter_args(
+        'roles=author,mention,  types=message',
+        last_month,
+        today=TODAY,
+    )
+    assert authors == ParticipantsFilter(
+        since=date(2024, 3, 2),
+        roles=frozenset({ParticipantType.AUTHOR, ParticipantType.MENTION}),
+        message_types=frozenset({'message'}),
+    )
+
+    period = parse_filter_args('2024-01-01..', authors, today=TODAY)
+    assert (period.since, period.until) == (date(2024, 1, 1), None)
+
+    assert parse_filter_args('off', period, today=TODAY).is_empty
+
+
+@pytest.mark.parametrize(
+    'args',
+    [
+        'roles=channel',
+        'types=sticker',
+        '2024-13-01..',
+        'yesterday',
+        'roles=',
+        'roles=,',
+        '0d',
+    ],
+)
+def test_invalid_filter_args(args: str) -> None:
+    with pytest.raises(ValueError, match=r'\S'):
+        parse_filter_args(args, ParticipantsFilter(), today=TODAY)
+
+
+def test_reversed_period_is_rejected() -> None:
+    with pytest.raises(ValueError, match='Начало периода'):
+        parse_filter_args(
+            '2024-02-01..2024-01-01',
+            ParticipantsFilter(),
+            today=TODAY,
+        )
+
+
+def _export() -> bytes:
+    messages = [
+        {
+            'id': i,
+            'type': 'message',
+            'date': f'2024-0{month}-15T12:00:00',
+            'from': f'User {i}',
+            'from_id': f'user{i}',
+            'text': '',
+            'reactions': [{'recent': [{'from': 'Fan', 'from_id': 'user99'}]}],
+        }
+        for i, month in enumerate([1, 2, 3], start=1)
+    ]
+    return json.dumps({'id': 1, 'messages': messages}).encode()
+
+
+def test_filter_command_applies_to_next_done() -> None:
+    async def run() -> str:
+        async with FakeBotApi() as api, running_bot(api) as running:
+            api.add_file('export', _export())
+            await api.push_text(1, '/start')
+            await api.push_text(1, '/filter 2024-02-01..')
+            await running.wait_idle()
+            await api.push_text(1, '/filter roles=author')
+            await api.push_document(
+                1,
+                file_id='export',
+                file_name='export.json',
+            )
+            await running.wait_idle()
+            after = await api.push_text(1, '/done')
+            await running.wait_idle()
+            (reply,) = api.sent_to(1, after=after)
+            return reply.params['text']
+
+    result = asyncio.run(run())
+
+    assert 'user2' in result
+    assert 'user3' in result
+    assert 'user1' not in result
+    assert 'user99' not in result
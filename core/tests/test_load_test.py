@@ -0,0 +1,22 @@
+import asyncio
+
+from scripts.load_test import format_report, LoadTestConfig, run_load_test
+
+
+def test_load_test_runs_scripted_sessions_against_fake_api() -> None:
+    config = LoadTestConfig(
+        chats=3,
+        files_per_chat=2,
+        participants_per_file=80,
+        messages_per_file=100,
+    )
+
+    report = asyncio.run(run_load_test(config))
+
+    assert report.jobs == config.chats
+    assert len(report.latencies['start']) == config.chats
+    assert len(report.latencies['document']) == (
+        config.chats * config.files_per_chat
+    )
+    assert report.percentile('done', 99) >= report.percentile('done', 50)
+    assert 'jobs/s' in format_report(report)
@@ -0,0 +1,106 @@
+import asyncio
+from pathlib import Path
+import random
+
+from aiogram import Bot
+import pytest
+
+from scripts.fake_bot_api import (
+    build_export,
+    FAKE_BOT_TOKEN,
+    FakeBotApi,
+    running_bot,
+)
+from telegram_bot.bot import provide_bot, PUBLIC_API_MAX_FILE_SIZE
+
+CHAT_ID = 1
+
+
+async def _upload_and_done(
+    api: FakeBotApi,
+    *,
+    is_local: bool,
+    file_size: int | None = None,
+) -> list[str]:
+    replies = []
+    async with running_bot(api, is_local=is_local) as running:
+        for push in (
+            api.push_text(CHAT_ID, '/start'),
+            api.push_document(
+                CHAT_ID,
+                file_id='export',
+                file_name='export.json',
+                file_size=file_size,
+            ),
+            api.push_text(CHAT_ID, '/done'),
+        ):
+            after = await push
+            await running.wait_idle()
+            replies.append(api.sent_to(CHAT_ID, after=after)[0].params['text'])
+    return replies
+
+
+def test_local_mode_reads_files_from_disk_without_downloading(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def no_download(*_: object, **__: object) -> None:
+        raise AssertionError('download_file must not be called')
+
+    # aiogram в локальном режиме тоже читает файл сам, но копирует
+    # содержимое по частям в BytesIO
+    monkeypatch.setattr(Bot, 'download_file', no_download)
+
+    async def run() -> tuple[list[str], int]:
+        async with FakeBotApi(local_dir=tmp_path) as api:
+            api.add_file(
+                'export',
+                build_export(
+                    participants=5,
+                    messages=20,
+                    rng=random.Random(0),
+                ),
+            )
+            replies = await _upload_and_done(api, is_local=True)
+            return replies, api.downloads
+
+    replies, downloads = asyncio.run(run())
+
+    assert downloads == 0
+    assert 'User' in replies[-1]
+
+
+def test_local_mode_accepts_files_over_public_limit(tmp_path: Path) -> None:
+    async def run() -> list[str]:
+        async with FakeBotApi(local_dir=tmp_path) as api:
+            api.add_file('export', b'{"messages": []}')
+            return await _upload_and_done(
+                api,
+                is_local=True,
+                file_size=PUBLIC_API_MAX_FILE_SIZE + 1,
+            )
+
+    replies = asyncio.run(run())
+
+    assert replies[1].startswith('Файл принят')
+
+
+def test_public_mode_rejects_files_over_limit() -> None:
+    async def run() -> list[str]:
+        async with FakeBotApi() as api:
+            api.add_file('export', b'{"messages": []}')
+            return await _upload_and_done(
+                api,
+                is_local=False,
+                file_size=PUBLIC_API_MAX_FILE_SIZE + 1,
+            )
+
+    replies = asyncio.run(run())
+
+    assert replies[1] == 'Файл больше 20 МБ — пропущен'
+    assert replies[2].startswith('Файлы не получены')
+
+
+def test_local_mode_requires_api_url() -> None:
+    with pytest.raises(ValueError, match='api_url'):
+        provide_bot(FAKE_BOT_TOKEN, is_local=True)
@@ -0,0 +1,137 @@
+from pathlib import Path
+import random
+
+from models.participants import Participant, ParticipantType
+from services.merge import ParticipantsMerger
+from services.parser import merge_participants
+
+ROLES = list(ParticipantType)
+
+
+def _random_participant(rng: random.Random) -> Participant:
+    i = rng.randrange(300)
+    seen_as = {rng.choice(ROLES)}
+    match rng.randrange(3):
+        case 0:
+            return Participant(
+                user_id=f'user{i}',
+                full_name=f'User {rng.randrange(5)}',
+                seen_as=seen_as,
+            )
+        case 1:
+            username = f'user_{i}'
+            return Participant(
+                username=username.upper() if i % 2 else f'@{username}',
+                seen_as=seen_as,
+            )
+        case _:
+            return Participant(full_name=f' Name {i} ', seen_as=seen_as)
+
+
+def _random_lists(seed: int) -> list[list[Participant]]:
+    rng = random.Random(seed)
+    return [
+        [_random_participant(rng) for _ in range(rng.randrange(50, 400))]
+        for _ in range(5)
+    ]
+
+
+def _as_tuples(
+    participants: list[Participant],
+) -> list[
+    tuple[str | None, str | None, str | None, set[ParticipantType], int]
+]:
+    return [
+        (p.user_id, p.username, p.full_name, p.seen_as, p.sources)
+        for p in participants
+    ]
+
+
+def test_merger_without_budget_matches_merge_participants() -> None:
+    participant_lists = _random_lists(seed=1)
+
+    with ParticipantsMerger() as merger:
+        for participants in participant_lists:
+            merger.add(participants)
+        merged = list(merger)
+        assert not merger.spilled
+
+    assert _as_tuples(merged) == _as_tuples(
+        merge_participants(participant_lists)
+    )
+
+
+def test_spilled_merge_matches_merge_participants(tmp_path: Path) -> None:
+    participant_lists = _random_lists(seed=2)
+
+    with ParticipantsMerger(
+        memory_budget=10_000,
+        partitions=4,
+        spill_dir=tmp_path,
+    ) as merger:
+        for participants in participant_lists:
+            merger.add(participants)
+        merged = list(merger)
+        assert merger.spilled
+
+    assert _as_tuples(merged) == _as_tuples(
+        merge_participants(participant_lists)
+    )
+    # Временные партиции удаляются при закрытии
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spilled_merge_is_merged_once_for_repeated_passes(
+    tmp_path: Path,
+) -> None:
+    participant_lists = _random_lists(seed=3)
+
+    with ParticipantsMerger(
+        memory_budget=10_000,
+        partitions=4,
+        spill_dir=tmp_path,
+    ) as merger:
+        for participants in participant_lists:
+            merger.add(participants)
+        # Прерванный проход не оставляет неполного результата
+        next(iter(merger))
+        first = list(merger)
+        (merge_dir,) = tmp_path.iterdir()
+        # После полного прохода на диске остается только слитый файл
+        assert [p.name for p in merge_dir.iterdir()] == ['merged.jsonl']
+        second = list(merger)
+
+    expected = _as_tuples(merge_participants(participant_lists))
+    assert _as_tuples(first) == expected
+    assert _as_tuples(second) == expected
+
+
+def test_spilled_merge_keeps_earliest_fields_and_unions_roles() -> None:
+    with ParticipantsMerger(memory_budget=1) as merger:
+        merger.add(
+            [
+                Participant(
+                    user_id='user1',
+                    full_name='First',
+                    seen_as={ParticipantType.AUTHOR},
+                ),
+                Participant(username='bob', seen_as={ParticipantType.MENTION}),
+            ]
+        )
+        merger.add(
+            [
+                Participant(
+                    user_id='user1',
+                    full_name='Second',
+                    seen_as={ParticipantType.REACTION},
+                ),
+            ]
+        )
+        merged = list(merger)
+
+    assert [p.full_name or p.username for p in merged] == ['First', 'bob']
+    assert merged[0].seen_as == {
+        ParticipantType.AUTHOR,
+        ParticipantType.REACTION,
+    }
+    assert [p.sources for p in merged] == [0b11, 0b01]
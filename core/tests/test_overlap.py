@@ -0,0 +1,42 @@
+from itertools import combinations
+import random
+
+from services.overlap import OverlapCounter, source_indexes
+
+
+def test_source_indexes() -> None:
+    assert source_indexes(0) == []
+    assert source_indexes(0b1011) == [0, 1, 3]
+
+
+def test_overlap_matches_pairwise_set_intersections() -> None:
+    rng = random.Random(0)
+    source_count = 4
+    sources = [rng.randrange(1, 1 << source_count) for _ in range(500)]
+    chats = [
+        {p for p, mask in enumerate(sources) if mask & (1 << i)}
+        for i in range(source_count)
+    ]
+
+    overlap = OverlapCounter(source_count)
+    for mask in sources:
+        overlap.add(mask)
+    matrix = overlap.matrix()
+
+    for i, j in combinations(range(source_count), 2):
+        assert matrix[i][j] == matrix[j][i] == len(chats[i] & chats[j])
+    for i in range(source_count):
+        assert matrix[i][i] == len(chats[i])
+        others = set().union(*(c for k, c in enumerate(chats) if k != i))
+        assert overlap.only_counts()[i] == len(chats[i] - others)
+    assert overlap.in_all_count == len(set.intersection(*chats))
+
+
+def test_only_source_and_in_all() -> None:
+    overlap = OverlapCounter(3)
+
+    assert overlap.only_source(0b100) == 2  # noqa: PLR2004
+    assert overlap.only_source(0b101) is None
+    assert overlap.only_source(0) is None
+    assert overlap.in_all(0b111)
+    assert not overlap.in_all(0b011)
@@ -1,9 +1,19 @@
+from datetime import date
+from typing import Any
+
 import pytest
 
-from models.participants import Participant, ParticipantType
+from models.participants import (
+    Participant,
+    ParticipantsFilter,
+    ParticipantType,
+)
+from models.telegram_message import TelegramComplexText, TelegramMessage
 from services.parser import (
+    export_participants,
     is_deleted_account,
     merge_participants,
+    parse_messages,
     parse_participants_export,
 )
 
@@ -93,6 +103,60 @@ def test_extracts_mentions_from_text_and_entities_and_dedupes() -> None:
     assert len(result.participants) == 3  # noqa: PLR2004 Magic value used in comparison, consider replacing `3` with a constant variable
 
 
+def test_extracts_mention_names_from_text_entities() -> None:
+    export = {
+        'messages': [
+            {
+                'type': 'message',
+                'from': 'Ivan',
+                'from_id': 'user10',
+                'text': 'hi',
+            },
+            {
+                'type': 'message',
+                'from': 'Writer',
+                'from_id': 'user2',
+                'text': ['hi ', {'type': 'mention_name', 'text': 'Ivan'}],
+                'text_entities': [
+                    {'type': 'plain', 'text': 'hi '},
+                    {'type': 'mention_name', 'text': 'Ivan', 'user_id': 10},
+                    {'type': 'mention', 'text': '@carol'},
+                ],
+            },
+        ]
+    }
+
+    result = parse_participants_export(export)
+    by_key = {p.user_id or p.username: p for p in result.participants}
+
+    # Упоминание по имени и автор объединены по user_id
+    assert set(by_key) == {'user10', 'user2', '@carol'}
+    assert by_key['user10'].full_name == 'Ivan'
+    assert by_key['user10'].seen_as == {
+        ParticipantType.AUTHOR,
+        ParticipantType.MENTION,
+    }
+    assert by_key['@carol'].seen_as == {ParticipantType.MENTION}
+
+
+def test_text_keeps_only_mention_parts() -> None:
+    message = TelegramMessage.model_validate(
+        {
+            'type': 'message',
+            'text': ['hi ', {'type': 'bold', 'text': 'x'}],
+            'text_entities': [
+                {'type': 'plain', 'text': 'hi '},
+                {'type': 'mention', 'text': '@alice'},
+            ],
+        }
+    )
+
+    assert message.text == []
+    assert message.text_entities == [
+        TelegramComplexText(type='mention', text='@alice'),
+    ]
+
+
 def test_extracts_reactors_from_reactions_recent() -> None:
     export = {
         'messages': [
@@ -204,3 +268,81 @@ def test_merges_participants() -> None:
         ParticipantType.MENTION,
     }
     assert by_id['user2'].seen_as == {ParticipantType.AUTHOR}
+
+
+def _filter_export() -> dict[str, Any]:
+    return {
+        'messages': [
+            {
+                'type': 'message',
+                'date': '2024-01-10T12:00:00',
+                'from': 'Old',
+                'from_id': 'user1',
+                'text': '',
+            },
+            {
+                'type': 'message',
+                'date': '2024-02-10T12:00:00',
+                'from': 'New',
+                'from_id': 'user2',
+                'text': '',
+                'text_entities': [{'type': 'mention', 'text': '@mentioned'}],
+                'reactions': [
+                    {'recent': [{'from': 'Reactor', 'from_id': 'user3'}]},
+                ],
+            },
+            {
+                'type': 'service',
+                'date': '2024-02-11T12:00:00',
+                'actor': 'Admin',
+                'actor_id': 'user4',
+                'text': '',
+            },
+        ]
+    }
+
+
+def _filtered_keys(participants_filter: ParticipantsFilter) -> set[str]:
+    messages = parse_messages(
+        _filter_export(),
+        participants_filter=participants_filter,
+    )
+    report = export_participants(
+        messages,
+        participants_filter=participants_filter,
+    )
+    return {p.user_id or p.username or '' for p in report.participants}
+
+
+def test_filter_by_date_window_and_message_type() -> None:
+    assert _filtered_keys(
+        ParticipantsFilter(since=date(2024, 2, 1)),
+    ) == {'user2', '@mentioned', 'user3', 'user4'}
+    assert _filtered_keys(
+        ParticipantsFilter(until=date(2024, 2, 10)),
+    ) == {'user1', 'user2', '@mentioned', 'user3'}
+    assert _filtered_keys(
+        ParticipantsFilter(message_types=frozenset({'service'})),
+    ) == {'user4'}
+
+
+def test_filter_by_roles_skips_unrequested_parts() -> None:
+    participants_filter = ParticipantsFilter(
+        roles=frozenset({ParticipantType.AUTHOR}),
+    )
+
+    messages = parse_messages(
+        _filter_export(),
+        participants_filter=participants_filter,
+    )
+
+    # Упоминания и реакции не разбираются в модели
+    assert all(not msg.text_entities and not msg.reactions for msg in messages)
+    assert _filtered_keys(participants_filter) == {'user1', 'user2'}
+    assert _filtered_keys(
+        ParticipantsFilter(
+            roles=frozenset(
+                {ParticipantType.MENTION, ParticipantType.REACTION}
+            ),
+        ),
+    ) == {'@mentioned', 'user3'}
@@ -0,0 +1,136 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from models.participants import (
+    Participant,
+    ParticipantType,
+    seen_as_from_mask,
+    seen_as_to_mask,
+)
+from scripts.fake_bot_api import FakeBotApi, running_bot
+from services.participant_index import (
+    participant_index_key,
+    ParticipantIndex,
+)
+
+ADMIN_ID = 1
+USER_ID = 2
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> ParticipantIndex:
+    return ParticipantIndex(tmp_path / 'index.sqlite3')
+
+
+def test_seen_as_mask_roundtrip() -> None:
+    seen_as = {ParticipantType.AUTHOR, ParticipantType.CHANNEL}
+
+    assert seen_as_from_mask(seen_as_to_mask(seen_as)) == seen_as
+    assert seen_as_to_mask(set()) == 0
+
+
+@pytest.mark.parametrize(
+    ('query', 'key'),
+    [
+        ('@Alice', 'un:@alice'),
+        ('alice', 'un:@alice'),
+        (' user42 ', 'id:user42'),
+        ('channel7', 'id:channel7'),
+        ('42', 'id:user42'),
+        ('   ', None),
+    ],
+)
+def test_participant_index_key(query: str, key: str | None) -> None:
+    assert participant_index_key(query) == key
+
+
+def test_find_by_user_id_and_username_across_chats(
+    index: ParticipantIndex,
+) -> None:
+    index.ingest(
+        1,
+        'Chat One',
+        [
+            Participant(
+                user_id='user1',
+                full_name='Alice',
+                seen_as={ParticipantType.AUTHOR},
+            ),
+            Participant(username='@Bob', seen_as={ParticipantType.MENTION}),
+        ],
+    )
+    index.ingest(
+        2,
+        'Chat Two',
+        [
+            Participant(user_id='user1', seen_as={ParticipantType.REACTION}),
+        ],
+    )
+
+    by_id = index.find('user1')
+    assert [(p.chat_id, p.chat_title) for p in by_id] == [
+        (1, 'Chat One'),
+        (2, 'Chat Two'),
+    ]
+    assert by_id[0].seen_as == {ParticipantType.AUTHOR}
+    assert by_id[1].seen_as == {ParticipantType.REACTION}
+
+    by_username = index.find('bob')
+    assert [p.chat_id for p in by_username] == [1]
+
+    assert index.find('@nobody') == []
+
+
+def test_reingest_merges_seen_as(index: ParticipantIndex) -> None:
+    index.ingest(
+        1,
+        'Chat',
+        [Participant(user_id='user1', seen_as={ParticipantType.AUTHOR})],
+    )
+    index.ingest(
+        1,
+        None,
+        [Participant(user_id='user1', seen_as={ParticipantType.MENTION})],
+    )
+
+    (posting,) = index.find('user1')
+
+    assert posting.chat_title == 'Chat'
+    assert posting.seen_as == {
+        ParticipantType.AUTHOR,
+        ParticipantType.MENTION,
+    }
+
+
+def test_find_command_is_for_admins_only(index: ParticipantIndex) -> None:
+    index.ingest(
+        -100,
+        'Private Chat',
+        [Participant(user_id='user7', seen_as={ParticipantType.AUTHOR})],
+    )
+
+    async def run() -> tuple[str, str]:
+        async with (
+            FakeBotApi() as api,
+            running_bot(
+                api,
+                participant_index=index,
+                admin_user_ids=frozenset({ADMIN_ID}),
+            ) as running,
+        ):
+            replies = []
+            for chat_id in (USER_ID, ADMIN_ID):
+                after = await api.push_text(chat_id, '/find user7')
+                await running.wait_idle()
+                (reply,) = api.sent_to(chat_id, after=after)
+                replies.append(reply.params['text'])
+            return replies[0], replies[1]
+
+    user, admin = asyncio.run(run())
+
+    # Обычный пользователь не видит чужие чаты из индекса
+    assert user == 'Команда доступна только администраторам'
+    assert 'Private Chat' not in user
+    assert 'Private Chat' in admin
@@ -0,0 +1,303 @@
+import asyncio
+from collections.abc import Callable
+import functools
+import json
+import logging
+from pathlib import Path
+
+import pytest
+
+from models.participants import Participant
+from scripts.fake_bot_api import FakeBotApi, running_bot
+from telegram_bot import bot as bot_module
+from telegram_bot.bot import _escape_markdown_v2
+from telegram_bot.participants_browser import (
+    PageLayout,
+    ParticipantsBrowser,
+    ParticipantsBrowserCache,
+    ParticipantsBrowserStore,
+    SqliteParticipantsBrowserStore,
+)
+
+
+def _participants(count: int) -> list[Participant]:
+    return [Participant(user_id=f'user{i}') for i in range(count)]
+
+
+def _layout(*, page_size: int = 3, max_length: int = 1000) -> PageLayout:
+    return PageLayout(
+        render=lambda p: p.user_id or '',
+        page_size=page_size,
+        max_length=max_length,
+    )
+
+
+def _make_browser(
+    participants: list[Participant],
+    *,
+    page_size: int = 3,
+    max_length: int = 1000,
+) -> ParticipantsBrowser:
+    return ParticipantsBrowser(
+        participants,
+        layout=_layout(page_size=page_size, max_length=max_length),
+    )
+
+
+def test_escape_markdown_v2_escapes_each_special_char_once() -> None:
+    assert _escape_markdown_v2('a_b*c.d!') == 'a\\_b\\*c\\.d\\!'
+    assert _escape_markdown_v2('[x](y)') == '\\[x\\]\\(y\\)'
+    assert _escape_markdown_v2('plain') == 'plain'
+
+
+def test_pages_are_split_by_page_size() -> None:
+    browser = _make_browser(_participants(7))
+
+    pages = [browser.page(i) for i in range(3)]
+
+    assert [(p.start, p.end) for p in pages] == [(0, 3), (3, 6), (6, 7)]
+    assert pages[0].text == 'user0\n\nuser1\n\nuser2'
+    assert not pages[0].has_prev
+    assert pages[0].has_next
+    assert pages[2].has_prev
+    assert not pages[2].has_next
+
+
+def test_pages_are_split_by_text_length() -> None:
+    browser = _make_browser(_participants(4), page_size=10, max_length=12)
+
+    first = browser.page(0)
+
+    assert first.text == 'user0\n\nuser1'
+    assert first.has_next
+
+
+def test_page_index_is_clamped() -> None:
+    browser = _make_browser(_participants(4))
+
+    assert browser.page(-5).index == 0
+    assert browser.page(100).index == 1
+
+
+def test_pages_are_rendered_once() -> None:
+    rendered: list[str] = []
+
+    def render(p: Participant) -> str:
+        rendered.append(p.user_id or '')
+        return p.user_id or ''
+
+    browser = ParticipantsBrowser(
+        _participants(5),
+        layout=PageLayout(render=render, page_size=2, max_length=1000),
+    )
+    browser.page(1)
+    browser.page(0)
+    browser.page(1)
+
+    assert rendered == ['user0', 'user1', 'user2', 'user3']
+
+
+def test_empty_browser_has_single_empty_page() -> None:
+    page = _make_browser([]).page(0)
+
+    assert page.text == ''
+    assert not page.has_next
+
+
+type StoreFactory = Callable[..., ParticipantsBrowserStore]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(
+    request: pytest.FixtureRequest,
+    tmp_path: Path,
+) -> StoreFactory:
+    if request.param == 'memory':
+        return ParticipantsBrowserCache
+    return functools.partial(
+        SqliteParticipantsBrowserStore,
+        tmp_path / 'browsers.sqlite3',
+        layout=_layout(),
+    )
+
+
+def test_store_rejects_stale_result_id_and_evicts_oldest(
+    make_store: StoreFactory,
+) -> None:
+    store = make_store(max_size=2, max_participants=100)
+    first = _make_browser(_participants(1))
+    second = _make_browser(_participants(1))
+
+    old_id = store.put(1, first)
+    new_id = store.put(1, second)
+
+    assert store.page(1, old_id, 0) is None
+    assert store.page(2, new_id, 0) is None
+    assert store.page(1, new_id, 0) == second.page(0)
+
+    store.put(2, first)
+    store.put(3, first)
+
+    assert store.page(1, new_id, 0) is None
+
+
+def test_store_is_limited_by_total_participants(
+    make_store: StoreFactory,
+) -> None:
+    store = make_store(max_size=10, max_participants=5)
+    small_id = store.put(1, _make_browser(_participants(2)))
+    medium_id = store.put(2, _make_browser(_participants(3)))
+    assert store.page(1, small_id, 0) is not None
+
+    # Самый давний результат вытесняется, пока сумма не уложится
+    large = _make_browser(_participants(4))
+    large_id = store.put(3, large)
+    assert store.page(2, medium_id, 0) is None
+    assert store.page(1, small_id, 0) is None
+    assert store.page(3, large_id, 1) == large.page(1)
+
+    # Последний результат остается, даже если превышает лимит один
+    huge = _make_browser(_participants(6))
+    huge_id = store.put(4, huge)
+    assert store.page(3, large_id, 0) is None
+    assert store.page(4, huge_id, 0) == huge.page(0)
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path: Path) -> None:
+    path = tmp_path / 'browsers.sqlite3'
+    built_in = SqliteParticipantsBrowserStore(
+        path, layout=_layout(), max_size=10, max_participants=100
+    )
+    other_worker = SqliteParticipantsBrowserStore(
+        path, layout=_layout(), max_size=10, max_participants=100
+    )
+    browser = _make_browser(_participants(7))
+
+    result_id = built_in.put(1, browser)
+
+    pages = [other_worker.page(1, result_id, i) for i in (-1, 1, 2, 100)]
+    assert pages == [
+        browser.page(0),
+        browser.page(1),
+        browser.page(2),
+        browser.page(2),
+    ]
+    built_in.close()
+    other_worker.close()
+
+
+def test_sqlite_store_renders_pages_on_request(tmp_path: Path) -> None:
+    rendered: list[str] = []
+
+    def render(p: Participant) -> str:
+        rendered.append(p.user_id or '')
+        return p.user_id or ''
+
+    layout = PageLayout(render=render, page_size=2, max_length=1000)
+    path = tmp_path / 'browsers.sqlite3'
+    built_in = SqliteParticipantsBrowserStore(
+        path, layout=layout, max_size=10, max_participants=100
+    )
+    other_worker = SqliteParticipantsBrowserStore(
+        path, layout=layout, max_size=10, max_participants=100
+    )
+
+    result_id = built_in.put(
+        1, ParticipantsBrowser(_participants(7), layout=layout)
+    )
+    assert rendered == []
+
+    page = built_in.page(1, result_id, 1)
+    assert page is not None
+    assert page.text == 'user2\n\nuser3'
+    assert rendered == ['user0', 'user1', 'user2', 'user3']
+
+    # Граница второй страницы уже известна, первая не рендерится заново
+    rendered.clear()
+    assert other_worker.page(1, result_id, 2) is not None
+    assert rendered == ['user2', 'user3', 'user4', 'user5']
+    built_in.close()
+    other_worker.close()
+
+
+def _export(participants: int) -> bytes:
+    messages = [
+        {
+            'id': i,
+            'type': 'message',
+            'date': '2024-01-15T12:00:00',
+            'from': f'User {i}',
+            'from_id': f'user{i}',
+            'text': '',
+        }
+        for i in range(participants)
+    ]
+    return json.dumps({'id': 1, 'messages': messages}).encode()
+
+
+def test_double_tap_on_page_button_is_answered(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    async def run() -> list[str]:
+        async with FakeBotApi() as api, running_bot(api) as running:
+            api.add_file('export', _export(120))
+            await api.push_document(1, file_id='export', file_name='e.json')
+            await running.wait_idle()
+            after = await api.push_text(1, '/done')
+            await running.wait_idle()
+            first_page = api.sent_to(1, after=after)[0]
+            keyboard = json.loads(first_page.params['reply_markup'])
+            (next_button,) = keyboard['inline_keyboard'][0]
+
+            for _ in range(2):
+                await api.push_callback(
+                    1,
+                    message=first_page,
+                    data=next_button['callback_data'],
+                )
+            await running.wait_idle()
+            return [r.method for r in api.sent if r.sent_at >= after][-3:]
+
+    with caplog.at_level(logging.ERROR):
+        methods = asyncio.run(run())
+
+    # Второе нажатие не меняет сообщение и не считается ошибкой
+    assert methods == [
+        'editMessageText',
+        'answerCallbackQuery',
+        'answerCallbackQuery',
+    ]
+    assert not caplog.records
+
+
+def test_multi_page_result_is_browsed_without_file() -> None:
+    async def run() -> list[str]:
+        async with FakeBotApi() as api, running_bot(api) as running:
+            api.add_file('export', _export(120))
+            await api.push_document(1, file_id='export', file_name='e.json')
+            await running.wait_idle()
+            after = await api.push_text(1, '/done')
+            await running.wait_idle()
+            return [r.method for r in api.sent_to(1, after=after)]
+
+    methods = asyncio.run(run())
+
+    assert 'sendMessage' in methods
+    assert 'sendDocument' not in methods
+
+
+def test_large_result_is_sent_as_file_without_browser(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(bot_module, 'PARTICIPANTS_BROWSER_MAX_PARTICIPANTS', 5)
+
+    async def run() -> list[str]:
+        async with FakeBotApi() as api, running_bot(api) as running:
+            api.add_file('export', _export(10))
+            await api.push_document(1, file_id='export', file_name='e.json')
+            await running.wait_idle()
+            after = await api.push_text(1, '/done')
+            await running.wait_idle()
+            return [r.method for r in api.sent_to(1, after=after)]
+
+    assert asyncio.run(run()) == ['sendMessage', 'sendDocument']
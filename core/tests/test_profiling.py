@@ -0,0 +1,149 @@
+import asyncio
+from pathlib import Path
+import pstats
+import random
+
+import pytest
+
+from infra.profiling import JobProfiler, ProfilerBusyError
+from scripts.fake_bot_api import (
+    build_export,
+    FakeBotApi,
+    running_bot,
+    RunningBot,
+)
+
+ADMIN_ID = 1
+USER_ID = 2
+
+
+def _busy_work() -> int:
+    return sum(i * i for i in range(200_000))
+
+
+def test_job_profiler_produces_pstats_and_collapsed_stacks(
+    tmp_path: Path,
+) -> None:
+    profiler = JobProfiler(sample_interval=0.001)
+    profiler.start()
+    asyncio.run(profiler.run(_busy_work))
+    profile = profiler.stop()
+
+    stats_path = tmp_path / 'job.pstats'
+    stats_path.write_bytes(profile.pstats)
+    stats = pstats.Stats(str(stats_path)).get_stats_profile()
+    assert '_busy_work' in stats.func_profiles
+
+    assert profile.samples > 0
+    lines = profile.collapsed.decode().splitlines()
+    assert any('_busy_work' in line for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def _other_work() -> int:
+    return sum(i * i for i in range(200_000))
+
+
+def _loop_work() -> int:
+    return sum(i * i for i in range(200_000))
+
+
+def test_job_profiler_samples_only_the_job_thread(tmp_path: Path) -> None:
+    profiler = JobProfiler(sample_interval=0.001)
+
+    async def run() -> None:
+        profiler.start()
+        # Чужая работа в других потоках идет параллельно обработке
+        await asyncio.gather(
+            profiler.run(_busy_work),
+            asyncio.to_thread(_other_work),
+        )
+        # между вызовами run cProfile выключен
+        _loop_work()
+
+    asyncio.run(run())
+    profile = profiler.stop()
+
+    assert profile.samples > 0
+    assert b'_busy_work' in profile.collapsed
+    assert b'_other_work' not in profile.collapsed
+
+    stats_path = tmp_path / 'job.pstats'
+    stats_path.write_bytes(profile.pstats)
+    stats = pstats.Stats(str(stats_path)).get_stats_profile()
+    assert '_busy_work' in stats.func_profiles
+    assert '_loop_work' not in stats.func_profiles
+
+
+def test_only_one_job_is_profiled_at_a_time() -> None:
+    profiler = JobProfiler()
+    profiler.start()
+    try:
+        with pytest.raises(ProfilerBusyError):
+            JobProfiler().start()
+    finally:
+        profiler.stop()
+
+    # После остановки профилировщик снова свободен
+    profiler = JobProfiler()
+    profiler.start()
+    profiler.stop()
+
+
+async def _run_session(
+    running: RunningBot,
+    chat_id: int,
+) -> list[tuple[str, str | None]]:
+    api = running.api
+    await api.push_text(chat_id, '/profile')
+    await api.push_text(chat_id, '/start')
+    await api.push_document(chat_id, file_id='export', file_name='export.json')
+    await running.wait_idle()
+
+    done_at = await api.push_text(chat_id, '/done')
+    await running.wait_idle()
+    return [
+        (r.method, r.params.get('document'))
+        for r in api.sent_to(chat_id, after=done_at)
+    ]
+
+
+def test_profile_command_profiles_next_done_for_admins_only() -> None:
+    async def run() -> tuple[
+        list[tuple[str, str | None]],
+        list[tuple[str, str | None]],
+        list[str],
+    ]:
+        async with FakeBotApi() as api:
+            api.add_file(
+                'export',
+                build_export(
+                    participants=10,
+                    messages=50,
+                    rng=random.Random(0),
+                ),
+            )
+            async with running_bot(
+                api,
+                admin_user_ids=frozenset({ADMIN_ID}),
+            ) as running:
+                admin = await _run_session(running, ADMIN_ID)
+                user = await _run_session(running, USER_ID)
+            refusal = [
+                r.params['text']
+                for r in api.sent_to(USER_ID)
+                if r.method == 'sendMessage'
+            ]
+            return admin, user, refusal
+
+    admin, user, refusal = asyncio.run(run())
+
+    # Результат, затем pstats и свернутые стеки. Стеков может не быть:
+    # короткая обработка успевает пройти между снимками
+    (result, stats, *stacks) = admin
+    assert result == ('sendMessage', None)
+    assert stats[0] == 'sendDocument'
+    assert (stats[1] or '').endswith('.pstats')
+    assert all((name or '').endswith('.collapsed.txt') for _, name in stacks)
+    assert user == [('sendMessage', None)]
+    assert refusal[0] == 'Команда доступна только администраторам'
@@ -0,0 +1,204 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+import io
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+import pytest
+
+from scripts.fake_bot_api import FAKE_BOT_TOKEN, FakeBotApi
+from telegram_bot.bot import FileObjectInputFile, provide_bot
+from telegram_bot.sender import OutboundSender, SendPriority
+
+
+def _recorder(
+    sent: list[str],
+    text: str,
+) -> Callable[[], Awaitable[str]]:
+    async def call() -> str:
+        sent.append(text)
+        return text
+
+    return call
+
+
+def _fast_sender(**kwargs: float) -> OutboundSender:
+    return OutboundSender(
+        global_rate=kwargs.get('global_rate', 1000),
+        chat_interval=kwargs.get('chat_interval', 0),
+    )
+
+
+def test_results_go_before_replies_and_acknowledgements() -> None:
+    sent: list[str] = []
+
+    async def run() -> None:
+        sender = _fast_sender()
+        await sender.start()
+        await asyncio.gather(
+            sender.send(1, _recorder(sent, 'ack'), priority=SendPriority.ACK),
+            sender.send(1, _recorder(sent, 'reply')),
+            sender.send(
+                1,
+                _recorder(sent, 'result'),
+                priority=SendPriority.RESULT,
+            ),
+        )
+        await sender.stop()
+
+    asyncio.run(run())
+
+    assert sent == ['result', 'reply', 'ack']
+
+
+def test_pending_acknowledgements_are_coalesced() -> None:
+    sent: list[str] = []
+
+    async def run() -> list[str | None]:
+        sender = _fast_sender()
+        await sender.start()
+        results = await asyncio.gather(
+            *(
+                sender.send(
+                    1,
+                    _recorder(sent, f'ack {i}'),
+                    priority=SendPriority.ACK,
+                    coalesce_key='ack',
+                )
+                for i in range(3)
+            )
+        )
+        await sender.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert sent == ['ack 2']
+    assert results == [None, None, 'ack 2']
+
+
+def test_chat_interval_paces_one_chat_but_not_others() -> None:
+    sent_at: dict[str, float] = {}
+
+    def stamp(text: str) -> Callable[[], Awaitable[None]]:
+        async def call() -> None:
+            sent_at[text] = time.monotonic()
+
+        return call
+
+    async def run() -> None:
+        sender = _fast_sender(chat_interval=0.2)
+        await sender.start()
+        await asyncio.gather(
+            sender.send(1, stamp('first')),
+            sender.send(1, stamp('second')),
+            sender.send(2, stamp('other chat')),
+        )
+        await sender.stop()
+
+    asyncio.run(run())
+
+    assert sent_at['second'] - sent_at['first'] >= 0.2  # noqa: PLR2004
+    assert sent_at['other chat'] - sent_at['first'] < 0.2  # noqa: PLR2004
+
+
+def test_stop_cancels_send_in_flight() -> None:
+    async def hanging() -> None:
+        await asyncio.Event().wait()
+
+    async def run() -> None:
+        sender = _fast_sender()
+        await sender.start()
+        pending = asyncio.create_task(sender.send(1, hanging))
+        await asyncio.sleep(0.05)
+        await sender.stop()
+        async with asyncio.timeout(1):
+            await pending
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run())
+
+
+def test_gives_up_after_max_retries() -> None:
+    attempts = 0
+
+    async def flooded() -> None:
+        nonlocal attempts
+        attempts += 1
+        raise TelegramRetryAfter(
+            method=SendMessage(chat_id=1, text='x'),
+            message='Too Many Requests',
+            retry_after=0,
+        )
+
+    async def run() -> None:
+        sender = OutboundSender(chat_interval=0, max_retries=2)
+        await sender.start()
+        try:
+            await sender.send(1, flooded)
+        finally:
+            await sender.stop()
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(run())
+    assert attempts == 3  # noqa: PLR2004
+
+
+def test_retries_after_flood_control_from_bot_api() -> None:
+    async def run() -> tuple[FakeBotApi, float]:
+        async with FakeBotApi() as api:
+            api.inject_retry_after('sendMessage', times=1, retry_after=1)
+            bot = provide_bot(FAKE_BOT_TOKEN, api_url=api.base_url)
+            sender = _fast_sender()
+            await sender.start()
+
+            started_at = time.monotonic()
+            message = await sender.send(
+                7,
+                lambda: bot.send_message(7, 'hello'),
+            )
+            elapsed = time.monotonic() - started_at
+
+            await sender.stop()
+            await bot.session.close()
+            assert message is not None
+            return api, elapsed
+
+    api, elapsed = asyncio.run(run())
+
+    assert api.flood_errors == 1
+    assert [(r.method, r.params['text']) for r in api.sent] == [
+        ('sendMessage', 'hello'),
+    ]
+    assert elapsed >= 1
+
+
+def test_document_is_uploaded_in_full_after_flood_control() -> None:
+    content = b'x' * 5000
+
+    async def run() -> FakeBotApi:
+        async with FakeBotApi() as api:
+            api.inject_retry_after('sendDocument', times=1, retry_after=1)
+            bot = provide_bot(FAKE_BOT_TOKEN, api_url=api.base_url)
+            sender = _fast_sender()
+            await sender.start()
+
+            document = FileObjectInputFile(
+                io.BytesIO(content),
+                filename='export.csv',
+                chunk_size=1024,
+            )
+            await sender.send(7, lambda: bot.send_document(7, document))
+
+            await sender.stop()
+            await bot.session.close()
+            return api
+
+    api = asyncio.run(run())
+
+    assert api.flood_errors == 1
+    # Повтор загружает файл целиком, не пустой остаток после 429
+    assert [(r.method, r.file_size) for r in api.sent] == [
+        ('sendDocument', len(content)),
+    ]
@@ -0,0 +1,226 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import csv
+from datetime import datetime
+import gzip
+from multiprocessing.context import BaseContext
+from pathlib import Path
+import random
+import re
+import zipfile
+
+from openpyxl import load_workbook
+import pytest
+
+from models.participants import Participant
+from scripts.fake_bot_api import build_export, FakeBotApi, running_bot
+from services import shards as shards_module
+from services.shards import (
+    ExportFormat,
+    iter_shards,
+    pack_shards,
+    write_shards,
+)
+from telegram_bot import bot as bot_module
+
+EXPORTED_AT = datetime(2024, 1, 1)
+
+
+def _participants(count: int, *, sources: int = 1) -> list[Participant]:
+    return [
+        Participant(
+            user_id=f'user{i}',
+            username=f'user{i}',
+            full_name=f'User {i}',
+            sources=sources,
+        )
+        for i in range(count)
+    ]
+
+
+def test_shards_are_cut_by_rows_and_by_size() -> None:
+    by_rows = list(
+        iter_shards(_participants(7), max_rows=3, max_bytes=1 << 20),
+    )
+    assert [len(shard) for shard in by_rows] == [3, 3, 1]
+
+    # Строка занимает около 20 байт, в часть помещаются две
+    by_size = list(iter_shards(_participants(5), max_rows=100, max_bytes=40))
+    assert [len(shard) for shard in by_size] == [2, 2, 1]
+
+
+def test_xlsx_shards_keep_rows_in_order_and_overlap_summary(
+    tmp_path: Path,
+) -> None:
+    participants = [
+        *_participants(3, sources=0b11),
+        *_participants(2, sources=0b01),
+    ]
+
+    paths = write_shards(
+        iter_shards(participants, max_rows=2, max_bytes=1 << 20),
+        tmp_path,
+        basename='participants',
+        export_format=ExportFormat.XLSX,
+        exported_at=EXPORTED_AT,
+        source_names=['a.json', 'b.json'],
+        max_workers=2,
+    )
+
+    assert [p.name for p in paths] == [
+        'participants_part1.xlsx',
+        'participants_part2.xlsx',
+        'participants_part3.xlsx',
+        'participants_overlap.xlsx',
+    ]
+    usernames = []
+    for path in paths[:-1]:
+        workbook = load_workbook(path)
+        assert 'Пересечения' not in workbook.sheetnames
+        rows = list(workbook['Sheet1'].iter_rows(min_row=3, values_only=True))
+        usernames += [row[0] for row in rows]
+    assert usernames == [p.username and f'@{p.username}' for p in participants]
+
+    summary = load_workbook(paths[-1])['Пересечения']
+    in_all_label, in_all_count, *_ = next(summary.iter_rows(values_only=True))
+    assert in_all_label == 'Во всех чатах'  # noqa: RUF001
+    assert in_all_count == 3  # noqa: PLR2004
+
+
+def test_concurrent_exports_share_one_process_pool(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    created: list[ProcessPoolExecutor] = []
+
+    class CountingPool(ProcessPoolExecutor):
+        def __init__(
+            self, *, max_workers: int, mp_context: BaseContext
+        ) -> None:
+            super().__init__(max_workers=max_workers, mp_context=mp_context)
+            created.append(self)
+
+    monkeypatch.setattr(shards_module, 'ProcessPoolExecutor', CountingPool)
+    monkeypatch.setattr(
+        shards_module, '_shard_pool', shards_module._ShardPool()
+    )
+
+    def export(number: int) -> list[Path]:
+        directory = tmp_path / str(number)
+        directory.mkdir()
+        return write_shards(
+            iter_shards(_participants(6), max_rows=2, max_bytes=1 << 20),
+            directory,
+            basename='participants',
+            export_format=ExportFormat.CSV_GZ,
+            exported_at=EXPORTED_AT,
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=4) as threads:
+            results = list(threads.map(export, range(4)))
+    finally:
+        for pool in created:
+            pool.shutdown()
+
+    # Одновременные выгрузки не запускают по пулу процессов каждая
+    assert len(created) == 1
+    assert all(len(paths) == 3 for paths in results)  # noqa: PLR2004
+
+
+def test_csv_gz_shards_and_archive(tmp_path: Path) -> None:
+    paths = write_shards(
+        iter_shards(_participants(3), max_rows=2, max_bytes=1 << 20),
+        tmp_path,
+        basename='participants',
+        export_format=ExportFormat.CSV_GZ,
+        exported_at=EXPORTED_AT,
+        source_names=['a.json', 'b.json'],
+        max_workers=1,
+    )
+
+    # Сводка по пересечениям есть только в xlsx
+    assert [p.name for p in paths] == [
+        'participants_part1.csv.gz',
+        'participants_part2.csv.gz',
+    ]
+    with gzip.open(paths[1], 'rt', encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['Дата экспорта', '2024-01-01']
+    assert rows[2][:2] == ['@user2', 'User 2']
+
+    archive_path = tmp_path / 'participants.zip'
+    assert pack_shards(paths, archive_path) == archive_path.stat().st_size
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.namelist() == [p.name for p in paths]
+
+
+async def _done_with_args(api: FakeBotApi, args: str) -> list[str]:
+    async with running_bot(api) as running:
+        await api.push_text(1, '/start')
+        await api.push_document(1, file_id='export', file_name='export.json')
+        await running.wait_idle()
+        after = await api.push_text(1, f'/done {args}')
+        await running.wait_idle()
+
+    names = [
+        r.params['document']
+        for r in api.sent_to(1, after=after)
+        if r.method == 'sendDocument'
+    ]
+    # Дата в имени файла зависит от дня запуска
+    return [re.sub(r'_\d{4}-\d{2}-\d{2}', '', name) for name in names]
+
+
+@pytest.mark.parametrize(
+    ('max_upload_size', 'expected'),
+    [
+        (50 * 1024 * 1024, ['participants.zip']),
+        (
+            1,
+            [
+                'participants_part1.csv.gz',
+                'participants_part2.csv.gz',
+                'participants_part3.csv.gz',
+            ],
+        ),
+    ],
+)
+def test_done_sends_large_export_as_archive_or_separate_files(
+    monkeypatch: pytest.MonkeyPatch,
+    max_upload_size: int,
+    expected: list[str],
+) -> None:
+    monkeypatch.setattr(bot_module, 'EXPORT_SHARD_MAX_ROWS', 10)
+    monkeypatch.setattr(
+        bot_module,
+        'PUBLIC_API_MAX_UPLOAD_SIZE',
+        max_upload_size,
+    )
+
+    async def run() -> list[str]:
+        async with FakeBotApi() as api:
+            api.add_file(
+                'export',
+                build_export(
+                    participants=15,
+                    messages=200,
+                    rng=random.Random(0),
+                ),
+            )
+            return await _done_with_args(api, 'csv')
+
+    assert asyncio.run(run()) == expected
+
+
+def test_done_rejects_unknown_format() -> None:
+    async def run() -> str:
+        async with FakeBotApi() as api, running_bot(api) as running:
+            await api.push_text(1, '/start')
+            await running.wait_idle()
+            after = await api.push_text(1, '/done pdf')
+            await running.wait_idle()
+            (reply,) = api.sent_to(1, after=after)
+            return reply.params['text']
+
+    assert asyncio.run(run()).startswith('Неизвестный формат: pdf')
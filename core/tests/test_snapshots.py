@@ -0,0 +1,196 @@
+import asyncio
+import csv
+from datetime import datetime, timedelta
+import gzip
+import io
+import json
+from pathlib import Path
+import random
+
+from models.participants import Participant, ParticipantType
+from scripts.fake_bot_api import FakeBotApi, running_bot
+from services.snapshots import (
+    ChangeKind,
+    diff_snapshots,
+    read_snapshot,
+    snapshot_chat_key,
+    SnapshotStore,
+    write_diff_csv,
+    write_snapshot,
+)
+
+TAKEN_AT = datetime(2024, 3, 1, 12, 0)
+PARTICIPANTS = 500
+
+
+def _participant(
+    user_id: str,
+    *,
+    full_name: str | None = None,
+    seen_as: ParticipantType = ParticipantType.AUTHOR,
+) -> Participant:
+    return Participant(
+        user_id=user_id,
+        full_name=full_name or user_id.title(),
+        seen_as={seen_as},
+    )
+
+
+def test_snapshot_is_sorted_and_external_sort_matches(tmp_path: Path) -> None:
+    rng = random.Random(1)
+    participants = [_participant(f'user{i}') for i in range(PARTICIPANTS)]
+    rng.shuffle(participants)
+    # Повтор ключа дает одну запись, роли объединяются
+    participants.append(
+        _participant('user7', seen_as=ParticipantType.REACTION),
+    )
+
+    in_memory = tmp_path / 'memory.jsonl.gz'
+    external = tmp_path / 'external.jsonl.gz'
+    assert write_snapshot(participants, in_memory) == PARTICIPANTS
+    assert write_snapshot(participants, external, run_size=37) == PARTICIPANTS
+
+    assert gzip.decompress(in_memory.read_bytes()) == gzip.decompress(
+        external.read_bytes()
+    )
+    entries = list(read_snapshot(in_memory))
+    assert [e.key for e in entries] == sorted(e.key for e in entries)
+    (user7,) = (e for e in entries if e.user_id == 'user7')
+    assert user7.to_participant().seen_as == {
+        ParticipantType.AUTHOR,
+        ParticipantType.REACTION,
+    }
+    # Временные файлы сортировки удаляются
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'external.jsonl.gz',
+        'memory.jsonl.gz',
+    ]
+
+
+def test_diff_snapshots_finds_added_removed_and_changed(
+    tmp_path: Path,
+) -> None:
+    old, new = tmp_path / 'old.jsonl.gz', tmp_path / 'new.jsonl.gz'
+    write_snapshot(
+        [
+            _participant('user1'),
+            _participant('user2'),
+            _participant('user3'),
+        ],
+        old,
+    )
+    write_snapshot(
+        [
+            _participant('user4'),
+            _participant('user2', full_name='Renamed'),
+            _participant('user3'),
+        ],
+        new,
+    )
+
+    changes = [
+        (c.kind, c.new.user_id if c.new else c.old and c.old.user_id)
+        for c in diff_snapshots(old, new)
+    ]
+
+    assert changes == [
+        (ChangeKind.REMOVED, 'user1'),
+        (ChangeKind.CHANGED, 'user2'),
+        (ChangeKind.ADDED, 'user4'),
+    ]
+
+
+def test_diff_csv_has_all_changes_and_summary_sample(tmp_path: Path) -> None:
+    old, new = tmp_path / 'old.jsonl.gz', tmp_path / 'new.jsonl.gz'
+    write_snapshot([_participant(f'user{i}') for i in range(10)], old)
+    write_snapshot([_participant(f'user{i}') for i in range(5, 20)], new)
+
+    diff_file = io.BytesIO()
+    summary = write_diff_csv(
+        diff_snapshots(old, new),
+        diff_file,
+        sample_size=3,
+    )
+
+    assert (summary.added, summary.removed, summary.changed) == (10, 5, 0)
+    assert len(summary.sample) == 3  # noqa: PLR2004
+    rows = list(csv.reader(io.StringIO(diff_file.getvalue().decode())))
+    assert len(rows) == 1 + summary.total
+    assert rows[1][0] in {ChangeKind.ADDED, ChangeKind.REMOVED}
+
+
+def test_store_keeps_last_snapshots_per_chat(tmp_path: Path) -> None:
+    store = SnapshotStore(tmp_path, keep=2)
+    chat_key = snapshot_chat_key([-100, -100, 5])
+    assert chat_key == '-100+5'
+
+    for hours in range(3):
+        store.save(
+            1,
+            chat_key,
+            [_participant(f'user{hours}')],
+            taken_at=TAKEN_AT + timedelta(hours=hours),
+        )
+    store.save(1, '7', [_participant('user9')], taken_at=TAKEN_AT)
+
+    snapshots = store.snapshots(1, chat_key)
+    assert len(snapshots) == 2  # noqa: PLR2004
+    assert store.latest_pair(1, chat_key) == (snapshots[0], snapshots[1])
+    assert store.latest_pair(1, '7') is None
+    assert store.latest_chat_key(1) == chat_key
+    # Снимки одного пользователя не видны другому
+    assert store.latest_chat_key(2) is None
+
+
+def _export(user_ids: list[int]) -> bytes:
+    messages = [
+        {
+            'id': i,
+            'type': 'message',
+            'date': '2024-01-15T12:00:00',
+            'from': f'User {user_id}',
+            'from_id': f'user{user_id}',
+            'text': '',
+        }
+        for i, user_id in enumerate(user_ids, start=1)
+    ]
+    return json.dumps({'id': 42, 'messages': messages}).encode()
+
+
+def test_diff_command_compares_last_two_runs(tmp_path: Path) -> None:
+    async def run() -> tuple[list[str], str]:
+        async with (
+            FakeBotApi() as api,
+            running_bot(
+                api, snapshot_store=SnapshotStore(tmp_path)
+            ) as running,
+        ):
+            api.add_file('first', _export([1, 2, 3]))
+            api.add_file('second', _export([2, 3, 4, 5]))
+            replies: list[str] = []
+            for file_id in ('first', 'second'):
+                await api.push_document(
+                    1,
+                    file_id=file_id,
+                    file_name='result.json',
+                )
+                await running.wait_idle()
+                after = await api.push_text(1, '/done')
+                await running.wait_idle()
+                replies.extend(
+                    r.params['text'] for r in api.sent_to(1, after=after)
+                )
+
+            after = await api.push_text(1, '/diff')
+            await running.wait_idle()
+            (diff,) = api.sent_to(1, after=after)
+            return replies, diff.params['text']
+
+    replies, diff = asyncio.run(run())
+
+    # Подсказку про /diff присылает только вторая обработка, перед
+    # результатом
+    assert ['/diff' in reply for reply in replies] == [False, True, False]
+    assert 'новые: 2, ушли: 1, изменились: 0' in diff
+    assert 'User 4' in diff
+    assert 'User 1' in diff
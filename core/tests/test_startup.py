@@ -0,0 +1,26 @@
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+CORE_DIR = Path(__file__).resolve().parent.parent
+
+PROBE = (
+    'import json, sys; import entrypoints.telegram_bot; '
+    'print(json.dumps(sorted(m for m in sys.modules '
+    "if m.split('.')[0] in {'pandas', 'numpy', 'openpyxl'})))"
+)
+
+
+def test_bot_entrypoint_does_not_import_heavy_modules() -> None:
+    # pandas, numpy и openpyxl добавляют к холодному старту сотни
+    # миллисекунд и десятки мегабайт RSS, выгрузка грузит их сама
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=CORE_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    assert json.loads(result.stdout) == []
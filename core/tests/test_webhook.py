@@ -0,0 +1,230 @@
+import asyncio
+from pathlib import Path
+import signal
+import subprocess
+import sys
+import time
+from typing import Any
+import urllib.request
+
+from aiogram import Bot
+from aiogram.fsm.storage.base import StorageKey
+from aiohttp.test_utils import TestClient, TestServer
+from pydantic import ValidationError
+import pytest
+
+from infra.fsm_storage import DataUpdate, SqliteStorage
+from infra.settings import BotMode, Settings
+from telegram_bot.bot import provide_dispatcher, UploadState
+from telegram_bot.webhook import build_webhook_app, HEALTH_PATH
+
+CORE_DIR = Path(__file__).resolve().parent.parent
+WEBHOOK_PATH = '/webhook'
+SECRET = 'test-secret'
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Обновление без подходящего хендлера: бот не ходит в Bot API
+RECORDED_UPDATE: dict[str, Any] = {
+    'update_id': 1,
+    'message': {
+        'message_id': 10,
+        'date': 1700000000,
+        'chat': {'id': 100, 'type': 'private'},
+        'from': {'id': 100, 'is_bot': False, 'first_name': 'Alice'},
+        'text': 'hello',
+    },
+}
+
+
+# Супервизор воркеров на свободном порту: печатает порт и ждет сигнала
+WORKERS_SCRIPT = f"""
+import socket
+from aiogram import Bot
+from telegram_bot.bot import provide_dispatcher
+from telegram_bot.webhook import _run_workers
+
+sock = socket.create_server(('127.0.0.1', 0))
+print(sock.getsockname()[1], flush=True)
+_run_workers(
+    sock,
+    Bot(token='42:TEST'),
+    provide_dispatcher(),
+    path='{WEBHOOK_PATH}',
+    secret_token='{SECRET}',
+    workers=2,
+)
+"""
+
+
+async def _post_update(
+    *,
+    secret: str | None,
+) -> tuple[int, int]:
+    bot = Bot(token='42:TEST')
+    app = build_webhook_app(
+        bot,
+        provide_dispatcher(),
+        path=WEBHOOK_PATH,
+        secret_token=SECRET,
+    )
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+
+    async with TestClient(TestServer(app)) as client:
+        health = await client.get(HEALTH_PATH)
+        response = await client.post(
+            WEBHOOK_PATH,
+            json=RECORDED_UPDATE,
+            headers=headers,
+        )
+        return health.status, response.status
+
+
+def test_webhook_accepts_update_with_secret() -> None:
+    health_status, status = asyncio.run(_post_update(secret=SECRET))
+
+    assert health_status == 200  # noqa: PLR2004
+    assert status == 200  # noqa: PLR2004
+
+
+def test_webhook_rejects_wrong_or_missing_secret() -> None:
+    _, wrong_status = asyncio.run(_post_update(secret='wrong'))
+    _, missing_status = asyncio.run(_post_update(secret=None))
+
+    assert wrong_status == 401  # noqa: PLR2004
+    assert missing_status == 401  # noqa: PLR2004
+
+
+def test_sqlite_storage_is_shared_between_instances(tmp_path: Path) -> None:
+    key = StorageKey(bot_id=42, chat_id=100, user_id=100)
+    db_path = tmp_path / 'fsm.sqlite3'
+
+    async def scenario() -> tuple[str | None, dict[str, Any]]:
+        writer = SqliteStorage(db_path)
+        await writer.set_state(key, UploadState.collecting)
+        await writer.update_data(key, {'files': [{'file_id': 'a'}]})
+        await writer.close()
+
+        reader = SqliteStorage(db_path)
+        state = await reader.get_state(key)
+        data = await reader.get_data(key)
+        await reader.close()
+        return state, data
+
+    state, data = asyncio.run(scenario())
+
+    assert state == UploadState.collecting.state
+    assert data == {'files': [{'file_id': 'a'}]}
+
+
+def test_sqlite_storage_modify_data_keeps_concurrent_appends(
+    tmp_path: Path,
+) -> None:
+    key = StorageKey(bot_id=42, chat_id=100, user_id=100)
+    appends = 20
+
+    def add_file(name: str) -> DataUpdate:
+        return lambda data: {**data, 'files': [*data.get('files', []), name]}
+
+    async def append(storage: SqliteStorage, worker: int) -> None:
+        for i in range(appends):
+            await storage.modify_data(key, add_file(f'{worker}-{i}'))
+
+    async def run() -> list[str]:
+        # Отдельное соединение на каждый воркер
+        storages = [SqliteStorage(tmp_path / 'fsm.sqlite3') for _ in range(4)]
+        await asyncio.gather(
+            *(append(storage, n) for n, storage in enumerate(storages))
+        )
+        files: list[str] = (await storages[0].get_data(key))['files']
+        for storage in storages:
+            await storage.close()
+        return files
+
+    files = asyncio.run(run())
+
+    # Ни одно дополнение не затерто параллельной записью
+    assert sorted(files) == sorted(
+        f'{worker}-{i}' for worker in range(4) for i in range(appends)
+    )
+
+
+@pytest.mark.parametrize('secret', [None, '', 'секрет', 'a' * 257])
+def test_webhook_mode_requires_valid_secret(secret: str | None) -> None:
+    with pytest.raises(ValidationError, match='WEBHOOK_SECRET'):
+        Settings(
+            _env_file=None,
+            TELEGRAM_BOT_TOKEN='token',
+            BOT_MODE=BotMode.WEBHOOK,
+            WEBHOOK_BASE_URL='https://bot.example.com',
+            WEBHOOK_SECRET=secret,
+        )
+
+
+def test_webhook_settings_with_secret() -> None:
+    settings = Settings(
+        _env_file=None,
+        TELEGRAM_BOT_TOKEN='token',
+        BOT_MODE=BotMode.WEBHOOK,
+        WEBHOOK_BASE_URL='https://bot.example.com/',
+        WEBHOOK_SECRET=SECRET,
+    )
+
+    assert settings.webhook_url == f'https://bot.example.com{WEBHOOK_PATH}'
+    assert settings.webhook_secret == SECRET
+
+
+def _children(pid: int) -> list[int]:
+    children = Path(f'/proc/{pid}/task/{pid}/children').read_text()
+    return [int(child) for child in children.split()]
+
+
+def _get_health(port: int) -> int:
+    # Без keep-alive каждый запрос - новое соединение, ядро раздает их
+    # воркерам
+    url = f'http://127.0.0.1:{port}{HEALTH_PATH}'
+    with urllib.request.urlopen(url, timeout=5) as response:
+        status: int = response.status
+        return status
+
+
+def _wait_health(port: int, *, timeout: float) -> int:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return _get_health(port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+@pytest.mark.skipif(
+    not Path('/proc/self/task').is_dir(),
+    reason='worker processes are listed through /proc',
+)
+def test_webhook_workers_serve_health_and_stop_on_signal() -> None:
+    supervisor = subprocess.Popen(
+        [sys.executable, '-c', WORKERS_SCRIPT],
+        cwd=CORE_DIR,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert supervisor.stdout is not None
+        port = int(supervisor.stdout.readline())
+
+        assert _wait_health(port, timeout=30) == 200  # noqa: PLR2004
+        assert [_get_health(port) for _ in range(4)] == [200] * 4
+        workers = _children(supervisor.pid)
+        assert len(workers) == 2  # noqa: PLR2004
+
+        supervisor.send_signal(signal.SIGTERM)
+        assert supervisor.wait(timeout=30) == 0
+    finally:
+        supervisor.kill()
+        supervisor.wait()
+
+    # Воркеры остановлены, сокет больше никто не слушает
+    assert not any(Path(f'/proc/{pid}').exists() for pid in workers)
+    with pytest.raises(OSError):
+        _get_health(port)